@@ -5,10 +5,12 @@ from fastapi.templating import Jinja2Templates
 from starlette.status import HTTP_303_SEE_OTHER
 
 from auth.servise import LoginIn
+from static_assets import static_url
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
 
 templates = Jinja2Templates(directory="frontend/templates")
+templates.env.globals["static_url"] = static_url
 
 
 @router.get("/login")
@@ -0,0 +1,39 @@
+"""Нагрузочные бенчмарки API дашборда.
+
+Нужен отдельный Postgres для бенчмарков (база с "bench" в имени):
+
+    python -m bench.run --database-url \\
+        postgresql+asyncpg://user@127.0.0.1/dashboard_bench \\
+        --reset --users 100000 --links 150000 -o bench/results/head.json
+
+    python -m bench.compare bench/results/base.json bench/results/head.json
+
+--reset пересоздаёт схему и заливает данные; без него используется то,
+что уже лежит в базе. --schema-revision позволяет замерить схему без
+части миграций (например 0001_initial — без индексов).
+
+Накладные расходы метрик (middleware и хуки SQL): тот же прогон
+с --metrics off и --metrics on, порог — несколько процентов:
+
+    python -m bench.run ... --read-only --metrics off -o off.json
+    python -m bench.run ... --read-only --metrics on -o on.json
+    python -m bench.compare off.json on.json --threshold 3
+
+На общей машине сквозной прогон шумит сильнее порога; те же расходы
+по частям, в одном процессе (код выхода 1 выше --max-percent):
+
+    python -m bench.metrics_overhead --database-url ...
+
+CPU на сериализацию страницы ссылок (ORM против колонок + orjson):
+
+    python -m bench.serialization --database-url ...
+
+Накладные расходы на построение и подготовку горячих запросов:
+
+    python -m bench.statements --database-url ...
+
+Пиковая память сервера при полной выгрузке (код выхода 1, если пик
+вырос больше чем на --max-growth-mb):
+
+    python -m bench.export_memory --database-url ... --reset
+"""
@@ -0,0 +1,67 @@
+"""Сравнение двух отчётов: python -m bench.compare base.json new.json."""
+
+import argparse
+import json
+import sys
+
+METRICS = ("rps", "p50_ms", "p95_ms", "p99_ms", "items_per_s")
+# для этих метрик рост — ухудшение
+LOWER_IS_BETTER = {"p50_ms", "p95_ms", "p99_ms"}
+
+
+def change(base: float, new: float) -> float | None:
+    if not base:
+        return None
+    return (new - base) / base * 100
+
+
+def compare(base: dict, new: dict, threshold: float) -> tuple[list, list]:
+    rows, regressions = [], []
+    for name, b in base["scenarios"].items():
+        n = new["scenarios"].get(name)
+        if n is None:
+            continue
+        for metric in METRICS:
+            delta = change(b[metric], n[metric])
+            rows.append((name, metric, b[metric], n[metric], delta))
+            if delta is None:
+                continue
+            worse = delta if metric in LOWER_IS_BETTER else -delta
+            if worse > threshold:
+                regressions.append((name, metric, delta))
+    return rows, regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=10.0,
+        help="regression threshold in percent; exit code 1 above it",
+    )
+    args = parser.parse_args(argv)
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    print(
+        f"base {base['meta'].get('commit', '?')[:10]}  "
+        f"new {new['meta'].get('commit', '?')[:10]}"
+    )
+    rows, regressions = compare(base, new, args.threshold)
+    for name, metric, b, n, delta in rows:
+        shown = "n/a" if delta is None else f"{delta:+.1f}%"
+        print(f"{name:<14} {metric:<12} {b:>12} -> {n:>12}  {shown}")
+
+    for name, metric, delta in regressions:
+        print(f"REGRESSION {name} {metric} {delta:+.1f}%")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""Пиковая память сервера при полной выгрузке users и links.
+
+    python -m bench.export_memory --database-url \\
+        postgresql+asyncpg://user@127.0.0.1/dashboard_bench \\
+        --reset --users 1000000 --links 2000000
+
+Сервер запускается отдельным процессом; до каждой выгрузки пик RSS
+сбрасывается (Linux, /proc/<pid>/clear_refs). База — пик после первых
+строк выгрузки, когда код и пул уже прогреты. Выгрузка должна держать
+память ровной, поэтому порог — прирост пика над базой, а не доля
+размера таблицы: по умолчанию --max-growth-mb 64 при любом числе
+строк. Выше порога — код выхода 1.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+from bench.run import (
+    BENCH_LOGIN,
+    BENCH_PASSWORD,
+    ROOT,
+    peak_rss_mb,
+    reset_peak_rss,
+    wait_ready,
+)
+
+EXPORTS = [
+    # (путь, формат, gzip)
+    ("/vpn/export/links", "csv", False),
+    ("/vpn/export/links", "ndjson", True),
+    ("/vpn/export/users", "csv", False),
+    ("/vpn/export/users", "ndjson", False),
+]
+# сколько байт выгрузки прочитать для базового замера
+WARMUP_BYTES = 1 << 20
+
+
+def server_env(args) -> dict:
+    return {
+        **os.environ,
+        "DATABASE_URL_VPN": args.database_url,
+        "USER_NAME_VPN": BENCH_LOGIN,
+        "PASS_VPN": BENCH_PASSWORD,
+        # фоновые задачи держат свою память и портят замер
+        "SWEEPER_ENABLED": "0",
+        "SNAPSHOT_ENABLED": "0",
+        "TYPEAHEAD_ENABLED": "0",
+        "LIVE_UPDATES_ENABLED": "0",
+        "DB_SCHEMA_CHECK": "warn",
+    }
+
+
+async def stream_export(
+    client: httpx.AsyncClient, path: str, fmt: str, gzip: bool, limit=None
+) -> tuple[int, int]:
+    """Читает выгрузку и возвращает (байт, строк) в теле ответа."""
+    size = lines = 0
+    params = {"format": fmt, "gzip": str(gzip).lower()}
+    async with client.stream("GET", path, params=params) as r:
+        r.raise_for_status()
+        # тело gzip не распаковываем: httpx сделал бы это сам только
+        # для Content-Encoding, а здесь это вложение .gz
+        async for chunk in r.aiter_raw():
+            size += len(chunk)
+            lines += chunk.count(b"\n")
+            if limit is not None and size >= limit:
+                break
+    return size, lines
+
+
+async def measure(args, pid: int) -> dict:
+    base_url = f"http://127.0.0.1:{args.port}"
+    # identity: считаем байты самой выгрузки, без сжатия middleware
+    headers = {"Accept-Encoding": "identity"}
+    async with httpx.AsyncClient(
+        base_url=base_url, headers=headers, timeout=None
+    ) as client:
+        await client.post(
+            "/auth/login",
+            data={"username": BENCH_LOGIN, "password": BENCH_PASSWORD},
+        )
+        reset_peak_rss(pid)
+        for path, fmt, gzip in EXPORTS:
+            await stream_export(client, path, fmt, gzip, WARMUP_BYTES)
+        baseline = peak_rss_mb(pid)
+
+        results = []
+        for path, fmt, gzip in EXPORTS:
+            reset_peak_rss(pid)
+            started = time.perf_counter()
+            size, lines = await stream_export(client, path, fmt, gzip)
+            elapsed = time.perf_counter() - started
+            peak = peak_rss_mb(pid)
+            results.append(
+                {
+                    "path": path,
+                    "format": fmt,
+                    "gzip": gzip,
+                    "bytes": size,
+                    # у gzip строки в сжатом теле не считаются
+                    "lines": None if gzip else lines,
+                    "seconds": round(elapsed, 2),
+                    "peak_rss_mb": peak,
+                    "growth_mb": (
+                        None
+                        if peak is None or baseline is None
+                        else round(peak - baseline, 1)
+                    ),
+                }
+            )
+    return {"baseline_rss_mb": baseline, "exports": results}
+
+
+async def main(args) -> int:
+    os.environ["DATABASE_URL_VPN"] = args.database_url
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    from bench.seed import check_bench_url, dataset_info, reset_and_seed
+
+    engine = create_async_engine(
+        args.database_url, connect_args={"command_timeout": None}
+    )
+    try:
+        if args.reset:
+            check_bench_url(args.database_url, args.force)
+            await reset_and_seed(engine, args.users, args.links, 0.7, None)
+        dataset = await dataset_info(engine)
+    finally:
+        await engine.dispose()
+
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "main:app",
+            "--port",
+            str(args.port),
+            "--log-level",
+            "warning",
+            "--no-access-log",
+        ],
+        cwd=ROOT,
+        env=server_env(args),
+    )
+    try:
+        await wait_ready(f"http://127.0.0.1:{args.port}", server)
+        report = await measure(args, server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+
+    report.update(
+        users=dataset["users"],
+        links=dataset["links"],
+        max_growth_mb=args.max_growth_mb,
+    )
+    print(json.dumps(report, indent=2))
+    if report["baseline_rss_mb"] is None:
+        print("peak RSS is not available on this platform", file=sys.stderr)
+        return 0
+    over = [
+        e for e in report["exports"] if e["growth_mb"] > args.max_growth_mb
+    ]
+    for e in over:
+        print(
+            f"FAIL {e['path']} {e['format']}: peak grew "
+            f"{e['growth_mb']} MB > {args.max_growth_mb} MB",
+            file=sys.stderr,
+        )
+    return 1 if over else 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--database-url", default=os.getenv("BENCH_DATABASE_URL")
+    )
+    parser.add_argument("--reset", action="store_true")
+    parser.add_argument("--force", action="store_true")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--links", type=int, default=2_000_000)
+    parser.add_argument("--max-growth-mb", type=float, default=64)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args(argv)
+    if not args.database_url:
+        parser.error("--database-url or BENCH_DATABASE_URL is required")
+    return args
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -0,0 +1,212 @@
+"""Накладные расходы метрик на запрос: MetricsMiddleware и хуки SQL.
+
+    python -m bench.metrics_overhead --database-url \\
+        postgresql+asyncpg://user@127.0.0.1/dashboard_bench
+
+Сквозной A/B (bench.run --metrics off/on) на общей машине шумит
+сильнее нескольких процентов, поэтому здесь стоимость считается по
+частям в одном процессе:
+
+- middleware: CPU на вызов пустого ASGI-приложения с ним и без него;
+- хук SQL: CPU на SELECT 1 через движок с instrument_engine и без;
+- запрос: время внутри приложения (по http_request_duration_seconds)
+  и число SQL-запросов на него (по db_statement_duration_seconds)
+  для горячих эндпоинтов.
+
+Доля = (middleware + хук × запросов SQL) / время запроса. Выше
+--max-percent (по умолчанию 3) — код выхода 1.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from bench.run import BENCH_LOGIN, BENCH_PASSWORD
+
+ENDPOINTS = [
+    ("/vpn/summary", {}),
+    ("/vpn/links", {"page": 2}),
+    ("/vpn/links", {"user_id": 1}),
+]
+
+
+def app_env(args) -> dict:
+    return {
+        "DATABASE_URL_VPN": args.database_url,
+        "USER_NAME_VPN": BENCH_LOGIN,
+        "PASS_VPN": BENCH_PASSWORD,
+        "METRICS_ENABLED": "1",
+        # без фоновых задач и очередей: меряется только запрос
+        "SWEEPER_ENABLED": "0",
+        "SNAPSHOT_ENABLED": "0",
+        "TYPEAHEAD_ENABLED": "0",
+        "LIVE_UPDATES_ENABLED": "0",
+        "ADMISSION_ENABLED": "0",
+        "DB_SCHEMA_CHECK": "warn",
+    }
+
+
+async def empty_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def middleware_us(iterations: int) -> dict:
+    from middleware import MetricsMiddleware
+
+    scope = {"type": "http", "method": "GET", "path": "/vpn/links"}
+
+    async def receive():
+        return {"type": "http.request"}
+
+    async def send(message):
+        pass
+
+    async def per_call(app) -> float:
+        start = time.process_time()
+        for _ in range(iterations):
+            await app(dict(scope), receive, send)
+        return (time.process_time() - start) / iterations * 1e6
+
+    bare = await per_call(empty_app)
+    wrapped = await per_call(MetricsMiddleware(empty_app))
+    return {"bare_us": round(bare, 2), "overhead_us": round(wrapped - bare, 2)}
+
+
+async def statement_hook_us(database_url: str, iterations: int) -> dict:
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    from metrics import instrument_engine
+
+    async def per_query(instrumented: bool) -> float:
+        engine = create_async_engine(database_url, pool_size=1)
+        if instrumented:
+            instrument_engine(engine)
+        try:
+            async with engine.connect() as conn:
+                for _ in range(100):
+                    await conn.execute(text("SELECT 1"))
+                start = time.process_time()
+                for _ in range(iterations):
+                    await conn.execute(text("SELECT 1"))
+                return (time.process_time() - start) / iterations * 1e6
+        finally:
+            await engine.dispose()
+
+    bare = await per_query(False)
+    hooked = await per_query(True)
+    return {"bare_us": round(bare, 2), "overhead_us": round(hooked - bare, 2)}
+
+
+def _histogram_totals(histogram, match) -> tuple[int, float]:
+    count = total = 0
+    for labels, (counts, value) in histogram.values.items():
+        if match(labels):
+            count += sum(counts)
+            total += value[0]
+    return count, total
+
+
+async def endpoint_costs(requests: int) -> list[dict]:
+    import httpx
+
+    from main import app
+    from metrics import DB_STATEMENTS, HTTP_LATENCY
+
+    results = []
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as client:
+            await client.post(
+                "/auth/login",
+                data={"username": BENCH_LOGIN, "password": BENCH_PASSWORD},
+            )
+            for path, params in ENDPOINTS:
+                for _ in range(20):
+                    await client.get(path, params=params)
+
+                def route(labels):
+                    return labels == ("GET", path)
+
+                http_before = _histogram_totals(HTTP_LATENCY, route)
+                sql_before = _histogram_totals(DB_STATEMENTS, lambda _: True)
+                for _ in range(requests):
+                    r = await client.get(path, params=params)
+                    r.raise_for_status()
+                http_count, http_total = (
+                    a - b
+                    for a, b in zip(
+                        _histogram_totals(HTTP_LATENCY, route), http_before
+                    )
+                )
+                sql_count = (
+                    _histogram_totals(DB_STATEMENTS, lambda _: True)[0]
+                    - sql_before[0]
+                )
+                results.append(
+                    {
+                        "path": path,
+                        "params": params,
+                        "request_us": round(http_total / http_count * 1e6, 1),
+                        "statements_per_request": round(
+                            sql_count / http_count, 2
+                        ),
+                    }
+                )
+    return results
+
+
+async def main(args) -> int:
+    os.environ.update(app_env(args))
+
+    middleware = await middleware_us(args.iterations)
+    hook = await statement_hook_us(args.database_url, args.queries)
+    endpoints = await endpoint_costs(args.requests)
+    for e in endpoints:
+        overhead = (
+            middleware["overhead_us"]
+            + hook["overhead_us"] * e["statements_per_request"]
+        )
+        e["overhead_us"] = round(overhead, 2)
+        e["overhead_percent"] = round(overhead / e["request_us"] * 100, 2)
+
+    report = {
+        "middleware": middleware,
+        "statement_hook": hook,
+        "endpoints": endpoints,
+        "max_percent": args.max_percent,
+    }
+    print(json.dumps(report, indent=2))
+    over = [e for e in endpoints if e["overhead_percent"] > args.max_percent]
+    for e in over:
+        print(
+            f"FAIL {e['path']} {e['params']}: metrics add "
+            f"{e['overhead_percent']}% > {args.max_percent}%",
+            file=sys.stderr,
+        )
+    return 1 if over else 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--database-url", default=os.getenv("BENCH_DATABASE_URL")
+    )
+    parser.add_argument("--iterations", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=5_000)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--max-percent", type=float, default=3.0)
+    args = parser.parse_args(argv)
+    if not args.database_url:
+        parser.error("--database-url or BENCH_DATABASE_URL is required")
+    return args
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
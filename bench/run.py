@@ -0,0 +1,317 @@
+"""Прогон бенчмарков: python -m bench.run --help."""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parents[1]
+BENCH_LOGIN = "bench"
+BENCH_PASSWORD = "bench"
+MAX_ERRORS_KEPT = 5
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    # nearest-rank: значение, не превышаемое p% замеров
+    if not sorted_values:
+        return 0.0
+    rank = max(int(len(sorted_values) * p / 100 + 0.999999) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(latencies: list[float], items: int, errors: list, elapsed):
+    values = sorted(latencies)
+    ms = [v * 1000 for v in values]
+    return {
+        "requests": len(values),
+        "errors": len(errors),
+        "error_samples": errors[:MAX_ERRORS_KEPT],
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(len(values) / elapsed, 2) if elapsed else 0,
+        "items": items,
+        "items_per_s": round(items / elapsed, 2) if elapsed else 0,
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p95_ms": round(percentile(ms, 95), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+        "mean_ms": round(sum(ms) / len(ms), 3) if ms else 0,
+        "max_ms": round(ms[-1], 3) if ms else 0,
+    }
+
+
+async def run_scenario(scenario, ctx, args) -> dict:
+    concurrency = scenario.concurrency or args.concurrency
+    latencies: list[float] = []
+    errors: list[str] = []
+    items = 0
+    remaining = [scenario.iterations]
+
+    async def worker(worker_id: int, deadline: float, record: bool):
+        nonlocal items
+        rng = random.Random(args.random_seed * 1000 + worker_id)
+        state: dict = {}
+        while time.perf_counter() < deadline:
+            if remaining[0] is not None:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            start = time.perf_counter()
+            try:
+                done = await scenario.call(ctx, rng, state)
+            except Exception as e:
+                if record:
+                    errors.append(f"{type(e).__name__}: {e}")
+                continue
+            if record:
+                latencies.append(time.perf_counter() - start)
+                items += done
+
+    if scenario.iterations is None and args.warmup > 0:
+        deadline = time.perf_counter() + args.warmup
+        await asyncio.gather(
+            *(worker(i, deadline, False) for i in range(concurrency))
+        )
+
+    started = time.perf_counter()
+    # у сценариев с iterations ограничение по времени не действует
+    duration = args.duration if scenario.iterations is None else 1e9
+    deadline = started + duration
+    await asyncio.gather(
+        *(worker(i, deadline, True) for i in range(concurrency))
+    )
+    result = summarize(latencies, items, errors, time.perf_counter() - started)
+    result.update(unit=scenario.unit, concurrency=concurrency)
+    return result
+
+
+def reset_peak_rss(pid: int) -> None:
+    # "5" в clear_refs сбрасывает VmHWM (Linux); где нельзя — пик
+    # считается с запуска сервера
+    try:
+        Path(f"/proc/{pid}/clear_refs").write_text("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mb(pid: int) -> float | None:
+    try:
+        status = Path(f"/proc/{pid}/status").read_text()
+    except OSError:
+        return None
+    for line in status.splitlines():
+        if line.startswith("VmHWM:"):
+            return round(int(line.split()[1]) / 1024, 1)
+    return None
+
+
+def git_revision() -> dict:
+    def git(*cmd):
+        return subprocess.run(
+            ["git", *cmd], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip()
+
+    dirty = git("status", "--porcelain", "--untracked-files=no")
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(dirty)}
+
+
+async def wait_ready(base_url: str, server, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise SystemExit("app server exited during startup")
+            try:
+                if (await client.get("/auth/login")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise SystemExit("app server did not start in time")
+
+
+def server_env(args, telegram_url: str) -> dict:
+    return {
+        **os.environ,
+        "DATABASE_URL_VPN": args.database_url,
+        "USER_NAME_VPN": BENCH_LOGIN,
+        "PASS_VPN": BENCH_PASSWORD,
+        "TOKEN_BOT": "bench",
+        "TELEGRAM_API_URL": telegram_url,
+        "BROADCAST_RATE": str(args.broadcast_rate),
+        "BROADCAST_PER_CHAT_INTERVAL": "0",
+        "SWEEPER_ENABLED": "0",
+        # снимок пишет в daily_stats, которой нет при --schema-revision,
+        # и тянет память и соединения посреди замера
+        "SNAPSHOT_ENABLED": "0",
+        "METRICS_ENABLED": "1" if args.metrics == "on" else "0",
+        # при --schema-revision схема нарочно отстаёт от head
+        "DB_SCHEMA_CHECK": "warn",
+    }
+
+
+async def main(args) -> int:
+    # config читает окружение при импорте: адрес базы задаём заранее
+    os.environ["DATABASE_URL_VPN"] = args.database_url
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    from bench.scenarios import SCENARIOS, BenchContext
+    from bench.seed import check_bench_url, dataset_info, reset_and_seed
+    from bench.telegram_mock import TelegramMock
+    from vpn.db_services import VPNDatabase
+
+    selected = SCENARIOS
+    if args.scenarios:
+        names = set(args.scenarios.split(","))
+        selected = [s for s in SCENARIOS if s.name in names]
+        unknown = names - {s.name for s in selected}
+        if unknown:
+            raise SystemExit(f"unknown scenarios: {', '.join(unknown)}")
+    if args.read_only:
+        selected = [s for s in selected if not s.writes]
+
+    engine = create_async_engine(
+        args.database_url, connect_args={"command_timeout": None}
+    )
+    meta = {"started_at": time.time(), **git_revision()}
+    if args.reset:
+        check_bench_url(args.database_url, args.force)
+        meta.update(
+            await reset_and_seed(
+                engine,
+                args.users,
+                args.links,
+                args.assigned_ratio,
+                args.schema_revision,
+            )
+        )
+    meta["dataset"] = await dataset_info(engine)
+    await engine.dispose()
+
+    telegram = TelegramMock(args.telegram_latency, args.telegram_429_every)
+    telegram_url = await telegram.start()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "main:app",
+            "--port",
+            str(args.port),
+            "--log-level",
+            "warning",
+            "--no-access-log",
+        ],
+        cwd=ROOT,
+        env=server_env(args, telegram_url),
+    )
+    results = {}
+    try:
+        await wait_ready(base_url, server)
+        limits = httpx.Limits(
+            max_connections=args.concurrency,
+            max_keepalive_connections=args.concurrency,
+        )
+        async with httpx.AsyncClient(
+            base_url=base_url, limits=limits, timeout=120
+        ) as client:
+            await client.post(
+                "/auth/login",
+                data={"username": BENCH_LOGIN, "password": BENCH_PASSWORD},
+            )
+            dataset = meta["dataset"]
+            ctx = BenchContext(
+                client=client,
+                users=dataset["users"],
+                max_link_id=dataset["max_link_id"] or 1,
+                import_rows=args.import_rows,
+                broadcast_size=args.broadcast_size,
+                db=VPNDatabase(),
+            )
+            for scenario in selected:
+                reset_peak_rss(server.pid)
+                results[scenario.name] = await run_scenario(
+                    scenario, ctx, args
+                )
+                results[scenario.name]["server_peak_rss_mb"] = peak_rss_mb(
+                    server.pid
+                )
+                print(format_row(scenario.name, results[scenario.name]))
+    finally:
+        server.terminate()
+        server.wait()
+        await telegram.stop()
+        from database.db import dispose_engines
+
+        await dispose_engines()
+
+    meta.update(
+        python=platform.python_version(),
+        concurrency=args.concurrency,
+        duration_s=args.duration,
+        metrics=args.metrics,
+        telegram=telegram.stats(),
+    )
+    report = {"meta": meta, "scenarios": results}
+    if args.output:
+        out = Path(args.output)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(report, indent=2, default=str))
+        print(f"results written to {out}")
+    return 0 if all(not r["errors"] for r in results.values()) else 1
+
+
+def format_row(name: str, r: dict) -> str:
+    return (
+        f"{name:<14} {r['rps']:>9.1f} req/s  p50 {r['p50_ms']:>8.2f}  "
+        f"p95 {r['p95_ms']:>8.2f}  p99 {r['p99_ms']:>8.2f} ms  "
+        f"{r['items_per_s']:>10.1f} {r['unit']}/s  errors {r['errors']}  "
+        f"rss {r['server_peak_rss_mb']} MB"
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--database-url",
+        default=os.getenv("BENCH_DATABASE_URL"),
+        help="asyncpg URL of a dedicated benchmark database "
+        "(BENCH_DATABASE_URL)",
+    )
+    parser.add_argument("--reset", action="store_true")
+    parser.add_argument("--force", action="store_true")
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--links", type=int, default=15_000)
+    parser.add_argument("--assigned-ratio", type=float, default=0.7)
+    parser.add_argument("--schema-revision", default=None)
+    parser.add_argument("--scenarios", default="")
+    parser.add_argument("--read-only", action="store_true")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--warmup", type=float, default=2)
+    parser.add_argument("--import-rows", type=int, default=1_000_000)
+    parser.add_argument("--broadcast-size", type=int, default=2_000)
+    parser.add_argument("--broadcast-rate", type=float, default=1_000)
+    parser.add_argument("--telegram-latency", type=float, default=0.03)
+    parser.add_argument("--telegram-429-every", type=int, default=0)
+    parser.add_argument("--random-seed", type=int, default=1)
+    parser.add_argument("--port", type=int, default=8765)
+    # A/B накладных расходов метрик: два отчёта и bench.compare
+    parser.add_argument("--metrics", choices=("on", "off"), default="on")
+    parser.add_argument("-o", "--output", default=None)
+    args = parser.parse_args(argv)
+    if not args.database_url:
+        parser.error("--database-url or BENCH_DATABASE_URL is required")
+    return args
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -0,0 +1,187 @@
+import asyncio
+import itertools
+import random
+import uuid
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+import httpx
+
+from bench.seed import USER_ID_BASE
+
+
+@dataclass
+class BenchContext:
+    client: httpx.AsyncClient
+    users: int
+    max_link_id: int
+    import_rows: int
+    broadcast_size: int
+    # для allocate: VPNDatabase бенчмарочной базы в этом процессе
+    db: object | None = None
+    # пользователи удаляются с конца диапазона, каждый один раз
+    delete_ids: itertools.count = field(
+        default_factory=lambda: itertools.count(0)
+    )
+
+    def random_user(self, rng: random.Random) -> int:
+        return USER_ID_BASE + rng.randint(1, self.users)
+
+    def random_link(self, rng: random.Random) -> int:
+        return rng.randint(1, self.max_link_id)
+
+
+Call = Callable[[BenchContext, random.Random, dict], Awaitable[int]]
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """Один вид нагрузки; call возвращает число обработанных единиц.
+
+    Без iterations сценарий крутится --duration секунд в --concurrency
+    воркеров; с iterations выполняется ровно столько раз.
+    """
+
+    name: str
+    call: Call
+    unit: str = "requests"
+    concurrency: int | None = None
+    iterations: int | None = None
+    writes: bool = False
+
+
+async def _get(ctx: BenchContext, url: str, **params) -> httpx.Response:
+    r = await ctx.client.get(url, params=params)
+    r.raise_for_status()
+    return r
+
+
+async def vpn_page(ctx, rng, state):
+    pages = max(ctx.users // 10, 1)
+    await _get(ctx, "/vpn/", page=rng.randint(1, pages))
+    return 1
+
+
+async def vpn_search(ctx, rng, state):
+    await _get(ctx, "/vpn/", search=str(rng.randint(1, ctx.users))[-4:])
+    return 1
+
+
+async def links_page(ctx, rng, state):
+    await _get(ctx, "/vpn/links", page=rng.randint(1, 100), per_page=50)
+    return 1
+
+
+async def links_cursor(ctx, rng, state):
+    # каждый воркер листает свою цепочку курсоров до конца и заново
+    params = {"per_page": 50}
+    if state.get("cursor"):
+        params["cursor"] = state["cursor"]
+    data = (await _get(ctx, "/vpn/links", **params)).json()
+    state["cursor"] = data.get("next_cursor")
+    return 1
+
+
+async def links_by_user(ctx, rng, state):
+    await _get(ctx, "/vpn/links", user_id=ctx.random_user(rng))
+    return 1
+
+
+async def summary(ctx, rng, state):
+    await _get(ctx, "/vpn/summary")
+    return 1
+
+
+async def reassign(ctx, rng, state):
+    items = [
+        {"link_id": ctx.random_link(rng), "user_id": ctx.random_user(rng)}
+        for _ in range(20)
+    ]
+    r = await ctx.client.put("/vpn/links/bulk", json={"items": items})
+    r.raise_for_status()
+    return len(items)
+
+
+async def allocate(ctx, rng, state):
+    from vpn.db_services import LinkService
+
+    async for session in ctx.db.get_session():
+        link = await LinkService(session).assign_one_link_to_user(
+            ctx.random_user(rng)
+        )
+    if link is None:
+        raise RuntimeError("free link pool exhausted")
+    return 1
+
+
+async def import_links(ctx, rng, state):
+    prefix = uuid.uuid4().hex[:8]
+
+    async def body():
+        for start in range(0, ctx.import_rows, 1000):
+            end = min(start + 1000, ctx.import_rows)
+            yield "".join(
+                f"vless://import-{prefix}-{i}@example.invalid\n"
+                for i in range(start, end)
+            ).encode()
+
+    r = await ctx.client.post(
+        "/vpn/links/import", params={"format": "csv"}, content=body()
+    )
+    r.raise_for_status()
+    return r.json()["inserted"]
+
+
+async def export_links(ctx, rng, state):
+    rows = 0
+    async with ctx.client.stream(
+        "GET", "/vpn/export/links", params={"format": "csv"}
+    ) as r:
+        r.raise_for_status()
+        async for chunk in r.aiter_bytes():
+            rows += chunk.count(b"\n")
+    return rows - 1
+
+
+async def broadcast(ctx, rng, state):
+    user_ids = [ctx.random_user(rng) for _ in range(ctx.broadcast_size)]
+    r = await ctx.client.post(
+        "/vpn/send_message", json={"user_ids": user_ids, "text": "bench"}
+    )
+    r.raise_for_status()
+    job_id = r.json()["job_id"]
+
+    while True:
+        job = (await _get(ctx, f"/vpn/send_message/{job_id}")).json()
+        if job["status"] != "running":
+            break
+        await asyncio.sleep(0.05)
+    if job["status"] != "done":
+        raise RuntimeError(f"broadcast {job['status']}")
+    return job["sent"]
+
+
+async def delete_user(ctx, rng, state):
+    user_id = USER_ID_BASE + ctx.users - next(ctx.delete_ids)
+    r = await ctx.client.post(f"/vpn/delete/{user_id}")
+    if r.status_code != 303:
+        r.raise_for_status()
+        raise RuntimeError(f"unexpected status {r.status_code}")
+    return 1
+
+
+# Порядок важен: сначала чтение, потом запись, удаление в конце
+SCENARIOS = [
+    Scenario("vpn_page", vpn_page),
+    Scenario("vpn_search", vpn_search),
+    Scenario("links_page", links_page),
+    Scenario("links_cursor", links_cursor),
+    Scenario("links_by_user", links_by_user),
+    Scenario("summary", summary),
+    Scenario("export_links", export_links, "rows", 1, 3),
+    Scenario("reassign", reassign, "links", writes=True),
+    Scenario("allocate", allocate, "links", writes=True),
+    Scenario("import_links", import_links, "rows", 1, 3, writes=True),
+    Scenario("broadcast", broadcast, "messages", 1, 1),
+    Scenario("delete_user", delete_user, writes=True),
+]
@@ -0,0 +1,118 @@
+import time
+
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from database.migrations import VERSION_TABLE, MigrationRunner
+from vpn.migrations import MIGRATIONS
+
+USER_ID_BASE = 100_000_000
+SEED_BATCH = 1_000_000
+
+_INSERT_USERS = text(
+    """
+    INSERT INTO users (user_id, user_name, end_date, end_trial_period)
+    SELECT
+        :base + g,
+        CASE WHEN g % 10 <> 0 THEN 'user_' || g END,
+        CASE WHEN g % 10 < 7 THEN current_date + (g % 60 - 30)::int END,
+        CASE WHEN g % 2 = 0 THEN current_date + (g % 14 - 7)::int END
+    FROM generate_series(CAST(:lo AS bigint), :hi) AS g
+    """
+)
+
+# первые assigned ссылок раздаются пользователям вразнобой, остальные
+# свободны
+_INSERT_LINKS = text(
+    """
+    INSERT INTO links (link_address, user_id)
+    SELECT
+        'vless://bench-' || g || '@example.invalid',
+        CASE WHEN g <= :assigned THEN :base + 1 + (g * 7919) % :users END
+    FROM generate_series(CAST(:lo AS bigint), :hi) AS g
+    """
+)
+
+
+def check_bench_url(db_url: str, force: bool) -> None:
+    database = make_url(db_url).database or ""
+    if "bench" not in database and not force:
+        raise SystemExit(
+            f"refusing to reset database {database!r}: its name does not "
+            "contain 'bench' (pass --force to override)"
+        )
+
+
+async def _batched(conn, stmt, total: int, **params) -> None:
+    for lo in range(1, total + 1, SEED_BATCH):
+        hi = min(lo + SEED_BATCH - 1, total)
+        await conn.execute(stmt, {"lo": lo, "hi": hi, **params})
+
+
+async def reset_and_seed(
+    engine: AsyncEngine,
+    users: int,
+    links: int,
+    assigned_ratio: float,
+    revision: str | None,
+) -> dict:
+    """Пересоздаёт схему и заливает данные, затем догоняет миграции.
+
+    Индексы строятся миграциями после заливки, как на живой базе, и
+    время их построения попадает в отчёт.
+    """
+    timings = {}
+    async with engine.begin() as conn:
+        await conn.execute(
+            text(f"DROP TABLE IF EXISTS links, users, {VERSION_TABLE}")
+        )
+
+    runner = MigrationRunner(engine, MIGRATIONS)
+    await runner.upgrade(MIGRATIONS[0].revision)
+
+    start = time.perf_counter()
+    async with engine.begin() as conn:
+        await _batched(conn, _INSERT_USERS, users, base=USER_ID_BASE)
+        await _batched(
+            conn,
+            _INSERT_LINKS,
+            links,
+            base=USER_ID_BASE,
+            users=users,
+            assigned=int(links * assigned_ratio),
+        )
+    timings["seed_seconds"] = round(time.perf_counter() - start, 3)
+
+    start = time.perf_counter()
+    timings["migrations"] = await runner.upgrade(revision)
+    timings["migrate_seconds"] = round(time.perf_counter() - start, 3)
+
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("VACUUM ANALYZE users"))
+        await conn.execute(text("VACUUM ANALYZE links"))
+    return timings
+
+
+async def dataset_info(engine: AsyncEngine) -> dict:
+    async with engine.connect() as conn:
+        row = (
+            await conn.execute(
+                text(
+                    "SELECT "
+                    "(SELECT count(*) FROM users) AS users, "
+                    "(SELECT count(*) FROM links) AS links, "
+                    "(SELECT count(*) FROM links WHERE user_id IS NULL) "
+                    "AS free_links, "
+                    "(SELECT max(id) FROM links) AS max_link_id, "
+                    "version() AS postgres"
+                )
+            )
+        ).one()
+    runner = MigrationRunner(engine, MIGRATIONS)
+    applied = await runner.applied_revisions()
+    return {
+        **row._asdict(),
+        "schema": [m.revision for m in MIGRATIONS if m.revision in applied],
+    }
@@ -0,0 +1,146 @@
+"""CPU на запрос страницы ссылок: ORM + jsonable_encoder против колонок
+и FastJSONResponse.
+
+    python -m bench.serialization --database-url \\
+        postgresql+asyncpg://user@127.0.0.1/dashboard_bench
+
+Считается process_time процесса, а не время ответа: ожидание базы в
+замер почти не попадает, остаётся гидратация строк и кодирование.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from responses import FastJSONResponse, dumps
+from vpn.models import LinkModel
+
+
+async def orm_page(session, per_page: int, offset: int) -> bytes:
+    # как get_links_page до перехода на кортежи колонок
+    stmt = (
+        select(LinkModel)
+        .order_by(LinkModel.id.desc())
+        .offset(offset)
+        .limit(per_page)
+    )
+    links = (await session.execute(stmt)).scalars().all()
+    items = [
+        {
+            "id": link.id,
+            "link_address": link.link_address,
+            "user_id": link.user_id,
+        }
+        for link in links
+    ]
+    return JSONResponse(jsonable_encoder({"items": items})).body
+
+
+async def column_page(session, per_page: int, offset: int) -> bytes:
+    stmt = (
+        select(LinkModel.id, LinkModel.link_address, LinkModel.user_id)
+        .order_by(LinkModel.id.desc())
+        .offset(offset)
+        .limit(per_page)
+    )
+    rows = (await session.execute(stmt)).all()
+    items = [
+        {"id": id_, "link_address": address, "user_id": owner}
+        for id_, address, owner in rows
+    ]
+    return FastJSONResponse({"items": items}).body
+
+
+async def measure(session_factory, page_fn, args) -> dict:
+    async with session_factory() as session:
+        for i in range(args.warmup):
+            await page_fn(session, args.per_page, i * args.per_page)
+            session.expunge_all()
+
+        cpu = []
+        size = 0
+        for i in range(args.iterations):
+            offset = (i % 100) * args.per_page
+            start = time.process_time()
+            body = await page_fn(session, args.per_page, offset)
+            cpu.append(time.process_time() - start)
+            size = len(body)
+            # сессия на запрос: identity map не копится между запросами
+            session.expunge_all()
+    cpu.sort()
+    return {
+        "cpu_mean_us": round(sum(cpu) / len(cpu) * 1e6, 1),
+        "cpu_p50_us": round(cpu[len(cpu) // 2] * 1e6, 1),
+        "body_bytes": size,
+    }
+
+
+def measure_export(rows: int) -> dict:
+    # кодирование строк NDJSON-экспорта без базы
+    record = {
+        "user_id": 123456789,
+        "user_name": "user_123456789",
+        "end_date": "2024-01-01",
+        "end_trial_period": None,
+        "links": ["vless://abcdef@example.invalid"],
+    }
+    records = [dict(record, user_id=i) for i in range(rows)]
+    result = {}
+    for name, encode in (
+        ("json", lambda r: json.dumps(r, default=str)),
+        ("dumps", lambda r: dumps(r).decode()),
+    ):
+        start = time.process_time()
+        for r in records:
+            encode(r)
+        result[f"{name}_us_per_row"] = round(
+            (time.process_time() - start) / rows * 1e6, 3
+        )
+    return result
+
+
+async def main(args) -> int:
+    engine = create_async_engine(args.database_url)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    try:
+        old = await measure(session_factory, orm_page, args)
+        new = await measure(session_factory, column_page, args)
+    finally:
+        await engine.dispose()
+
+    report = {
+        "per_page": args.per_page,
+        "orm_jsonable_encoder": old,
+        "columns_fast_json": new,
+        "speedup": round(old["cpu_mean_us"] / new["cpu_mean_us"], 2),
+        "export": measure_export(args.export_rows),
+    }
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--database-url", default=os.getenv("BENCH_DATABASE_URL")
+    )
+    parser.add_argument("--per-page", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--export-rows", type=int, default=50_000)
+    args = parser.parse_args(argv)
+    if not args.database_url:
+        parser.error("--database-url or BENCH_DATABASE_URL is required")
+    return args
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
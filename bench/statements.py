@@ -0,0 +1,131 @@
+"""Накладные расходы на запрос: select() на каждый вызов против
+готовых запросов из vpn.queries, с кэшем подготовленных запросов
+asyncpg и без него.
+
+    python -m bench.statements --database-url \\
+        postgresql+asyncpg://user@127.0.0.1/dashboard_bench
+
+Запросы дешёвые (поиск по первичному ключу, страница ссылок), чтобы
+в замере доминировала подготовка, а не работа Postgres.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from vpn import queries
+from vpn.models import LinkModel, VPNUser
+
+
+def rebuilt_user_exists(user_id: int):
+    # как update_link до vpn.queries
+    stmt = select(VPNUser.user_id).where(VPNUser.user_id == user_id)
+    return stmt, {}
+
+
+def cached_user_exists(user_id: int):
+    return queries.USER_EXISTS, {"user_id": user_id}
+
+
+def rebuilt_links_page(offset: int):
+    is_free = LinkModel.user_id.is_(None)
+    stmt = (
+        select(LinkModel.id, LinkModel.link_address, LinkModel.user_id)
+        .order_by(is_free.desc(), LinkModel.id.desc())
+        .offset(offset)
+        .limit(11)
+    )
+    return stmt, {}
+
+
+def cached_links_page(offset: int):
+    return queries.links_page(False, None), {"offset": offset, "limit": 11}
+
+
+VARIANTS = {
+    # название: (запрос для user_exists, для links_page, кэш asyncpg)
+    "rebuilt": (rebuilt_user_exists, rebuilt_links_page, True),
+    "cached": (cached_user_exists, cached_links_page, True),
+    "cached_no_prepare_cache": (
+        cached_user_exists,
+        cached_links_page,
+        False,
+    ),
+}
+
+
+async def run_variant(args, user_exists, links_page, prepare_cache: bool):
+    engine = create_async_engine(
+        args.database_url,
+        pool_size=args.concurrency,
+        connect_args={
+            "prepared_statement_cache_size": 256 if prepare_cache else 0
+        },
+    )
+    rng = random.Random(1)
+    result = {}
+    try:
+        for name, build in (
+            ("user_exists", lambda: user_exists(rng.randint(1, 10**9))),
+            ("links_page", lambda: links_page(rng.randint(0, 100) * 10)),
+        ):
+
+            async def worker(count: int):
+                async with engine.connect() as conn:
+                    for _ in range(count):
+                        stmt, params = build()
+                        await conn.execute(stmt, params)
+
+            # прогрев: соединения открыты, кэши заполнены
+            await asyncio.gather(
+                *(worker(20) for _ in range(args.concurrency))
+            )
+            per_worker = args.queries // args.concurrency
+            total = per_worker * args.concurrency
+            wall = time.perf_counter()
+            cpu = time.process_time()
+            await asyncio.gather(
+                *(worker(per_worker) for _ in range(args.concurrency))
+            )
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            result[name] = {
+                "qps": round(total / wall),
+                "wall_us_per_query": round(wall / total * 1e6, 1),
+                "cpu_us_per_query": round(cpu / total * 1e6, 1),
+            }
+    finally:
+        await engine.dispose()
+    return result
+
+
+async def main(args) -> int:
+    report = {"concurrency": args.concurrency, "queries": args.queries}
+    for name, (user_exists, links_page, cache) in VARIANTS.items():
+        report[name] = await run_variant(args, user_exists, links_page, cache)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--database-url", default=os.getenv("BENCH_DATABASE_URL")
+    )
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--queries", type=int, default=20_000)
+    args = parser.parse_args(argv)
+    if not args.database_url:
+        parser.error("--database-url or BENCH_DATABASE_URL is required")
+    return args
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -0,0 +1,75 @@
+import asyncio
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+
+class TelegramMock:
+    """Локальная замена Bot API для рассылок в бенчмарке.
+
+    Отвечает на sendMessage с задержкой latency; каждый
+    rate_limit_every-й запрос получает 429 с retry_after, как Telegram
+    при превышении лимита.
+    """
+
+    def __init__(self, latency: float = 0.03, rate_limit_every: int = 0):
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.requests = 0
+        self.sent = 0
+        self.limited = 0
+        self.app = Starlette(
+            routes=[
+                Route("/bot{token}/{method}", self.handle, methods=["POST"]),
+            ]
+        )
+        self._server: uvicorn.Server | None = None
+        self._task: asyncio.Task | None = None
+
+    async def handle(self, request: Request):
+        self.requests += 1
+        await request.body()
+        await asyncio.sleep(self.latency)
+
+        if self.rate_limit_every and (
+            self.requests % self.rate_limit_every == 0
+        ):
+            self.limited += 1
+            return JSONResponse(
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": "Too Many Requests",
+                    "parameters": {"retry_after": 1},
+                },
+                status_code=429,
+            )
+
+        self.sent += 1
+        return JSONResponse({"ok": True, "result": {"message_id": 1}})
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        config = uvicorn.Config(
+            self.app, host=host, port=port, log_level="warning", lifespan="off"
+        )
+        self._server = uvicorn.Server(config)
+        self._task = asyncio.create_task(self._server.serve())
+        while not self._server.started:
+            await asyncio.sleep(0.01)
+        sock = self._server.servers[0].sockets[0]
+        return "http://{}:{}".format(*sock.getsockname()[:2])
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.should_exit = True
+            await self._task
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "sent": self.sent,
+            "rate_limited": self.limited,
+        }
@@ -4,10 +4,129 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
 DATABASE_URL_VPN = os.getenv("DATABASE_URL_VPN")
 DATABASE_URL_CODEX = os.getenv('DATABASE_URL_CODEX')
+# Необязательная реплика для чтения (VPNDatabase.get_read_session)
+DATABASE_URL_VPN_REPLICA = os.getenv("DATABASE_URL_VPN_REPLICA", "")
 SECRET_KEY = os.getenv('SECRET_KEY')
 
+# Пул соединений: один engine на DATABASE_URL на весь процесс
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_CONNECT_TIMEOUT = float(os.getenv("DB_CONNECT_TIMEOUT", "5"))
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "30"))
+# Кэш скомпилированного SQL на движок и подготовленных запросов asyncpg
+# на каждое соединение; 0 во втором отключает подготовку из кэша
+DB_QUERY_CACHE_SIZE = int(os.getenv("DB_QUERY_CACHE_SIZE", "500"))
+DB_PREPARED_STATEMENT_CACHE_SIZE = int(
+    os.getenv("DB_PREPARED_STATEMENT_CACHE_SIZE", "256")
+)
+
+# После записи процесс читает с primary ещё REPLICA_STICKY_SECONDS;
+# реплика с отставанием больше REPLICA_MAX_LAG секунд не используется
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "10"))
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "5"))
+
+LINKS_COUNT_CACHE_TTL = float(os.getenv("LINKS_COUNT_CACHE_TTL", "30"))
+USERS_COUNT_CACHE_TTL = float(os.getenv("USERS_COUNT_CACHE_TTL", "30"))
+# без поиска число пользователей берётся из pg_class.reltuples, если
+# оценка не меньше порога; на маленькой таблице точный count дешевле
+USERS_COUNT_ESTIMATE_MIN = int(os.getenv("USERS_COUNT_ESTIMATE_MIN", "100000"))
+SUMMARY_CACHE_TTL = float(os.getenv("SUMMARY_CACHE_TTL", "10"))
+# ETag меняется не реже раза в ETAG_MAX_AGE секунд, даже если запись
+# прошла мимо этого процесса (другой воркер, бот пишет в базу сам)
+ETAG_MAX_AGE = float(os.getenv("ETAG_MAX_AGE", "30"))
+LINK_IMPORT_BATCH_SIZE = int(os.getenv("LINK_IMPORT_BATCH_SIZE", "5000"))
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "2000"))
+
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+TELEGRAM_TIMEOUT = float(os.getenv("TELEGRAM_TIMEOUT", "15"))
+
+# Рассылка: Telegram допускает ~30 сообщений/с глобально и ~1/с в один чат
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_PER_CHAT_INTERVAL = float(
+    os.getenv("BROADCAST_PER_CHAT_INTERVAL", "1.0")
+)
+BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", "3"))
+BROADCAST_CHUNK_SIZE = int(os.getenv("BROADCAST_CHUNK_SIZE", "1000"))
+
+# Фоновый возврат ссылок истёкших пользователей в свободный пул.
+# Освобождает ссылки в боевой базе, поэтому включается только явно
+SWEEPER_ENABLED = _env_bool("SWEEPER_ENABLED", False)
+SWEEPER_DRY_RUN = _env_bool("SWEEPER_DRY_RUN", False)
+SWEEPER_INTERVAL = float(os.getenv("SWEEPER_INTERVAL", "600"))
+SWEEPER_BATCH_SIZE = int(os.getenv("SWEEPER_BATCH_SIZE", "500"))
+SWEEPER_GRACE_DAYS = int(os.getenv("SWEEPER_GRACE_DAYS", "1"))
+
+# Статика: исходники и результат python -m static_assets
+STATIC_DIR = os.getenv("STATIC_DIR", "frontend/static")
+STATIC_BUILD_DIR = os.getenv("STATIC_BUILD_DIR", "frontend/static_build")
+# JSON и HTML ответы больше порога сжимаются gzip
+GZIP_MIN_SIZE = int(os.getenv("GZIP_MIN_SIZE", "1024"))
+
+# GET /metrics; токен, если задан, ждём в заголовке Authorization: Bearer
+METRICS_ENABLED = _env_bool("METRICS_ENABLED", True)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Журнал медленных запросов (GET /vpn/slow_queries)
+SLOW_QUERY_ENABLED = _env_bool("SLOW_QUERY_ENABLED", False)
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "200"))
+SLOW_QUERY_BUFFER = int(os.getenv("SLOW_QUERY_BUFFER", "200"))
+# EXPLAIN ANALYZE повторно выполняет медленный SELECT
+SLOW_QUERY_EXPLAIN = _env_bool("SLOW_QUERY_EXPLAIN", False)
+
+# Push-обновления (GET /vpn/events): LISTEN vpn_changes, одно
+# соединение на процесс
+LIVE_UPDATES_ENABLED = _env_bool("LIVE_UPDATES_ENABLED", True)
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "100"))
+LIVE_HEARTBEAT = float(os.getenv("LIVE_HEARTBEAT", "15"))
+LIVE_RECONNECT_MAX_DELAY = float(os.getenv("LIVE_RECONNECT_MAX_DELAY", "30"))
+
+# Подсказки по пользователям (GET /vpn/users/typeahead): индекс в памяти
+TYPEAHEAD_ENABLED = _env_bool("TYPEAHEAD_ENABLED", True)
+TYPEAHEAD_MAX_LIMIT = int(os.getenv("TYPEAHEAD_MAX_LIMIT", "50"))
+# без LISTEN индекс пересобирается с этим интервалом
+TYPEAHEAD_REFRESH_INTERVAL = float(
+    os.getenv("TYPEAHEAD_REFRESH_INTERVAL", "300")
+)
+TYPEAHEAD_QUEUE_SIZE = int(os.getenv("TYPEAHEAD_QUEUE_SIZE", "10000"))
+# сколько кандидатов подстроки проверять за запрос
+TYPEAHEAD_SCAN_LIMIT = int(os.getenv("TYPEAHEAD_SCAN_LIMIT", "50000"))
+
+# Ограничение одновременных запросов к БД по группам маршрутов (read,
+# write, bulk). Вместо ожидания дольше бюджета — 503 с Retry-After
+ADMISSION_ENABLED = _env_bool("ADMISSION_ENABLED", True)
+ADMISSION_CAPACITY = int(
+    os.getenv("ADMISSION_CAPACITY", str(DB_POOL_SIZE + DB_MAX_OVERFLOW))
+)
+ADMISSION_BULK_LIMIT = int(os.getenv("ADMISSION_BULK_LIMIT", "2"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "100"))
+# сколько секунд запрос группы может ждать свободного места
+ADMISSION_READ_BUDGET = float(os.getenv("ADMISSION_READ_BUDGET", "2"))
+ADMISSION_WRITE_BUDGET = float(os.getenv("ADMISSION_WRITE_BUDGET", "5"))
+ADMISSION_BULK_BUDGET = float(os.getenv("ADMISSION_BULK_BUDGET", "1"))
+
+# Ежедневный снимок агрегатов в daily_stats (GET /vpn/stats/daily).
+# Строка за сегодня пересчитывается не чаще раза в SNAPSHOT_INTERVAL
+SNAPSHOT_ENABLED = _env_bool("SNAPSHOT_ENABLED", True)
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "3600"))
+SNAPSHOT_MAX_RANGE_DAYS = int(os.getenv("SNAPSHOT_MAX_RANGE_DAYS", "3660"))
+
+# Проверка ревизии схемы при старте: strict — не стартовать, warn — лог
+DB_SCHEMA_CHECK = os.getenv("DB_SCHEMA_CHECK", "strict")
+
 LOGIN = os.getenv("LOGIN")
 
 USERS_DICT = {
@@ -1,6 +1,10 @@
+import asyncio
+import logging
+import time
 from abc import ABC, abstractmethod
 from typing import Optional
 
+from sqlalchemy import event, text
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
     AsyncSession,
@@ -8,18 +12,168 @@ from sqlalchemy.ext.asyncio import (
     create_async_engine,
 )
 
+from config import (
+    DB_COMMAND_TIMEOUT,
+    DB_CONNECT_TIMEOUT,
+    DB_MAX_OVERFLOW,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_PREPARED_STATEMENT_CACHE_SIZE,
+    DB_QUERY_CACHE_SIZE,
+    METRICS_ENABLED,
+    REPLICA_CHECK_INTERVAL,
+    REPLICA_MAX_LAG,
+    REPLICA_STICKY_SECONDS,
+    SLOW_QUERY_ENABLED,
+)
+from database.slow_queries import slow_query_log
+from metrics import TimedQueuePool, instrument_engine
+
+logger = logging.getLogger(__name__)
+
+# db_url -> engine; пул создаётся один раз на процесс
+_engines: dict[str, AsyncEngine] = {}
+# (primary_url, replica_url) -> ReplicaRouter
+_replicas: dict[tuple[str, str], "ReplicaRouter"] = {}
+
+# Отставание реплики в секундах; 0, если всё полученное уже применено
+# (иначе на простаивающем primary отставание росло бы само по себе)
+REPLICA_LAG_SQL = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+    "THEN 0 ELSE COALESCE(EXTRACT(EPOCH FROM "
+    "now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+def get_engine(db_url: str, echo: bool = False) -> AsyncEngine:
+    engine = _engines.get(db_url)
+    if engine is None:
+        pool_options = {}
+        if METRICS_ENABLED:
+            pool_options["poolclass"] = TimedQueuePool
+        engine = create_async_engine(
+            db_url,
+            echo=echo,
+            **pool_options,
+            pool_pre_ping=True,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_timeout=DB_POOL_TIMEOUT,
+            query_cache_size=DB_QUERY_CACHE_SIZE,
+            connect_args={
+                "timeout": DB_CONNECT_TIMEOUT,
+                "command_timeout": DB_COMMAND_TIMEOUT,
+                "prepared_statement_cache_size": (
+                    DB_PREPARED_STATEMENT_CACHE_SIZE
+                ),
+            },
+        )
+        if METRICS_ENABLED:
+            instrument_engine(engine)
+        if SLOW_QUERY_ENABLED:
+            slow_query_log.attach(engine)
+        _engines[db_url] = engine
+    return engine
+
+
+class ReplicaRouter:
+    """Решает, можно ли сейчас читать с реплики.
+
+    Нельзя, если процесс писал в primary последние sticky_seconds
+    (read-your-writes), если реплика недоступна или отстаёт больше
+    max_lag. Состояние реплики проверяется не чаще check_interval
+    секунд; пока идёт проверка, используется прошлый результат.
+    """
+
+    def __init__(
+        self,
+        primary: AsyncEngine,
+        replica: AsyncEngine,
+        sticky_seconds: float = REPLICA_STICKY_SECONDS,
+        max_lag: float = REPLICA_MAX_LAG,
+        check_interval: float = REPLICA_CHECK_INTERVAL,
+    ):
+        self.replica = replica
+        self.session_factory = async_sessionmaker(
+            replica, class_=AsyncSession, expire_on_commit=False
+        )
+        self.sticky_seconds = sticky_seconds
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.last_write = float("-inf")
+        self.checked_at = float("-inf")
+        self.healthy = False
+        self.lag: float | None = None
+        self._lock = asyncio.Lock()
+        event.listen(primary.sync_engine, "commit", self._on_commit)
+
+    def _on_commit(self, conn) -> None:
+        self.last_write = time.monotonic()
+
+    async def available(self) -> bool:
+        now = time.monotonic()
+        if now - self.last_write < self.sticky_seconds:
+            return False
+        if now - self.checked_at >= self.check_interval:
+            if not self._lock.locked():
+                async with self._lock:
+                    await self._check()
+        return self.healthy
+
+    async def _check(self) -> None:
+        try:
+            async with self.replica.connect() as conn:
+                lag = await conn.scalar(REPLICA_LAG_SQL)
+            self.lag = float(lag)
+            self.healthy = self.lag <= self.max_lag
+            if not self.healthy:
+                logger.warning("replica lag %.1fs, reading primary", lag)
+        except Exception as e:
+            logger.warning("replica unavailable, reading primary: %s", e)
+            self.lag = None
+            self.healthy = False
+        finally:
+            self.checked_at = time.monotonic()
+
+
+def get_replica_router(db_url: str, replica_url: str) -> ReplicaRouter:
+    router = _replicas.get((db_url, replica_url))
+    if router is None:
+        router = ReplicaRouter(get_engine(db_url), get_engine(replica_url))
+        _replicas[(db_url, replica_url)] = router
+    return router
+
+
+async def dispose_engines() -> None:
+    _replicas.clear()
+    while _engines:
+        _, engine = _engines.popitem()
+        await engine.dispose()
+
 
 class AbstractDatabase(ABC):
     engine: Optional[AsyncEngine] = None
     session_factory: Optional[async_sessionmaker[AsyncSession]] = None
 
-    def __init__(self, db_url: str, echo: bool = False):
-        self.engine = create_async_engine(
-            db_url, echo=echo, pool_pre_ping=True
-        )
+    replica: Optional[ReplicaRouter] = None
+
+    def __init__(
+        self, db_url: str, echo: bool = False, replica_url: str | None = None
+    ):
+        self.engine = get_engine(db_url, echo=echo)
         self.session_factory = async_sessionmaker(
             self.engine, class_=AsyncSession, expire_on_commit=False
         )
+        if replica_url:
+            self.replica = get_replica_router(db_url, replica_url)
+
+    async def read_session_factory(self) -> async_sessionmaker[AsyncSession]:
+        """Фабрика сессий только для чтения: реплика, если она годится."""
+        if self.replica is not None and await self.replica.available():
+            return self.replica.session_factory
+        return self.session_factory
 
     @abstractmethod
     async def get_session(self):
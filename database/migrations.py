@@ -0,0 +1,153 @@
+import logging
+import re
+from dataclasses import dataclass
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+VERSION_TABLE = "schema_version"
+
+# произвольный ключ advisory-lock: миграции не запускаются параллельно
+MIGRATION_LOCK_ID = 7_346_112
+
+CONCURRENT_INDEX = re.compile(
+    r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS"
+    r"\s+(\w+)",
+    re.IGNORECASE,
+)
+
+
+class SchemaMismatchError(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class Migration:
+    """Одна ревизия схемы: набор SQL-команд, применяемых по порядку.
+
+    transactional=False нужен для CREATE INDEX CONCURRENTLY: такие
+    команды выполняются в autocommit и должны быть идемпотентными
+    (IF NOT EXISTS), чтобы оборванную миграцию можно было повторить.
+    Прерванный CREATE INDEX CONCURRENTLY оставляет индекс INVALID,
+    который IF NOT EXISTS молча пропустил бы; перед такой командой
+    MigrationRunner удаляет невалидный индекс с тем же именем.
+    """
+
+    revision: str
+    description: str
+    statements: tuple[str, ...]
+    transactional: bool = True
+
+
+class MigrationRunner:
+    def __init__(self, engine: AsyncEngine, migrations: list[Migration]):
+        self.engine = engine
+        self.migrations = migrations
+
+    @property
+    def head(self) -> str | None:
+        return self.migrations[-1].revision if self.migrations else None
+
+    async def _ensure_version_table(self, conn: AsyncConnection) -> None:
+        await conn.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} ("
+                "revision VARCHAR(64) PRIMARY KEY, "
+                "applied_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+            )
+        )
+
+    async def applied_revisions(self) -> set[str]:
+        async with self.engine.connect() as conn:
+            exists = await conn.scalar(
+                text("SELECT to_regclass(:name)"), {"name": VERSION_TABLE}
+            )
+            if exists is None:
+                return set()
+            rows = await conn.execute(
+                text(f"SELECT revision FROM {VERSION_TABLE}")
+            )
+            return {r.revision for r in rows}
+
+    async def pending(self) -> list[Migration]:
+        applied = await self.applied_revisions()
+        return [m for m in self.migrations if m.revision not in applied]
+
+    async def upgrade(self, target: str | None = None) -> list[str]:
+        """Применяет недостающие ревизии до target включительно."""
+        revisions = [m.revision for m in self.migrations]
+        if target is not None and target not in revisions:
+            raise ValueError(f"Unknown revision {target}")
+        last = revisions.index(target) if target else len(revisions) - 1
+        wanted = set(revisions[: last + 1])
+
+        done = []
+        async with self.engine.connect() as lock_conn:
+            lock_conn = await lock_conn.execution_options(
+                isolation_level="AUTOCOMMIT"
+            )
+            await lock_conn.execute(
+                text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID}
+            )
+            try:
+                await self._ensure_version_table(lock_conn)
+                for migration in await self.pending():
+                    if migration.revision not in wanted:
+                        break
+                    await self._apply(migration)
+                    done.append(migration.revision)
+            finally:
+                await lock_conn.execute(
+                    text("SELECT pg_advisory_unlock(:id)"),
+                    {"id": MIGRATION_LOCK_ID},
+                )
+        return done
+
+    async def _apply(self, migration: Migration) -> None:
+        logger.info(
+            "applying migration %s: %s",
+            migration.revision,
+            migration.description,
+        )
+        mark = text(f"INSERT INTO {VERSION_TABLE} (revision) VALUES (:rev)")
+
+        if migration.transactional:
+            async with self.engine.begin() as conn:
+                for statement in migration.statements:
+                    await conn.execute(text(statement))
+                await conn.execute(mark, {"rev": migration.revision})
+            return
+
+        async with self.engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            for statement in migration.statements:
+                match = CONCURRENT_INDEX.search(statement)
+                if match:
+                    await self._drop_invalid_index(conn, match.group(1))
+                await conn.execute(text(statement))
+            await conn.execute(mark, {"rev": migration.revision})
+
+    async def _drop_invalid_index(
+        self, conn: AsyncConnection, name: str
+    ) -> None:
+        valid = await conn.scalar(
+            text(
+                "SELECT indisvalid FROM pg_index "
+                "WHERE indexrelid = to_regclass(:name)"
+            ),
+            {"name": name},
+        )
+        if valid is False:
+            logger.warning("dropping invalid index %s before rebuild", name)
+            await conn.execute(text(f"DROP INDEX CONCURRENTLY {name}"))
+
+    async def check(self) -> None:
+        pending = await self.pending()
+        if pending:
+            revisions = ", ".join(m.revision for m in pending)
+            raise SchemaMismatchError(
+                f"Database schema is behind {self.head}; "
+                f"pending migrations: {revisions}"
+            )
@@ -0,0 +1,173 @@
+"""Журнал медленных SQL-запросов.
+
+Включается SLOW_QUERY_ENABLED: каждый запрос дольше порога попадает
+в кольцевой буфер вместе с маршрутом, который его выполнил. Значения
+параметров не сохраняются — только их типы и размеры.
+"""
+
+import asyncio
+import logging
+import re
+import time
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from config import (
+    SLOW_QUERY_BUFFER,
+    SLOW_QUERY_EXPLAIN,
+    SLOW_QUERY_THRESHOLD_MS,
+)
+
+logger = logging.getLogger(__name__)
+
+# ASGI scope текущего запроса; ставит RequestContextMiddleware
+current_scope: ContextVar[dict | None] = ContextVar(
+    "current_scope", default=None
+)
+
+# запросы самого журнала не записываются
+SKIP_OPTION = "slow_query_skip"
+
+_WHITESPACE = re.compile(r"\s+")
+_PARAM_LIST = re.compile(r"\$\d+(?:\s*,\s*\$\d+)+")
+
+
+def normalize_sql(statement: str) -> str:
+    statement = _WHITESPACE.sub(" ", statement).strip()
+    # IN ($1, $2, ...) разной длины — один и тот же запрос
+    return _PARAM_LIST.sub("$n, ...", statement)
+
+
+def redact(parameters) -> list[str] | dict[str, str] | None:
+    def describe(value) -> str:
+        kind = type(value).__name__
+        if isinstance(value, (str, bytes, list, tuple)):
+            return f"{kind}[{len(value)}]"
+        return kind
+
+    if parameters is None:
+        return None
+    if isinstance(parameters, dict):
+        return {k: describe(v) for k, v in parameters.items()}
+    return [describe(v) for v in parameters]
+
+
+def _route() -> str | None:
+    scope = current_scope.get()
+    if scope is None:
+        return None
+    route = scope.get("route")
+    path = route.path if route is not None else scope.get("path")
+    return f"{scope.get('method')} {path}"
+
+
+@dataclass
+class SlowQuery:
+    at: float
+    duration_ms: float
+    sql: str
+    params: list[str] | dict[str, str] | None
+    route: str | None
+    plan: str | None = None
+
+
+class SlowQueryLog:
+    """Кольцевой буфер медленных запросов и хуки движка для него.
+
+    С explain=True для медленных SELECT в фоне снимается
+    EXPLAIN (ANALYZE, BUFFERS) на отдельном соединении. ANALYZE заново
+    выполняет запрос, поэтому одновременно идёт не больше одного
+    EXPLAIN, а запросы с записью и FOR UPDATE не повторяются.
+    """
+
+    def __init__(
+        self,
+        threshold_ms: float = SLOW_QUERY_THRESHOLD_MS,
+        maxlen: int = SLOW_QUERY_BUFFER,
+        explain: bool = SLOW_QUERY_EXPLAIN,
+    ):
+        self.threshold = threshold_ms / 1000
+        self.explain = explain
+        self.records: deque[SlowQuery] = deque(maxlen=maxlen)
+        self._explain_task: asyncio.Task | None = None
+
+    def attach(self, engine: AsyncEngine) -> None:
+        sync_engine = engine.sync_engine
+
+        @event.listens_for(sync_engine, "before_cursor_execute")
+        def _before(conn, cursor, statement, parameters, context, many):
+            conn.info.setdefault("slow_query_start", []).append(
+                time.perf_counter()
+            )
+
+        @event.listens_for(sync_engine, "after_cursor_execute")
+        def _after(conn, cursor, statement, parameters, context, many):
+            start = conn.info["slow_query_start"].pop()
+            elapsed = time.perf_counter() - start
+            if elapsed < self.threshold or (
+                context is not None
+                and context.execution_options.get(SKIP_OPTION)
+            ):
+                return
+            self._record(engine, statement, parameters, elapsed)
+
+        @event.listens_for(sync_engine, "handle_error")
+        def _error(context):
+            conn = context.connection
+            if conn is not None and conn.info.get("slow_query_start"):
+                conn.info["slow_query_start"].pop()
+
+    def _record(self, engine, statement, parameters, elapsed) -> None:
+        record = SlowQuery(
+            at=time.time(),
+            duration_ms=round(elapsed * 1000, 2),
+            sql=normalize_sql(statement),
+            params=redact(parameters),
+            route=_route(),
+        )
+        self.records.append(record)
+        logger.warning(
+            "slow query %.1f ms (%s): %.200s",
+            record.duration_ms,
+            record.route,
+            record.sql,
+        )
+
+        if self.explain and self._explainable(record.sql):
+            self._explain_task = asyncio.get_running_loop().create_task(
+                self._explain(engine, record, statement, parameters)
+            )
+
+    def _explainable(self, sql: str) -> bool:
+        # WITH может содержать UPDATE/DELETE, поэтому только SELECT
+        sql = sql.upper()
+        return (
+            (self._explain_task is None or self._explain_task.done())
+            and sql.startswith("SELECT")
+            and " FOR UPDATE" not in sql
+        )
+
+    async def _explain(self, engine, record, statement, parameters):
+        try:
+            async with engine.connect() as conn:
+                conn = await conn.execution_options(**{SKIP_OPTION: True})
+                result = await conn.exec_driver_sql(
+                    "EXPLAIN (ANALYZE, BUFFERS) " + statement, parameters
+                )
+                record.plan = "\n".join(row[0] for row in result)
+                await conn.rollback()
+        except Exception as e:
+            record.plan = f"EXPLAIN failed: {e}"
+
+    def snapshot(self) -> list[dict]:
+        return [asdict(r) for r in reversed(self.records)]
+
+    def clear(self) -> None:
+        self.records.clear()
+
+
+slow_query_log = SlowQueryLog()
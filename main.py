@@ -1,16 +1,93 @@
-from fastapi import FastAPI
-from fastapi.responses import RedirectResponse
-from fastapi.staticfiles import StaticFiles
+import hmac
+import logging
+from contextlib import asynccontextmanager
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, RedirectResponse
 
 from auth.router import router as auth_router
+from config import (
+    BROADCAST_CONCURRENCY,
+    DB_SCHEMA_CHECK,
+    LIVE_UPDATES_ENABLED,
+    METRICS_TOKEN,
+    SNAPSHOT_ENABLED,
+    SWEEPER_ENABLED,
+    TELEGRAM_TIMEOUT,
+    TYPEAHEAD_ENABLED,
+)
+from database.db import dispose_engines
+from database.migrations import SchemaMismatchError
+from metrics import render as render_metrics
 from middleware import setup_middlewares
+from static_assets import CompressedStaticFiles, static_dir
+from vpn.broadcast import BroadcastManager
+from vpn.db_services import VPNDatabase
+from vpn.live import ChangeFeed
+from vpn.migrations import get_runner
 from vpn.routers import router as vpn_router
+from vpn.snapshots import DailySnapshots
+from vpn.sweeper import ExpirySweeper
+from vpn.typeahead import UserTypeahead
+
+logger = logging.getLogger(__name__)
+
+
+async def check_schema() -> None:
+    if DB_SCHEMA_CHECK == "off":
+        return
+    try:
+        await get_runner().check()
+    except SchemaMismatchError:
+        if DB_SCHEMA_CHECK == "strict":
+            raise
+        logger.exception("run `python -m vpn.migrations upgrade`")
+
 
-app = FastAPI(title="DashboardVPN API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await check_schema()
+    app.state.vpn_db = VPNDatabase()
+    telegram_client = httpx.AsyncClient(
+        timeout=TELEGRAM_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=BROADCAST_CONCURRENCY,
+            max_keepalive_connections=BROADCAST_CONCURRENCY,
+        ),
+    )
+    app.state.broadcasts = BroadcastManager(telegram_client)
+    app.state.sweeper = ExpirySweeper(app.state.vpn_db)
+    if SWEEPER_ENABLED:
+        app.state.sweeper.start()
+    app.state.snapshots = DailySnapshots(app.state.vpn_db)
+    if SNAPSHOT_ENABLED:
+        app.state.snapshots.start()
+    app.state.change_feed = ChangeFeed()
+    if LIVE_UPDATES_ENABLED:
+        app.state.change_feed.start()
+    app.state.typeahead = UserTypeahead(
+        app.state.vpn_db, app.state.change_feed
+    )
+    if TYPEAHEAD_ENABLED:
+        app.state.typeahead.start()
+    yield
+    await app.state.typeahead.stop()
+    await app.state.change_feed.stop()
+    await app.state.snapshots.stop()
+    await app.state.sweeper.stop()
+    await app.state.broadcasts.close()
+    await telegram_client.aclose()
+    await dispose_engines()
+
+
+app = FastAPI(title="DashboardVPN API", lifespan=lifespan)
 
 setup_middlewares(app)
 
-app.mount("/static", StaticFiles(directory="frontend/static"), name="static")
+app.mount(
+    "/static", CompressedStaticFiles(directory=static_dir()), name="static"
+)
 
 app.include_router(auth_router)
 app.include_router(vpn_router)
@@ -19,3 +96,14 @@ app.include_router(vpn_router)
 @app.get("/")
 async def root():
     return RedirectResponse(url="/auth/login")
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    if METRICS_TOKEN and not hmac.compare_digest(
+        request.headers.get("authorization", ""), f"Bearer {METRICS_TOKEN}"
+    ):
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return PlainTextResponse(
+        render_metrics(), media_type="text/plain; version=0.0.4"
+    )
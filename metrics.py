@@ -0,0 +1,363 @@
+"""Метрики процесса в текстовом формате Prometheus.
+
+Счётчики живут в памяти процесса и отдаются через GET /metrics.
+Пишутся из одного потока event loop (события SQLAlchemy и пула
+вызываются в нём же), поэтому обходятся без блокировок.
+"""
+
+import re
+import time
+import weakref
+from bisect import bisect_left
+from typing import Callable, Iterable
+
+from sqlalchemy import event
+from sqlalchemy.engine import default
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.util import LRUCache
+
+# границы гистограмм, секунды
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)  # fmt: skip
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [
+        f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.label_names = tuple(labels)
+
+    def header(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.doc}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, doc, labels=()):
+        super().__init__(name, doc, labels)
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        return self.header() + [
+            f"{self.name}{_labels(self.label_names, k)} {v}"
+            for k, v in self.values.items()
+        ]
+
+
+class Gauge(Counter):
+    """Значение задаётся явно или считается callback при каждом сборе."""
+
+    kind = "gauge"
+
+    def __init__(self, name, doc, labels=(), callback=None):
+        super().__init__(name, doc, labels)
+        self.callback: Callable[[], dict[tuple, float]] | None = callback
+
+    def set(self, *labels, value: float) -> None:
+        self.values[labels] = value
+
+    def dec(self, *labels, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def render(self) -> list[str]:
+        if self.callback is not None:
+            self.values = self.callback()
+        return super().render()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, doc, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(buckets)
+        # labels -> [счётчики по корзинам..., +Inf], сумма
+        self.values: dict[tuple, tuple[list[int], list[float]]] = {}
+
+    def observe(self, *labels, value: float) -> None:
+        item = self.values.get(labels)
+        if item is None:
+            item = self.values[labels] = ([0] * (len(self.buckets) + 1), [0])
+        item[0][bisect_left(self.buckets, value)] += 1
+        item[1][0] += value
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = _labels(self.label_names, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            plain = _labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{plain} {total[0]}")
+            lines.append(f"{self.name}_count{plain} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list[_Metric] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.register(
+    Counter(
+        "http_requests_total",
+        "HTTP requests by route and status.",
+        ("method", "route", "status"),
+    )
+)
+HTTP_LATENCY = REGISTRY.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "HTTP request latency by route.",
+        ("method", "route"),
+    )
+)
+HTTP_IN_FLIGHT = REGISTRY.register(
+    Gauge("http_requests_in_flight", "HTTP requests being processed.")
+)
+
+DB_STATEMENTS = REGISTRY.register(
+    Histogram(
+        "db_statement_duration_seconds",
+        "SQL statement execution time by kind.",
+        ("operation",),
+    )
+)
+DB_ERRORS = REGISTRY.register(
+    Counter(
+        "db_statement_errors_total",
+        "SQL statements that raised an error.",
+        ("operation",),
+    )
+)
+DB_COMPILED_CACHE = REGISTRY.register(
+    Counter(
+        "db_compiled_cache_total",
+        "SQL compilation cache lookups by result.",
+        ("result",),
+    )
+)
+DB_PREPARED_CACHE = REGISTRY.register(
+    Counter(
+        "db_prepared_statement_cache_total",
+        "asyncpg prepared statement cache lookups by result.",
+        ("result",),
+    )
+)
+DB_POOL_WAIT = REGISTRY.register(
+    Histogram(
+        "db_pool_wait_seconds",
+        "Time to get a connection from the pool, including connect.",
+    )
+)
+
+ADMISSION_ACTIVE = REGISTRY.register(
+    Gauge(
+        "admission_active_requests",
+        "Requests holding an admission slot by route group.",
+        ("group",),
+    )
+)
+ADMISSION_QUEUE = REGISTRY.register(
+    Gauge(
+        "admission_queue_depth",
+        "Requests waiting for an admission slot by route group.",
+        ("group",),
+    )
+)
+ADMISSION_REJECTED = REGISTRY.register(
+    Counter(
+        "admission_rejected_total",
+        "Requests shed with 503 by route group and reason.",
+        ("group", "reason"),
+    )
+)
+
+TELEGRAM_LATENCY = REGISTRY.register(
+    Histogram(
+        "telegram_request_duration_seconds",
+        "Telegram Bot API call latency.",
+        ("method",),
+    )
+)
+TELEGRAM_REQUESTS = REGISTRY.register(
+    Counter(
+        "telegram_requests_total",
+        "Telegram Bot API calls by HTTP status (error: no response).",
+        ("method", "status"),
+    )
+)
+
+# engine.url -> engine, для статистики пулов при сборе
+_instrumented: dict[str, AsyncEngine] = {}
+
+
+def _pool_stats() -> dict[tuple, float]:
+    values = {}
+    for url, engine in _instrumented.items():
+        pool = engine.sync_engine.pool
+        values[(url, "size")] = pool.size()
+        values[(url, "checked_out")] = pool.checkedout()
+        values[(url, "overflow")] = max(pool.overflow(), 0)
+        values[(url, "idle")] = pool.checkedin()
+    return values
+
+
+REGISTRY.register(
+    Gauge(
+        "db_pool_connections",
+        "Connection pool state by database.",
+        ("database", "state"),
+        callback=_pool_stats,
+    )
+)
+
+
+# ExecutionContext.cache_hit -> метка
+_CACHE_RESULTS = {
+    default.CACHE_HIT: "hit",
+    default.CACHE_MISS: "miss",
+    default.CACHING_DISABLED: "disabled",
+    default.NO_CACHE_KEY: "uncacheable",
+    default.NO_DIALECT_SUPPORT: "unsupported",
+}
+
+
+class CountingStatementCache(LRUCache):
+    """LRU подготовленных запросов asyncpg со счётчиком попаданий.
+
+    Адаптер asyncpg в SQLAlchemy проверяет кэш через `in` перед каждым
+    выполнением; промах означает лишний round trip на PREPARE.
+    """
+
+    # по идентичности: кэши соединений лежат в WeakSet
+    __hash__ = object.__hash__
+
+    def __contains__(self, key) -> bool:
+        found = super().__contains__(key)
+        DB_PREPARED_CACHE.inc("hit" if found else "miss")
+        return found
+
+
+# кэши живых соединений: database -> кэши
+_statement_caches: dict[str, weakref.WeakSet] = {}
+
+
+def _statement_cache_stats() -> dict[tuple, float]:
+    values = {}
+    for url, caches in _statement_caches.items():
+        caches = list(caches)
+        values[(url, "cached")] = sum(len(c) for c in caches)
+        values[(url, "capacity")] = sum(c.capacity for c in caches)
+    return values
+
+
+REGISTRY.register(
+    Gauge(
+        "db_prepared_statements",
+        "Prepared statements cached on open connections.",
+        ("database", "state"),
+        callback=_statement_cache_stats,
+    )
+)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Пул, замеряющий ожидание свободного соединения."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT.observe(value=time.perf_counter() - start)
+
+
+_OPERATION = re.compile(r"\s*(\w+)")
+
+
+def _operation(statement: str) -> str:
+    match = _OPERATION.match(statement)
+    return match[1].upper() if match else "OTHER"
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Время и ошибки SQL-запросов, попадания в кэши запросов."""
+    sync_engine = engine.sync_engine
+    url = engine.url.render_as_string(hide_password=True)
+    _instrumented[url] = engine
+    caches = _statement_caches.setdefault(url, weakref.WeakSet())
+
+    @event.listens_for(sync_engine, "connect")
+    def _connect(dbapi_connection, connection_record):
+        # приватный атрибут адаптера asyncpg; нет его — нет и счётчиков
+        cache = getattr(dbapi_connection, "_prepared_statement_cache", None)
+        if cache is not None:
+            counting = CountingStatementCache(cache.capacity)
+            dbapi_connection._prepared_statement_cache = counting
+            caches.add(counting)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info["query_start"].pop()
+        DB_STATEMENTS.observe(
+            _operation(statement), value=time.perf_counter() - start
+        )
+        if context is not None:
+            DB_COMPILED_CACHE.inc(
+                _CACHE_RESULTS.get(context.cache_hit, "unknown")
+            )
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(context):
+        conn = context.connection
+        if conn is not None and conn.info.get("query_start"):
+            conn.info["query_start"].pop()
+        DB_ERRORS.inc(_operation(context.statement or ""))
+
+
+def render() -> str:
+    return REGISTRY.render()
@@ -1,8 +1,382 @@
+import asyncio
+import gzip
+import math
+import re
+import time
+from collections import deque
+from dataclasses import dataclass
+
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.datastructures import Headers, MutableHeaders
 from starlette.middleware.sessions import SessionMiddleware
+from starlette.responses import JSONResponse
+
+from config import (
+    ADMISSION_BULK_BUDGET,
+    ADMISSION_BULK_LIMIT,
+    ADMISSION_CAPACITY,
+    ADMISSION_ENABLED,
+    ADMISSION_MAX_QUEUE,
+    ADMISSION_READ_BUDGET,
+    ADMISSION_WRITE_BUDGET,
+    GZIP_MIN_SIZE,
+    METRICS_ENABLED,
+    SLOW_QUERY_ENABLED,
+)
+from database.slow_queries import current_scope
+from metrics import (
+    ADMISSION_ACTIVE,
+    ADMISSION_QUEUE,
+    ADMISSION_REJECTED,
+    HTTP_IN_FLIGHT,
+    HTTP_LATENCY,
+    HTTP_REQUESTS,
+)
+from static_assets import accepted_encodings
+
+GZIP_CONTENT_TYPES = {"application/json", "text/html"}
+
+
+class GZipJSONMiddleware:
+    """Сжимает gzip ответы JSON и HTML размером от minimum_size байт.
+
+    Сжимается только тело, пришедшее одним сообщением: потоковые
+    ответы (экспорт) и ответы с Content-Encoding проходят как есть.
+    """
+
+    def __init__(self, app, minimum_size: int = GZIP_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accepts_gzip = "gzip" in accepted_encodings(
+            Headers(scope=scope).get("accept-encoding", "")
+        )
+        start_message = None
+
+        async def send_gzip(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(raw=message["headers"])
+                content_type = headers.get("content-type", "").split(";")[0]
+                if (
+                    content_type in GZIP_CONTENT_TYPES
+                    and "content-encoding" not in headers
+                ):
+                    # Vary и на несжатом ответе: иначе общий кэш отдаст
+                    # его и тем, кто принимает gzip
+                    headers.add_vary_header("Accept-Encoding")
+                    if accepts_gzip:
+                        start_message = message
+                        return
+            elif start_message is not None:
+                pending, start_message = start_message, None
+                body = message.get("body", b"")
+                if not message.get("more_body") and (
+                    len(body) >= self.minimum_size
+                ):
+                    body = gzip.compress(body, compresslevel=6)
+                    headers = MutableHeaders(raw=pending["headers"])
+                    headers["Content-Encoding"] = "gzip"
+                    headers["Content-Length"] = str(len(body))
+                    message = {**message, "body": body}
+                await send(pending)
+            await send(message)
+
+        await self.app(scope, receive, send_gzip)
+
+
+class MetricsMiddleware:
+    """Время, статус и число одновременных запросов по шаблону пути.
+
+    Метка route — шаблон маршрута (/vpn/links/{link_id}) или префикс
+    смонтированного приложения, чтобы не плодить метки на каждый id.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        HTTP_IN_FLIGHT.set(value=0)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        root_path = scope.get("root_path", "")
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_IN_FLIGHT.dec()
+            route = scope.get("route")
+            if route is not None:
+                label = route.path
+            elif scope.get("root_path", "") != root_path:
+                label = scope["root_path"]
+            else:
+                label = "unmatched"
+            method = scope["method"]
+            HTTP_REQUESTS.inc(method, label, str(status))
+            HTTP_LATENCY.observe(method, label, value=elapsed)
+
+
+class RequestContextMiddleware:
+    """Делает scope запроса доступным журналу медленных запросов."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = current_scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_scope.reset(token)
+
+
+@dataclass
+class RouteGroup:
+    name: str
+    # меньше — важнее: освободившееся место достаётся ей первой
+    priority: int
+    limit: int
+    # сколько секунд можно ждать места, прежде чем ответить 503
+    budget: float
+    max_queue: int = ADMISSION_MAX_QUEUE
+    active: int = 0
+    admitted: int = 0
+    # скользящее среднее времени обработки, для оценки ожидания
+    service_time: float = 0.0
+
+    def __post_init__(self):
+        self.waiters: deque[asyncio.Future] = deque()
+        self.rejected: dict[str, int] = {}
+
+
+def default_route_groups() -> list[RouteGroup]:
+    return [
+        RouteGroup("read", 0, ADMISSION_CAPACITY, ADMISSION_READ_BUDGET),
+        RouteGroup("write", 1, ADMISSION_CAPACITY, ADMISSION_WRITE_BUDGET),
+        RouteGroup("bulk", 2, ADMISSION_BULK_LIMIT, ADMISSION_BULK_BUDGET),
+    ]
+
+
+# (методы, путь, группа): первое совпадение; группа None — без
+# ограничений (SSE, подсказки из памяти, статусы без БД)
+ADMISSION_RULES = [
+    (None, r"/vpn/(events|users/typeahead|slow_queries|admission)", None),
+    ({"GET"}, r"/vpn/(send_message/[^/]+|sweeper|stats/daily/job)$", None),
+    (
+        None,
+        r"/vpn/(export/|links/import|links/bulk|users/bulk_delete"
+        r"|send_message$|sweeper/run|stats/daily/run)",
+        "bulk",
+    ),
+    ({"GET", "HEAD"}, r"/vpn(/|$)", "read"),
+    (None, r"/vpn(/|$)", "write"),
+]
+
+
+class AdmissionController:
+    """Пускает к БД не больше capacity запросов, остальные ждут очереди.
+
+    У каждой группы свой предел одновременных запросов и бюджет
+    ожидания. Запрос, который по оценке не дождётся места в бюджет,
+    или очередь которого уже полна, сразу получает 503; дождавшийся
+    бюджета без места — тоже. Освободившееся место отдаётся группе с
+    меньшим priority: чтение впереди записи, запись впереди bulk.
+    """
+
+    def __init__(self, capacity: int, groups: list[RouteGroup]):
+        self.capacity = capacity
+        self.groups = {g.name: g for g in groups}
+        self._by_priority = sorted(groups, key=lambda g: g.priority)
+        self.active = 0
+
+    def _has_room(self, group: RouteGroup) -> bool:
+        return self.active < self.capacity and group.active < group.limit
+
+    def _waiting_ahead(self, group: RouteGroup) -> int:
+        return sum(
+            len(g.waiters)
+            for g in self._by_priority
+            if g.priority <= group.priority
+        )
+
+    def estimated_wait(self, group: RouteGroup) -> float:
+        slots = max(min(group.limit, self.capacity), 1)
+        return (self._waiting_ahead(group) + 1) / slots * group.service_time
+
+    def _enter(self, group: RouteGroup) -> None:
+        self.active += 1
+        group.active += 1
+        group.admitted += 1
+        ADMISSION_ACTIVE.set(group.name, value=group.active)
+
+    def _reject(self, group: RouteGroup, reason: str) -> str:
+        group.rejected[reason] = group.rejected.get(reason, 0) + 1
+        ADMISSION_REJECTED.inc(group.name, reason)
+        return reason
+
+    async def acquire(self, group: RouteGroup) -> str | None:
+        """None — место получено, иначе причина отказа."""
+        if self._has_room(group) and not self._waiting_ahead(group):
+            self._enter(group)
+            return None
+        if len(group.waiters) >= group.max_queue:
+            return self._reject(group, "queue_full")
+        if self.estimated_wait(group) > group.budget:
+            return self._reject(group, "budget")
+
+        waiter = asyncio.get_running_loop().create_future()
+        group.waiters.append(waiter)
+        ADMISSION_QUEUE.set(group.name, value=len(group.waiters))
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), group.budget)
+            return None
+        except asyncio.TimeoutError:
+            if waiter.done():
+                # место выдали в момент таймаута: пользуемся им
+                return None
+            waiter.cancel()
+            return self._reject(group, "timeout")
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(group, group.service_time)
+            waiter.cancel()
+            raise
+        finally:
+            if waiter in group.waiters:
+                group.waiters.remove(waiter)
+            ADMISSION_QUEUE.set(group.name, value=len(group.waiters))
+
+    def release(self, group: RouteGroup, elapsed: float) -> None:
+        self.active -= 1
+        group.active -= 1
+        group.service_time = 0.8 * group.service_time + 0.2 * elapsed
+        ADMISSION_ACTIVE.set(group.name, value=group.active)
+        self._wake()
+
+    def _wake(self) -> None:
+        for group in self._by_priority:
+            while group.waiters and self._has_room(group):
+                waiter = group.waiters.popleft()
+                if waiter.done():
+                    continue
+                self._enter(group)
+                waiter.set_result(None)
+            if group.waiters and self.active >= self.capacity:
+                return
+
+    def stats(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "active": self.active,
+            "groups": {
+                g.name: {
+                    "priority": g.priority,
+                    "limit": g.limit,
+                    "budget": g.budget,
+                    "active": g.active,
+                    "queued": len(g.waiters),
+                    "admitted": g.admitted,
+                    "service_time": round(g.service_time, 4),
+                    "rejected": dict(g.rejected),
+                }
+                for g in self._by_priority
+            },
+        }
+
+
+class AdmissionMiddleware:
+    """Применяет AdmissionController к запросам по ADMISSION_RULES.
+
+    Место держится до конца ответа, включая потоковую выгрузку: всё
+    это время запрос занимает соединение из пула.
+
+    Стоит внутри SessionMiddleware: запрос без входа в панель места не
+    получает и сразу уходит в роут, который отвечает 401/403 или
+    редиректом без БД. Иначе чужой клиент мог бы занять группу bulk
+    и оставить администраторов с 503.
+    """
+
+    def __init__(self, app, controller: AdmissionController, rules=None):
+        self.app = app
+        self.controller = controller
+        self.rules = [
+            (methods, re.compile(pattern), group)
+            for methods, pattern, group in (rules or ADMISSION_RULES)
+        ]
+
+    def classify(self, method: str, path: str) -> RouteGroup | None:
+        for methods, pattern, group in self.rules:
+            if (methods is None or method in methods) and pattern.match(path):
+                return self.controller.groups[group] if group else None
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        group = self.classify(scope["method"], scope["path"])
+        # та же проверка, что в _check_vpn_auth; подпись cookie уже
+        # проверил SessionMiddleware
+        session = scope.get("session") or {}
+        authorized = session.get("auth") and session.get("role") == "vpn"
+        if group is None or not authorized:
+            await self.app(scope, receive, send)
+            return
+
+        reason = await self.controller.acquire(group)
+        if reason is not None:
+            retry_after = max(
+                1, math.ceil(self.controller.estimated_wait(group))
+            )
+            response = JSONResponse(
+                {"detail": "Server is busy, retry later", "reason": reason},
+                status_code=503,
+                headers={"Retry-After": str(retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(group, time.perf_counter() - start)
 
 
 def setup_middlewares(app):
+    if ADMISSION_ENABLED:
+        app.state.admission = AdmissionController(
+            ADMISSION_CAPACITY, default_route_groups()
+        )
+        # внутренний: отказ всё равно проходит CORS, сессии и метрики
+        app.add_middleware(AdmissionMiddleware, controller=app.state.admission)
+
+    if SLOW_QUERY_ENABLED:
+        app.add_middleware(RequestContextMiddleware)
+
+    app.add_middleware(GZipJSONMiddleware)
+
     app.add_middleware(
         CORSMiddleware,
         allow_origins=[
@@ -20,3 +394,7 @@ def setup_middlewares(app):
         same_site="lax",
         https_only=False,
     )
+
+    # последний добавленный — внешний: меряем весь стек middleware
+    if METRICS_ENABLED:
+        app.add_middleware(MetricsMiddleware)
@@ -0,0 +1,26 @@
+"""Быстрая JSON-сериализация ответов через orjson.
+
+orjson кодирует тело в разы быстрее stdlib json и сам пишет даты в
+ISO 8601 и UUID строкой.
+"""
+
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse через dumps().
+
+    FastAPI всё равно прогоняет возвращённые dict через
+    jsonable_encoder; горячие эндпоинты возвращают этот ответ сами,
+    чтобы обойти и его.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
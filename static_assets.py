@@ -0,0 +1,175 @@
+"""Сборка и раздача статики.
+
+python -m static_assets копирует frontend/static в STATIC_BUILD_DIR:
+к каждому файлу добавляется копия с хэшем содержимого в имени,
+к текстовым — заранее сжатые .gz (и .br, если установлен brotli),
+а manifest.json связывает исходный путь с хэшированным.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import re
+import shutil
+from functools import lru_cache
+from pathlib import Path
+
+from starlette.datastructures import Headers
+from starlette.staticfiles import StaticFiles
+
+from config import STATIC_BUILD_DIR, STATIC_DIR
+
+try:
+    import brotli
+except ImportError:  # .br не собираются, отдаётся .gz
+    brotli = None
+
+MANIFEST = "manifest.json"
+STATIC_PREFIX = "/static/"
+
+COMPRESSIBLE = {".css", ".js", ".mjs", ".svg", ".json", ".html", ".txt"}
+MIN_COMPRESS_SIZE = 256
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+_HASHED_NAME = re.compile(r"\.[0-9a-f]{8}\.[^./]+$")
+_STATIC_REF = re.compile(re.escape(STATIC_PREFIX) + r"([\w./-]+)")
+
+
+@lru_cache
+def load_manifest() -> dict[str, str]:
+    path = Path(STATIC_BUILD_DIR) / MANIFEST
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def static_dir() -> str:
+    return STATIC_BUILD_DIR if load_manifest() else STATIC_DIR
+
+
+def static_url(path: str) -> str:
+    """URL файла для шаблонов: хэшированный, если статика собрана."""
+    return STATIC_PREFIX + load_manifest().get(path, path)
+
+
+def accepted_encodings(header: str) -> set[str]:
+    accepted = set()
+    for item in header.split(","):
+        name, *params = item.strip().split(";")
+        q = 1.0
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name and q > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+class CompressedStaticFiles(StaticFiles):
+    """StaticFiles, отдающий готовые .br/.gz по Accept-Encoding.
+
+    Файлы с хэшем в имени кэшируются навсегда (immutable), остальные
+    браузер перепроверяет по ETag.
+    """
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        full_path = str(full_path)
+        accepted = accepted_encodings(
+            Headers(scope=scope).get("accept-encoding", "")
+        )
+        encoding = None
+        for name, suffix in (("br", ".br"), ("gzip", ".gz")):
+            variant = Path(full_path + suffix)
+            if name in accepted and variant.is_file():
+                encoding = name
+                response = super().file_response(
+                    variant, variant.stat(), scope, status_code
+                )
+                break
+        else:
+            response = super().file_response(
+                full_path, stat_result, scope, status_code
+            )
+
+        if encoding is not None:
+            media_type, _ = mimetypes.guess_type(full_path)
+            media_type = media_type or "application/octet-stream"
+            if media_type.startswith("text/"):
+                media_type += "; charset=utf-8"
+            response.headers["Content-Type"] = media_type
+            response.headers["Content-Encoding"] = encoding
+        if Path(full_path).suffix in COMPRESSIBLE:
+            response.headers["Vary"] = "Accept-Encoding"
+        response.headers["Cache-Control"] = (
+            IMMUTABLE if _HASHED_NAME.search(full_path) else REVALIDATE
+        )
+        return response
+
+
+def _compress(path: Path, data: bytes) -> None:
+    variants = [(".gz", gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append((".br", brotli.compress(data)))
+    for suffix, compressed in variants:
+        # сжатие должно окупаться, иначе отдаём исходный файл
+        if len(compressed) < len(data) * 0.9:
+            path.with_name(path.name + suffix).write_bytes(compressed)
+
+
+def build(source: str = STATIC_DIR, target: str = STATIC_BUILD_DIR) -> dict:
+    source_dir, target_dir = Path(source), Path(target)
+    shutil.rmtree(target_dir, ignore_errors=True)
+    files = {
+        p.relative_to(source_dir).as_posix(): p
+        for p in sorted(source_dir.rglob("*"))
+        if p.is_file()
+    }
+    manifest: dict[str, str] = {}
+
+    def process(name: str) -> str:
+        if name in manifest:
+            return manifest[name]
+        manifest[name] = name  # защита от циклических ссылок
+
+        path = files[name]
+        data = path.read_bytes()
+        if path.suffix in COMPRESSIBLE:
+            # ссылки /static/... внутри js/css тоже на хэшированные файлы
+            text = _STATIC_REF.sub(
+                lambda m: STATIC_PREFIX
+                + (process(m[1]) if m[1] in files else m[1]),
+                data.decode("utf-8"),
+            )
+            data = text.encode("utf-8")
+
+        digest = hashlib.sha256(data).hexdigest()[:8]
+        hashed = f"{path.stem}.{digest}{path.suffix}"
+        hashed_name = Path(name).with_name(hashed).as_posix()
+
+        for out_name in (name, hashed_name):
+            out = target_dir / out_name
+            out.parent.mkdir(parents=True, exist_ok=True)
+            out.write_bytes(data)
+            if path.suffix in COMPRESSIBLE and len(data) >= MIN_COMPRESS_SIZE:
+                _compress(out, data)
+
+        manifest[name] = hashed_name
+        return hashed_name
+
+    for name in files:
+        process(name)
+
+    (target_dir / MANIFEST).write_text(json.dumps(manifest, indent=2))
+    return manifest
+
+
+if __name__ == "__main__":
+    result = build()
+    print(f"built {len(result)} files into {STATIC_BUILD_DIR}")
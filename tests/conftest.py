@@ -0,0 +1,128 @@
+"""Общие фикстуры: временная база Postgres и клиент к приложению.
+
+Тестам нужен сервер Postgres с pg_trgm:
+
+    TEST_DATABASE_URL=postgresql+asyncpg://postgres@127.0.0.1/postgres \\
+        python -m pytest
+
+По этому адресу создаётся отдельная база на прогон и удаляется в конце.
+Без TEST_DATABASE_URL тесты с базой пропускаются.
+"""
+
+import asyncio
+import os
+import uuid
+
+import pytest
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+TEST_DB_NAME = f"dashboard_test_{uuid.uuid4().hex[:8]}"
+
+# config читает окружение при импорте, поэтому всё задаётся до импорта
+# приложения. Маленький пул — чтобы тесты упирались в его предел.
+TEST_ENV = {
+    "USER_NAME_VPN": "admin",
+    "PASS_VPN": "secret",
+    "SECRET_KEY": "test-secret",
+    "DB_POOL_SIZE": "3",
+    "DB_MAX_OVERFLOW": "2",
+    "DB_SCHEMA_CHECK": "off",
+    "SWEEPER_ENABLED": "0",
+    "SNAPSHOT_ENABLED": "0",
+    "LIVE_UPDATES_ENABLED": "0",
+    "TYPEAHEAD_ENABLED": "0",
+    "ADMISSION_ENABLED": "0",
+}
+os.environ.update(TEST_ENV)
+if TEST_DATABASE_URL:
+    base_url, _, _ = TEST_DATABASE_URL.rpartition("/")
+    os.environ["DATABASE_URL_VPN"] = f"{base_url}/{TEST_DB_NAME}"
+else:
+    # чтобы импорт модулей с движком не падал без базы
+    os.environ.setdefault(
+        "DATABASE_URL_VPN", "postgresql+asyncpg://localhost/unused"
+    )
+
+
+def asyncpg_url(url: str) -> str:
+    return url.replace("postgresql+asyncpg://", "postgresql://", 1)
+
+
+async def _admin(statement: str) -> None:
+    import asyncpg
+
+    conn = await asyncpg.connect(asyncpg_url(TEST_DATABASE_URL))
+    try:
+        await conn.execute(statement)
+    finally:
+        await conn.close()
+
+
+async def _migrate() -> None:
+    from database.db import dispose_engines
+    from vpn.migrations import get_runner
+
+    try:
+        await get_runner().upgrade()
+    finally:
+        await dispose_engines()
+
+
+@pytest.fixture(scope="session")
+def database_url():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    asyncio.run(_admin(f'CREATE DATABASE "{TEST_DB_NAME}"'))
+    try:
+        asyncio.run(_migrate())
+        yield os.environ["DATABASE_URL_VPN"]
+    finally:
+        asyncio.run(_admin(f'DROP DATABASE "{TEST_DB_NAME}" WITH (FORCE)'))
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def app(database_url):
+    # движки привязаны к циклу событий теста: lifespan закрывает их
+    from main import app
+
+    async with app.router.lifespan_context(app):
+        yield app
+
+
+@pytest.fixture
+async def client(app):
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://test"
+    ) as client:
+        response = await client.post(
+            "/auth/login", data={"username": "admin", "password": "secret"}
+        )
+        assert response.status_code == 303
+        yield client
+
+
+@pytest.fixture
+async def db_conn(database_url):
+    """Отдельное соединение asyncpg к тестовой базе мимо пула.
+
+    Каждый тест начинает с пустых users и links.
+    """
+    import asyncpg
+
+    from vpn.cache import invalidate_vpn_caches
+
+    conn = await asyncpg.connect(asyncpg_url(database_url))
+    try:
+        await conn.execute("TRUNCATE users, links RESTART IDENTITY")
+        invalidate_vpn_caches()
+        yield conn
+    finally:
+        await conn.close()
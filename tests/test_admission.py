@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from middleware import AdmissionController, AdmissionMiddleware, RouteGroup
+
+pytestmark = pytest.mark.anyio
+
+ADMIN = {"auth": True, "role": "vpn"}
+
+
+async def call(middleware, session, path="/vpn/export/links") -> int:
+    scope = {"type": "http", "method": "GET", "path": path}
+    if session is not None:
+        scope["session"] = session
+    statuses = []
+
+    async def receive():
+        return {"type": "http.request"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    await middleware(scope, receive, send)
+    return statuses[0]
+
+
+async def test_anonymous_requests_do_not_take_bulk_slots():
+    controller = AdmissionController(
+        4, [RouteGroup("bulk", 0, limit=1, budget=0.1, max_queue=0)]
+    )
+    release = asyncio.Event()
+
+    async def app(scope, receive, send):
+        # роут сам отвечает 401 без входа, до запросов в БД
+        if not (scope.get("session") or {}).get("auth"):
+            status = 401
+        else:
+            status = 200
+            await release.wait()
+        await send({"type": "http.response.start", "status": status})
+        await send({"type": "http.response.body", "body": b""})
+
+    middleware = AdmissionMiddleware(app, controller)
+
+    # анонимы не занимают место и не получают 503
+    results = await asyncio.gather(
+        *(call(middleware, session) for session in (None, {}, None))
+    )
+    assert results == [401, 401, 401]
+    assert controller.groups["bulk"].admitted == 0
+
+    # администратор получает место; второй упирается в предел группы
+    first = asyncio.create_task(call(middleware, ADMIN))
+    await asyncio.sleep(0.01)
+    assert controller.groups["bulk"].active == 1
+    assert await call(middleware, {}) == 401
+    assert await call(middleware, ADMIN) == 503
+    release.set()
+    assert await first == 200
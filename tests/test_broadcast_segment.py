@@ -0,0 +1,27 @@
+import pytest
+
+from vpn.db_services import VPNUtils
+from vpn.send_message import BroadcastSegment
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_segment_is_read_in_short_sessions(app, db_conn):
+    await db_conn.execute(
+        "INSERT INTO users (user_id, end_date) "
+        "SELECT g, CURRENT_DATE + (g % 2) * 10 - 5 "
+        "FROM generate_series(1, 50) g"
+    )
+    engine = app.state.vpn_db.engine
+    recipients = VPNUtils(app.state.vpn_db).iter_segment_user_ids(
+        BroadcastSegment(kind="active"), chunk_size=10
+    )
+
+    chunks = []
+    async for chunk in recipients:
+        # пока потребитель обрабатывает пачку, соединение в пуле
+        assert engine.pool.checkedout() == 0
+        chunks.append(chunk)
+
+    assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+    assert sum(chunks, []) == list(range(1, 51, 2))
@@ -0,0 +1,91 @@
+from pathlib import Path
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Mount
+
+import static_assets
+from config import STATIC_DIR
+from static_assets import CompressedStaticFiles
+
+pytestmark = pytest.mark.anyio
+
+ASSET = "css/vpn/vpn.css"
+
+
+async def fetch(
+    client, url, encoding, **params
+) -> tuple[httpx.Response, bytes]:
+    """Ответ и тело как есть на проводе, без распаковки httpx."""
+    headers = {"Accept-Encoding": encoding}
+    async with client.stream("GET", url, headers=headers, params=params) as r:
+        body = b"".join([chunk async for chunk in r.aiter_raw()])
+    return r, body
+
+
+@pytest.fixture
+async def static_client(tmp_path):
+    manifest = static_assets.build(target=str(tmp_path))
+    app = Starlette(
+        routes=[Mount("/static", CompressedStaticFiles(directory=tmp_path))]
+    )
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://test"
+    ) as client:
+        yield client, "/static/" + manifest[ASSET]
+
+
+@pytest.mark.parametrize("encoding", ["br", "gzip"])
+async def test_hashed_asset_is_served_precompressed(static_client, encoding):
+    if encoding == "br":
+        pytest.importorskip("brotli")
+    client, url = static_client
+    _, plain_body = await fetch(client, url, "identity")
+    response, body = await fetch(client, url, encoding)
+
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == encoding
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["content-type"] == "text/css; charset=utf-8"
+    assert response.headers["cache-control"] == static_assets.IMMUTABLE
+    assert len(body) < len(plain_body)
+
+
+async def test_hashed_asset_identity(static_client):
+    client, url = static_client
+    response, body = await fetch(client, url, "identity")
+
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert body == (Path(STATIC_DIR) / ASSET).read_bytes()
+
+
+@pytest.fixture
+async def links(db_conn):
+    await db_conn.execute("INSERT INTO users (user_id) VALUES (1)")
+    await db_conn.execute(
+        "INSERT INTO links (link_address, user_id) "
+        "SELECT 'vless://example-' || g, 1 FROM generate_series(1, 100) g"
+    )
+
+
+@pytest.mark.parametrize(
+    "encoding, expected", [("gzip", "gzip"), ("br", None), ("identity", None)]
+)
+async def test_large_json_route(client, links, encoding, expected):
+    # JSON сжимает только GZipJSONMiddleware: без gzip в Accept-Encoding
+    # ответ идёт как есть
+    params = {"user_id": 1, "per_page": 100}
+    _, plain_body = await fetch(client, "/vpn/links", "identity", **params)
+    response, body = await fetch(client, "/vpn/links", encoding, **params)
+
+    assert response.status_code == 200
+    assert response.headers.get("content-encoding") == expected
+    assert response.headers["vary"] == "Accept-Encoding"
+    if expected:
+        assert len(body) < len(plain_body)
+    else:
+        assert body == plain_body
@@ -0,0 +1,21 @@
+from vpn import cache
+from vpn.cache import DataVersion, etag_matches
+
+
+def test_etag_expires_without_local_writes(monkeypatch):
+    version = DataVersion(max_age=30)
+    monkeypatch.setattr(cache.time, "time", lambda: 1000.0)
+    etag = version.etag("page")
+    assert etag_matches(etag, version.etag("page"))
+
+    # запись в другом воркере: локальный счётчик не сдвинулся, но
+    # через max_age тег всё равно другой
+    monkeypatch.setattr(cache.time, "time", lambda: 1030.0)
+    assert not etag_matches(etag, version.etag("page"))
+
+
+def test_etag_changes_on_bump():
+    version = DataVersion(max_age=30)
+    etag = version.etag()
+    version.bump()
+    assert not etag_matches(etag, version.etag())
@@ -0,0 +1,71 @@
+import asyncio
+from collections import Counter
+
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from vpn.db_services import LinkService
+
+pytestmark = pytest.mark.anyio
+
+FREE_LINKS = 300
+USERS = 50
+TASKS = 120
+PER_CLAIM = 3
+CONNECTIONS = 40
+
+
+@pytest.fixture
+async def session_factory(database_url):
+    # свой пул пошире приложения, чтобы захваты шли одновременно
+    engine = create_async_engine(
+        database_url, pool_size=CONNECTIONS, max_overflow=0, pool_timeout=60
+    )
+    try:
+        yield async_sessionmaker(engine, expire_on_commit=False)
+    finally:
+        await engine.dispose()
+
+
+async def test_parallel_claims_never_share_a_link(session_factory, db_conn):
+    await db_conn.execute(
+        "INSERT INTO users (user_id) SELECT g FROM generate_series(1, $1) g",
+        USERS,
+    )
+    await db_conn.execute(
+        "INSERT INTO links (link_address) "
+        "SELECT 'vless://' || g FROM generate_series(1, $1) g",
+        FREE_LINKS,
+    )
+    start = asyncio.Event()
+
+    async def claim(task: int) -> tuple[int, list[int]]:
+        user_id = task % USERS + 1
+        async with session_factory() as session:
+            await start.wait()
+            links = await LinkService(session).claim_free_links(
+                user_id, PER_CLAIM
+            )
+            # держим блокировки, пока остальные тоже выбирают ссылки
+            await asyncio.sleep(0.01)
+            await session.commit()
+        return user_id, [link.id for link in links]
+
+    tasks = [asyncio.create_task(claim(i)) for i in range(TASKS)]
+    await asyncio.sleep(0.1)
+    start.set()
+    claims = await asyncio.gather(*tasks)
+
+    claimed = Counter(link_id for _, ids in claims for link_id in ids)
+    duplicates = [link_id for link_id, n in claimed.items() if n > 1]
+    assert duplicates == []
+    # спрос больше пула: SKIP LOCKED отдаёт меньше, но не чужое
+    assert 0 < len(claimed) <= FREE_LINKS
+
+    owners = dict(
+        await db_conn.fetch(
+            "SELECT id, user_id FROM links WHERE user_id IS NOT NULL"
+        )
+    )
+    expected = {link_id: user_id for user_id, ids in claims for link_id in ids}
+    assert owners == expected
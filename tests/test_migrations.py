@@ -0,0 +1,58 @@
+import asyncpg
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from database.migrations import VERSION_TABLE, Migration, MigrationRunner
+
+pytestmark = pytest.mark.anyio
+
+INDEX = "ix_migration_probe_code"
+
+
+@pytest.fixture
+async def probe_table(db_conn):
+    await db_conn.execute("CREATE TABLE migration_probe (code INT)")
+    try:
+        yield
+    finally:
+        await db_conn.execute("DROP TABLE IF EXISTS migration_probe")
+        await db_conn.execute(
+            f"DELETE FROM {VERSION_TABLE} WHERE revision = 'test_probe'"
+        )
+
+
+async def test_invalid_concurrent_index_is_rebuilt(
+    database_url, db_conn, probe_table
+):
+    # дубликаты валят уникальный индекс: остаётся INVALID, как после
+    # оборванной миграции
+    await db_conn.execute("INSERT INTO migration_probe VALUES (1), (1)")
+    with pytest.raises(asyncpg.UniqueViolationError):
+        await db_conn.execute(
+            f"CREATE UNIQUE INDEX CONCURRENTLY {INDEX} "
+            "ON migration_probe (code)"
+        )
+    valid = (
+        "SELECT indisvalid FROM pg_index "
+        f"WHERE indexrelid = '{INDEX}'::regclass"
+    )
+    assert await db_conn.fetchval(valid) is False
+
+    await db_conn.execute("DELETE FROM migration_probe")
+    await db_conn.execute("INSERT INTO migration_probe VALUES (1), (2)")
+    migration = Migration(
+        revision="test_probe",
+        description="unique probe index",
+        statements=(
+            f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {INDEX} "
+            "ON migration_probe (code)",
+        ),
+        transactional=False,
+    )
+    engine = create_async_engine(database_url)
+    try:
+        await MigrationRunner(engine, [migration]).upgrade()
+    finally:
+        await engine.dispose()
+
+    assert await db_conn.fetchval(valid) is True
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from config import DB_MAX_OVERFLOW, DB_POOL_SIZE
+
+pytestmark = pytest.mark.anyio
+
+CONCURRENT_REQUESTS = 60
+
+
+async def test_concurrent_requests_stay_within_pool(app, client, db_conn):
+    await db_conn.execute(
+        "INSERT INTO users (user_id, user_name) "
+        "SELECT g, 'user_' || g FROM generate_series(1, 50) g"
+    )
+    await db_conn.execute(
+        "INSERT INTO links (link_address, user_id) "
+        "SELECT 'vless://' || g, g % 50 + 1 FROM generate_series(1, 500) g"
+    )
+    engine = app.state.vpn_db.engine
+    limit = DB_POOL_SIZE + DB_MAX_OVERFLOW
+    database = await db_conn.fetchval("SELECT current_database()")
+    peak_checkedout = 0
+    peak_backends = 0
+    done = asyncio.Event()
+
+    async def sample():
+        nonlocal peak_checkedout, peak_backends
+        while not done.is_set():
+            peak_checkedout = max(peak_checkedout, engine.pool.checkedout())
+            backends = await db_conn.fetchval(
+                "SELECT count(*) FROM pg_stat_activity "
+                "WHERE datname = $1 AND pid <> pg_backend_pid()",
+                database,
+            )
+            peak_backends = max(peak_backends, backends)
+            await asyncio.sleep(0.001)
+
+    sampler = asyncio.create_task(sample())
+    try:
+        responses = await asyncio.gather(
+            *(
+                client.get(
+                    "/vpn/links", params={"user_id": i % 50 + 1, "page": 2}
+                )
+                for i in range(CONCURRENT_REQUESTS)
+            )
+        )
+    finally:
+        done.set()
+        await sampler
+
+    assert {r.status_code for r in responses} == {200}
+    assert 1 < peak_checkedout <= limit
+    assert peak_backends <= limit
+    # сессии из async for закрываются финализатором генератора чуть
+    # позже ответа; соединения возвращаются в пул, а не закрываются
+    for _ in range(100):
+        if engine.pool.checkedout() == 0:
+            break
+        await asyncio.sleep(0.01)
+    assert engine.pool.checkedout() == 0
+    assert engine.pool.checkedin() <= DB_POOL_SIZE
@@ -0,0 +1,42 @@
+import pytest
+
+from vpn.sweeper import ExpirySweeper
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_sweep_frees_only_expired_links_in_batches(app, db_conn):
+    # нечётные истекли месяц назад, чётные ещё активны; у каждого
+    # пользователя по 5 ссылок, пачка из 3 рвёт их посередине
+    await db_conn.execute(
+        "INSERT INTO users (user_id, end_date) "
+        "SELECT g, CURRENT_DATE + CASE WHEN g % 2 = 1 THEN -30 ELSE 30 END "
+        "FROM generate_series(1, 20) g"
+    )
+    # и давно истёкшие пользователи без ссылок
+    await db_conn.execute(
+        "INSERT INTO users (user_id, end_date) "
+        "SELECT g, CURRENT_DATE - 400 FROM generate_series(100, 300) g"
+    )
+    await db_conn.execute(
+        "INSERT INTO links (link_address, user_id) "
+        "SELECT 'vless://' || g, g % 20 + 1 FROM generate_series(1, 100) g"
+    )
+    sweeper = ExpirySweeper(app.state.vpn_db, batch_size=3, dry_run=False)
+
+    dry = await sweeper.run_once(dry_run=True)
+    assert dry.reclaimed == 50
+
+    run = await sweeper.run_once()
+    assert run.reclaimed == 50
+    assert run.batches == 17
+    owners = await db_conn.fetch(
+        "SELECT DISTINCT user_id FROM links WHERE user_id IS NOT NULL"
+    )
+    assert sorted(r["user_id"] for r in owners) == list(range(2, 21, 2))
+    assert (
+        await db_conn.fetchval(
+            "SELECT count(*) FROM links WHERE user_id IS NULL"
+        )
+        == 50
+    )
@@ -0,0 +1,55 @@
+import pytest
+
+from vpn import db_services
+from vpn.cache import invalidate_vpn_caches
+from vpn.db_services import VPNUtils
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def users(app, db_conn):
+    await db_conn.execute(
+        "INSERT INTO users (user_id, user_name) "
+        "SELECT g, 'user_' || g FROM generate_series(1, 25) g"
+    )
+    invalidate_vpn_caches()
+
+
+async def test_total_is_cached_per_search(app, users, db_conn):
+    utils = VPNUtils(app.state.vpn_db)
+    assert (await utils.get_users_page())["total"] == 25
+    assert (await utils.get_users_page(search="user_1"))["total"] == 11
+
+    # запись мимо приложения: до сброса кэша total прежний
+    await db_conn.execute(
+        "INSERT INTO users (user_id, user_name) VALUES (100, 'user_100')"
+    )
+    assert (await utils.get_users_page())["total"] == 25
+    assert (await utils.get_users_page(search="user_1"))["total"] == 11
+
+    invalidate_vpn_caches()
+    assert (await utils.get_users_page())["total"] == 26
+    assert (await utils.get_users_page(search="user_1"))["total"] == 12
+
+
+async def test_unfiltered_total_uses_estimate(
+    app, users, db_conn, monkeypatch
+):
+    monkeypatch.setattr(db_services, "USERS_COUNT_ESTIMATE_MIN", 0)
+    utils = VPNUtils(app.state.vpn_db)
+
+    # без ANALYZE оценки нет (-1): точный count
+    assert (await utils.get_users_page())["total"] == 25
+
+    await db_conn.execute(
+        "INSERT INTO users (user_id, user_name) VALUES (100, 'user_100')"
+    )
+    await db_conn.execute("ANALYZE users")
+    invalidate_vpn_caches()
+    estimate = await db_conn.fetchval(
+        "SELECT reltuples::bigint FROM pg_class WHERE oid = 'users'::regclass"
+    )
+    assert (await utils.get_users_page())["total"] == estimate == 26
+    # поиск всегда считается точно
+    assert (await utils.get_users_page(search="user_1"))["total"] == 12
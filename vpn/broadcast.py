@@ -0,0 +1,244 @@
+import asyncio
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import AsyncGenerator, AsyncIterator, Iterable
+
+import httpx
+
+from config import (
+    BROADCAST_CHUNK_SIZE,
+    BROADCAST_CONCURRENCY,
+    BROADCAST_MAX_RETRIES,
+    BROADCAST_PER_CHAT_INTERVAL,
+    BROADCAST_RATE,
+)
+from vpn.send_message import TelegramError, tg_send_message
+
+MAX_JOB_ERRORS = 100
+MAX_FINISHED_JOBS = 50
+
+
+class TokenBucket:
+    """Глобальный лимит: не больше rate отправок в секунду."""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.rate
+        )
+        self.updated = now
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        # 429: бот целиком должен подождать retry_after секунд
+        now = time.monotonic()
+        self.paused_until = max(self.paused_until, now + seconds)
+        self.tokens = 0
+        self.updated = max(self.updated, self.paused_until)
+
+
+class PerChatLimiter:
+    """Не чаще одного сообщения в min_interval секунд в один чат."""
+
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self.next_allowed: dict[int, float] = {}
+
+    async def wait(self, chat_id: int) -> None:
+        now = time.monotonic()
+        allowed = self.next_allowed.get(chat_id, now)
+        self.next_allowed[chat_id] = max(allowed, now) + self.min_interval
+        if allowed > now:
+            await asyncio.sleep(allowed - now)
+
+        if len(self.next_allowed) > 10_000:
+            self.next_allowed = {
+                k: v for k, v in self.next_allowed.items() if v > now
+            }
+
+
+@dataclass
+class BroadcastJob:
+    id: str
+    text: str
+    total: int = 0
+    sent: int = 0
+    failed: int = 0
+    status: str = "running"
+    errors: list[dict] = field(default_factory=list)
+    started_at: float = field(default_factory=time.time)
+    finished_at: float | None = None
+
+    @property
+    def pending(self) -> int:
+        return self.total - self.sent - self.failed
+
+    def add_error(self, chat_id: int, error: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_JOB_ERRORS:
+            self.errors.append({"chat_id": chat_id, "error": error})
+
+    def as_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "total": self.total,
+            "sent": self.sent,
+            "failed": self.failed,
+            "pending": self.pending,
+            "errors": self.errors,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class BroadcastManager:
+    """Фоновые рассылки через один долгоживущий httpx-клиент.
+
+    Отправкой занимаются concurrency воркеров; общий TokenBucket держит
+    глобальный лимит Telegram, PerChatLimiter — лимит на чат, а ответ
+    429 с retry_after ставит на паузу весь бакет и повторяет отправку.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        concurrency: int = BROADCAST_CONCURRENCY,
+        rate: float = BROADCAST_RATE,
+        per_chat_interval: float = BROADCAST_PER_CHAT_INTERVAL,
+        max_retries: int = BROADCAST_MAX_RETRIES,
+    ):
+        self.client = client
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(rate)
+        self.per_chat = PerChatLimiter(per_chat_interval)
+        self.jobs: dict[str, BroadcastJob] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+
+    def start(
+        self, recipients: AsyncGenerator[list[int], None], text: str
+    ) -> BroadcastJob:
+        """Запускает рассылку; recipients — поток пачек chat_id.
+
+        total растёт по мере чтения потока, поэтому до его конца
+        pending показывает только уже прочитанных получателей.
+        """
+        job = BroadcastJob(id=uuid.uuid4().hex, text=text)
+        self.jobs[job.id] = job
+        self._prune_jobs()
+
+        task = asyncio.create_task(self._run(job, recipients))
+        self._tasks[job.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.id, None))
+        return job
+
+    def get(self, job_id: str) -> BroadcastJob | None:
+        return self.jobs.get(job_id)
+
+    async def close(self) -> None:
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    async def _run(
+        self, job: BroadcastJob, recipients: AsyncGenerator[list[int], None]
+    ) -> None:
+        # Ограниченная очередь: читаем получателей не быстрее отправки
+        queue: asyncio.Queue[int | None] = asyncio.Queue(
+            maxsize=self.concurrency * 2
+        )
+
+        async def produce():
+            try:
+                async for chunk in recipients:
+                    for chat_id in chunk:
+                        job.total += 1
+                        await queue.put(chat_id)
+            finally:
+                # при отмене или ошибке сессия чтения закрывается сразу,
+                # а не финализатором генератора
+                await recipients.aclose()
+
+        async def worker():
+            while (chat_id := await queue.get()) is not None:
+                try:
+                    await self._send(job, chat_id)
+                except Exception as e:
+                    job.add_error(chat_id, str(e))
+
+        workers = [
+            asyncio.create_task(worker()) for _ in range(self.concurrency)
+        ]
+        try:
+            await produce()
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+            job.status = "done"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        except Exception as e:
+            job.status = "error"
+            job.errors.append({"chat_id": None, "error": str(e)})
+        finally:
+            for task in workers:
+                task.cancel()
+            job.finished_at = time.time()
+
+    async def _send(self, job: BroadcastJob, chat_id: int) -> None:
+        for attempt in range(self.max_retries + 1):
+            await self.per_chat.wait(chat_id)
+            await self.bucket.acquire()
+            try:
+                await tg_send_message(chat_id, job.text, client=self.client)
+            except TelegramError as e:
+                if e.retry_after is not None and attempt < self.max_retries:
+                    self.bucket.pause(e.retry_after)
+                    continue
+                job.add_error(chat_id, str(e))
+                return
+            except (httpx.HTTPError, RuntimeError) as e:
+                job.add_error(chat_id, str(e))
+                return
+
+            job.sent += 1
+            return
+
+    @staticmethod
+    async def iter_chunks(
+        chat_ids: Iterable[int], chunk_size: int = BROADCAST_CHUNK_SIZE
+    ) -> AsyncIterator[list[int]]:
+        chunk: list[int] = []
+        for chat_id in dict.fromkeys(chat_ids):
+            chunk.append(chat_id)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _prune_jobs(self) -> None:
+        finished = [j for j in self.jobs.values() if j.status != "running"]
+        for job in finished[:-MAX_FINISHED_JOBS]:
+            self.jobs.pop(job.id, None)
@@ -0,0 +1,100 @@
+import time
+import uuid
+from typing import Any, Hashable
+
+from config import (
+    ETAG_MAX_AGE,
+    LINKS_COUNT_CACHE_TTL,
+    SUMMARY_CACHE_TTL,
+    USERS_COUNT_CACHE_TTL,
+)
+
+
+class TTLCache:
+    """Небольшой кэш в памяти процесса: значение живёт ttl секунд."""
+
+    def __init__(self, ttl: float, maxsize: int = 256):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: dict[Hashable, tuple[float, Any]] = {}
+        # растёт при каждом clear(): значение, посчитанное до
+        # инвалидации, не должно попасть в кэш после неё
+        self.generation = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            return default
+
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            self._data.pop(key, None)
+            return default
+        return value
+
+    def set(
+        self, key: Hashable, value: Any, generation: int | None = None
+    ) -> None:
+        if generation is not None and generation != self.generation:
+            return
+        if len(self._data) >= self.maxsize:
+            self._data.clear()
+        self._data[key] = (time.monotonic() + self.ttl, value)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.generation += 1
+
+
+class DataVersion:
+    """Версия данных users/links для ETag: растёт при каждой записи.
+
+    Счётчик живёт в памяти процесса, как и кэши выше; epoch меняется
+    при перезапуске, чтобы ETag старого процесса не совпал с новым.
+    Запись из другого воркера или из бота этот счётчик не видит, если
+    не пришло уведомление ChangeFeed, поэтому в тег входит ещё номер
+    окна в max_age секунд: 304 живёт не дольше кэшей с тем же TTL.
+    """
+
+    def __init__(self, max_age: float):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.value = 0
+        self.max_age = max_age
+
+    def bump(self) -> None:
+        self.value += 1
+
+    def etag(self, *parts) -> str:
+        window = int(time.time() // self.max_age)
+        tag = "-".join(
+            str(p) for p in (self.epoch, self.value, window, *parts)
+        )
+        # weak: тело может уйти сжатым, а может и нет
+        return f'W/"{tag}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # слабое сравнение (RFC 9110, 13.1.2): префикс W/ не учитывается
+    opaque = etag.removeprefix("W/")
+    return any(
+        tag.strip().removeprefix("W/") == opaque
+        for tag in if_none_match.split(",")
+    )
+
+
+links_count_cache = TTLCache(LINKS_COUNT_CACHE_TTL)
+users_count_cache = TTLCache(USERS_COUNT_CACHE_TTL)
+summary_cache = TTLCache(SUMMARY_CACHE_TTL)
+data_version = DataVersion(ETAG_MAX_AGE)
+
+
+def invalidate_vpn_caches() -> None:
+    """Вызывается каждым путём записи в users/links после commit."""
+    links_count_cache.clear()
+    users_count_cache.clear()
+    summary_cache.clear()
+    data_version.bump()
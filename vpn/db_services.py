@@ -1,37 +1,107 @@
+import asyncio
+import base64
+import json
+from datetime import date, timedelta
 from typing import AsyncIterator
 
-from sqlalchemy import MetaData, delete, func, select
+from sqlalchemy import (
+    BigInteger,
+    Integer,
+    MetaData,
+    any_,
+    bindparam,
+    column,
+    delete,
+    exists,
+    func,
+    or_,
+    select,
+    true,
+    update,
+    values,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from config import DATABASE_URL_VPN
+from config import (
+    BROADCAST_CHUNK_SIZE,
+    DATABASE_URL_VPN,
+    DATABASE_URL_VPN_REPLICA,
+    USERS_COUNT_ESTIMATE_MIN,
+)
 from database.db import AbstractDatabase
+from vpn import queries
+from vpn.cache import (
+    invalidate_vpn_caches,
+    links_count_cache,
+    summary_cache,
+    users_count_cache,
+)
 from vpn.models import LinkModel, VPNUser
+from vpn.send_message import BroadcastSegment
+
+
+def _like_pattern(value: str) -> str:
+    escaped = (
+        value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    )
+    return f"%{escaped}%"
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(is_free: bool, link_id: int, direction: str) -> str:
+    raw = json.dumps({"f": is_free, "id": link_id, "d": direction})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[bool, int, str]:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        data = json.loads(base64.urlsafe_b64decode(padded))
+        is_free, link_id, direction = data["f"], data["id"], data["d"]
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor("invalid cursor")
+    if (
+        not isinstance(is_free, bool)
+        or not isinstance(link_id, int)
+        or direction not in ("next", "prev")
+    ):
+        raise InvalidCursor("invalid cursor")
+    return is_free, link_id, direction
 
 
 class VPNDatabase(AbstractDatabase):
     def __init__(self):
         db_url = DATABASE_URL_VPN
-        super().__init__(db_url=db_url, echo=False)
+        super().__init__(
+            db_url=db_url, echo=False, replica_url=DATABASE_URL_VPN_REPLICA
+        )
 
     async def get_session(self) -> AsyncIterator[AsyncSession]:
         async with self.session_factory() as session:
             yield session
 
+    async def get_read_session(self) -> AsyncIterator[AsyncSession]:
+        # только для запросов без записи: реплика read-only
+        session_factory = await self.read_session_factory()
+        async with session_factory() as session:
+            yield session
+
 
 class VPNUtils:
+    # один запрос на ключ, даже если кэш опрашивают много вкладок сразу
+    _summary_lock = asyncio.Lock()
+
     def __init__(self, db=None):
         self.db = db or VPNDatabase()
         self.metadata = MetaData()
 
     async def get_users_list(self):
-        async for session in self.db.get_session():
-            query = select(
-                VPNUser.user_id,
-                VPNUser.user_name,
-                VPNUser.end_date,
-                VPNUser.end_trial_period,
-            )
-            rows = (await session.execute(query)).all()
+        async for session in self.db.get_read_session():
+            rows = (await session.execute(queries.USERS_LIST)).all()
 
             return [
                 {
@@ -43,69 +113,507 @@ class VPNUtils:
                 for r in rows
             ]
 
+    async def get_users_page(
+        self, page: int = 1, page_size: int = 10, search: str = ""
+    ):
+        """Одна страница пользователей: фильтр и LIMIT/OFFSET в БД.
+
+        Поиск — подстрока в user_id (только для цифр) или в user_name
+        без учёта регистра; оба условия обслуживают trigram-индексы
+        из VPNUser.__table_args__. total берётся из TTL-кэша, без
+        поиска на большой таблице — из статистики планировщика.
+        """
+        search = search.strip()
+        shape = (bool(search), search.isdigit())
+        params = {"pattern": _like_pattern(search)} if search else {}
+
+        async for session in self.db.get_read_session():
+            total = await self._users_total(session, shape, params)
+            total_pages = max(1, -(-total // page_size))
+            page = max(1, min(page, total_pages))
+
+            rows = (
+                await session.execute(
+                    queries.users_page(*shape),
+                    {
+                        **params,
+                        "offset": (page - 1) * page_size,
+                        "limit": page_size,
+                    },
+                )
+            ).all()
+
+            return {
+                "users": [
+                    {
+                        "user_id": r.user_id,
+                        "username": r.user_name,
+                        "end_date": r.end_date,
+                        "trial_end": r.end_trial_period,
+                    }
+                    for r in rows
+                ],
+                "page": page,
+                "total_pages": total_pages,
+                "total": total,
+            }
+
+    @staticmethod
+    async def _users_total(
+        session: AsyncSession, shape: tuple[bool, bool], params: dict
+    ) -> int:
+        key = ("users", shape, params.get("pattern"))
+        total = users_count_cache.get(key)
+        if total is not None:
+            return total
+
+        generation = users_count_cache.generation
+        if not shape[0]:
+            total = (await session.execute(queries.USERS_ESTIMATE)).scalar()
+        if total is None or total < USERS_COUNT_ESTIMATE_MIN:
+            total = (
+                await session.execute(queries.users_count(*shape), params)
+            ).scalar_one()
+        users_count_cache.set(key, total, generation=generation)
+        return total
+
+    async def get_links_page(
+        self,
+        page: int = 1,
+        per_page: int = 10,
+        user_id: int | None = None,
+        cursor: str | None = None,
+    ):
+        """Страница ссылок: сначала свободные, затем по убыванию id.
+
+        Без cursor работает по номеру страницы (OFFSET), с cursor —
+        keyset по индексу ix_links_free_first, и скорость не зависит
+        от глубины страницы. total берётся из TTL-кэша.
+        """
+        by_user = user_id is not None
+        params = {"user_id": user_id} if by_user else {}
+
+        direction = None
+        if cursor is not None:
+            cursor_free, cursor_id, direction = decode_cursor(cursor)
+            params.update(cursor_free=cursor_free, cursor_id=cursor_id)
+        else:
+            params["offset"] = (page - 1) * per_page
+        # лишняя строка показывает, есть ли страница дальше
+        params["limit"] = per_page + 1
+
+        async for session in self.db.get_read_session():
+            total = links_count_cache.get(("links", user_id))
+            if total is None:
+                generation = links_count_cache.generation
+                total = (
+                    await session.execute(queries.links_count(by_user), params)
+                ).scalar_one()
+                links_count_cache.set(
+                    ("links", user_id), total, generation=generation
+                )
+
+            total_pages = max(1, (total + per_page - 1) // per_page)
+
+            # кортежи колонок вместо ORM-объектов: без identity map и
+            # инструментирования атрибутов
+            res = await session.execute(
+                queries.links_page(by_user, direction), params
+            )
+            links = res.all()
+            has_more = len(links) > per_page
+            links = links[:per_page]
+
+            if direction == "prev":
+                links.reverse()
+                has_next, has_prev = True, has_more
+            else:
+                has_next = has_more
+                has_prev = cursor is not None or page > 1
+
+            next_cursor = prev_cursor = None
+            if links and has_next:
+                last = links[-1]
+                next_cursor = encode_cursor(
+                    last.user_id is None, last.id, "next"
+                )
+            if links and has_prev:
+                first = links[0]
+                prev_cursor = encode_cursor(
+                    first.user_id is None, first.id, "prev"
+                )
+
+            return {
+                "items": [
+                    {"id": id_, "link_address": address, "user_id": owner}
+                    for id_, address, owner in links
+                ],
+                "page": page,
+                "total_pages": total_pages,
+                "total": total,
+                "next_cursor": next_cursor,
+                "prev_cursor": prev_cursor,
+            }
+
+    async def get_summary(self, expiring_days: int = 7):
+        """Сводка для дашборда одним агрегирующим запросом.
+
+        Результат кэшируется на SUMMARY_CACHE_TTL секунд и сбрасывается
+        invalidate_vpn_caches() при любой записи.
+        """
+        today = date.today()
+        key = (today, expiring_days)
+        summary = summary_cache.get(key)
+        if summary is not None:
+            return summary
+
+        async with self._summary_lock:
+            summary = summary_cache.get(key)
+            if summary is not None:
+                return summary
+
+            generation = summary_cache.generation
+            horizon = today + timedelta(days=expiring_days)
+            users = select(
+                func.count().label("total_users"),
+                func.count()
+                .filter(VPNUser.end_date >= today)
+                .label("active_subscriptions"),
+                func.count()
+                .filter(VPNUser.end_trial_period >= today)
+                .label("trial_users"),
+                func.count()
+                .filter(VPNUser.end_date.between(today, horizon))
+                .label("expiring_users"),
+            ).subquery("users_summary")
+            links = select(
+                func.count().label("total_links"),
+                func.count()
+                .filter(LinkModel.user_id.is_(None))
+                .label("free_links"),
+            ).subquery("links_summary")
+
+            async for session in self.db.get_read_session():
+                # оба подзапроса возвращают по одной строке
+                stmt = select(users, links).select_from(
+                    users.join(links, true())
+                )
+                row = (await session.execute(stmt)).one()
+
+            summary = dict(row._mapping)
+            summary["assigned_links"] = (
+                summary["total_links"] - summary["free_links"]
+            )
+            summary["expiring_days"] = expiring_days
+            summary_cache.set(key, summary, generation=generation)
+            return summary
+
+    @staticmethod
+    def segment_conditions(segment: BroadcastSegment, today: date):
+        conditions = []
+        horizon = timedelta(days=segment.days)
+
+        if segment.kind == "active":
+            conditions.append(VPNUser.end_date >= today)
+        elif segment.kind == "trial":
+            conditions.append(VPNUser.end_trial_period >= today)
+        elif segment.kind == "trial_ending":
+            conditions.append(
+                VPNUser.end_trial_period.between(today, today + horizon)
+            )
+        elif segment.kind == "expired":
+            conditions.append(VPNUser.end_date < today)
+            conditions.append(VPNUser.end_date >= today - horizon)
+
+        if segment.has_links is not None:
+            has_links = exists().where(LinkModel.user_id == VPNUser.user_id)
+            conditions.append(has_links if segment.has_links else ~has_links)
+
+        return conditions
+
+    async def iter_segment_user_ids(
+        self,
+        segment: BroadcastSegment,
+        chunk_size: int = BROADCAST_CHUNK_SIZE,
+    ) -> AsyncIterator[list[int]]:
+        """Отдаёт user_id сегмента пачками по ключу user_id.
+
+        В памяти одновременно не больше одной пачки. Каждая пачка
+        читается в своей короткой сессии: рассылка идёт часами со
+        скоростью отправки, и держать всё это время открытую
+        транзакцию с курсором нельзя.
+        """
+        conditions = self.segment_conditions(segment, date.today())
+        last_id = None
+        while True:
+            stmt = select(VPNUser.user_id).where(*conditions)
+            if last_id is not None:
+                stmt = stmt.where(VPNUser.user_id > last_id)
+            stmt = stmt.order_by(VPNUser.user_id).limit(chunk_size)
+            async for session in self.db.get_read_session():
+                chunk = list((await session.scalars(stmt)).all())
+            if chunk:
+                yield chunk
+            if len(chunk) < chunk_size:
+                return
+            last_id = chunk[-1]
+
     async def delete_user(self, user_id: int):
         async for session in self.db.get_session():
             stmt = delete(VPNUser).where(VPNUser.user_id == user_id)
             await session.execute(stmt)
             await session.commit()
+            invalidate_vpn_caches()
             return {"success": True, "message": f"User {user_id} deleted"}
 
+    async def delete_users(self, user_ids: list[int]):
+        """Удаляет пачку пользователей одним DELETE ... = ANY(:ids).
+
+        Ссылки удалённых пользователей уходят каскадом по FK.
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        stmt = (
+            delete(VPNUser)
+            .where(
+                VPNUser.user_id
+                == any_(bindparam("ids", user_ids, type_=ARRAY(BigInteger)))
+            )
+            .returning(VPNUser.user_id)
+            .execution_options(synchronize_session=False)
+        )
+        async for session in self.db.get_session():
+            deleted = set((await session.execute(stmt)).scalars().all())
+            await session.commit()
+
+        if deleted:
+            invalidate_vpn_caches()
+
+        return {
+            "deleted": len(deleted),
+            "not_found": len(user_ids) - len(deleted),
+            "items": [
+                {
+                    "user_id": user_id,
+                    "status": "deleted" if user_id in deleted else "not_found",
+                }
+                for user_id in user_ids
+            ],
+        }
+
+    async def reassign_links(self, items: list[tuple[int, int | None]]):
+        """Переназначает пачку ссылок одним statement.
+
+        Пары (link_id, user_id) приходят двумя массивами через unnest;
+        в том же запросе проверяется, что ссылка и пользователь
+        существуют, и обновляются только корректные строки. Повтор
+        link_id — побеждает последняя пара. user_id=None освобождает
+        ссылку.
+        """
+        pairs = dict(items)
+        links = LinkModel.__table__
+        users = VPNUser.__table__
+
+        wanted = select(
+            func.unnest(
+                bindparam("link_ids", list(pairs), type_=ARRAY(Integer))
+            ).label("link_id"),
+            func.unnest(
+                bindparam(
+                    "user_ids", list(pairs.values()), type_=ARRAY(BigInteger)
+                )
+            ).label("user_id"),
+        ).cte("wanted")
+        checked = (
+            select(
+                wanted.c.link_id,
+                wanted.c.user_id,
+                links.c.id.is_not(None).label("link_exists"),
+                or_(
+                    wanted.c.user_id.is_(None),
+                    users.c.user_id.is_not(None),
+                ).label("user_exists"),
+            )
+            .select_from(
+                wanted.outerjoin(
+                    links, links.c.id == wanted.c.link_id
+                ).outerjoin(users, users.c.user_id == wanted.c.user_id)
+            )
+            .cte("checked")
+        )
+        updated = (
+            update(links)
+            .where(links.c.id == checked.c.link_id, checked.c.user_exists)
+            .values(user_id=checked.c.user_id)
+            .returning(links.c.id)
+            .cte("updated")
+        )
+        stmt = select(
+            checked.c.link_id,
+            checked.c.user_id,
+            checked.c.link_exists,
+            checked.c.user_exists,
+            updated.c.id.is_not(None).label("updated"),
+        ).select_from(
+            checked.outerjoin(updated, updated.c.id == checked.c.link_id)
+        )
+
+        async for session in self.db.get_session():
+            rows = (await session.execute(stmt)).all()
+            await session.commit()
+
+        statuses = {}
+        for row in rows:
+            if row.updated:
+                statuses[row.link_id] = "updated"
+            elif not row.link_exists:
+                statuses[row.link_id] = "link_not_found"
+            else:
+                statuses[row.link_id] = "user_not_found"
+
+        results = [
+            {
+                "link_id": link_id,
+                "user_id": user_id,
+                "status": statuses[link_id],
+            }
+            for link_id, user_id in pairs.items()
+        ]
+
+        updated_count = sum(r["status"] == "updated" for r in results)
+        if updated_count:
+            invalidate_vpn_caches()
+
+        return {
+            "updated": updated_count,
+            "failed": len(results) - updated_count,
+            "items": results,
+        }
+
 
 class LinkService:
     def __init__(self, session: AsyncSession):
         self.session = session
 
-    async def get_link_random_kink(self):
-        stmt = (
+    @staticmethod
+    def _free_links_stmt(count: int):
+        # Свободные ссылки берутся по частичному индексу ix_links_free
+        # (O(log n) без сортировки всего пула), а SKIP LOCKED не даёт
+        # параллельным транзакциям выбрать одни и те же строки.
+        return (
             select(LinkModel)
             .where(LinkModel.user_id.is_(None))
-            .order_by(func.random())
-            .limit(1)
+            .order_by(LinkModel.id)
+            .limit(count)
+            .with_for_update(skip_locked=True)
         )
 
-        result = await self.session.execute(stmt)
+    async def get_link_random_kink(self):
+        result = await self.session.execute(self._free_links_stmt(1))
         return result.scalar_one_or_none()
 
     async def get_free_random_links(self, count: int):
-        stmt = (
-            select(LinkModel)
-            .where(LinkModel.user_id.is_(None))
-            .order_by(func.random())
-            .limit(count)
-        )
+        result = await self.session.execute(self._free_links_stmt(count))
+        return result.scalars().all()
+
+    async def claim_free_links(self, user_id: int, count: int):
+        """Атомарно закрепляет до count свободных ссылок за user_id.
 
-        result = await self.session.execute(stmt)
+        Один UPDATE ... WHERE id IN (SELECT ... FOR UPDATE SKIP LOCKED)
+        RETURNING: выбор и захват происходят за один round trip.
+        Транзакцию фиксирует вызывающий код, он же после commit
+        вызывает invalidate_vpn_caches().
+        """
+        result = await self.session.execute(
+            queries.CLAIM_FREE_LINKS, {"owner_id": user_id, "count": count}
+        )
         return result.scalars().all()
 
     async def assign_one_link_to_user(self, user_id: int):
-        link = await self.get_free_random_links(1)
-        if not link:
+        links = await self.claim_free_links(user_id, 1)
+        if not links:
+            await self.session.rollback()
             return None
 
-        link = link[0]
-        link.user_id = user_id
-
         await self.session.commit()
-        await self.session.refresh(link)
-
-        return link
+        invalidate_vpn_caches()
+        return links[0]
 
     async def assign_links_to_user(self, user_id: int, count: int):
-        links = await self.get_free_random_links(count)
+        links = await self.claim_free_links(user_id, count)
 
         if len(links) < count:
-
+            await self.session.rollback()
             return None
 
-        for link in links:
-            link.user_id = user_id
+        await self.session.commit()
+        invalidate_vpn_caches()
+        return links
+
+    async def assign_links_batch(self, requests: list[tuple[int, int]]):
+        """Раздаёт ссылки пачке пользователей одним UPDATE ... RETURNING.
+
+        requests — пары (user_id, count). Свободные ссылки блокируются
+        (SKIP LOCKED), нумеруются row_number() и делятся по диапазонам
+        [lo, hi) каждого пользователя. Всё или ничего: если свободных
+        ссылок не хватает на всю пачку, транзакция откатывается и
+        возвращается None. Результат — {user_id: [LinkModel, ...]}.
+        """
+        ranges = []
+        total = 0
+        for user_id, count in requests:
+            if count <= 0:
+                continue
+            ranges.append((user_id, total, total + count))
+            total += count
+
+        if not ranges:
+            return {}
+
+        locked = (
+            select(LinkModel.id)
+            .where(LinkModel.user_id.is_(None))
+            .order_by(LinkModel.id)
+            .limit(total)
+            .with_for_update(skip_locked=True)
+            .subquery("locked")
+        )
+        free = select(
+            locked.c.id,
+            func.row_number().over(order_by=locked.c.id).label("rn"),
+        ).subquery("free")
+        wanted = values(
+            column("user_id", BigInteger),
+            column("lo", Integer),
+            column("hi", Integer),
+            name="wanted",
+        ).data(ranges)
+
+        stmt = (
+            update(LinkModel)
+            .where(
+                LinkModel.id == free.c.id,
+                free.c.rn > wanted.c.lo,
+                free.c.rn <= wanted.c.hi,
+            )
+            .values(user_id=wanted.c.user_id)
+            .returning(LinkModel)
+            .execution_options(synchronize_session=False)
+        )
+        links = (await self.session.execute(stmt)).scalars().all()
+
+        if len(links) < total:
+            await self.session.rollback()
+            return None
 
         await self.session.commit()
+        invalidate_vpn_caches()
 
+        assigned: dict[int, list[LinkModel]] = {
+            user_id: [] for user_id, _, _ in ranges
+        }
         for link in links:
-            await self.session.refresh(link)
-
-        return links
+            assigned[link.user_id].append(link)
+        return assigned
 
     async def get_user_links(self, user_id: int):
         stmt = select(LinkModel).where(LinkModel.user_id == user_id)
@@ -0,0 +1,38 @@
+from fastapi import Request
+
+from middleware import AdmissionController
+from vpn.broadcast import BroadcastManager
+from vpn.db_services import VPNDatabase
+from vpn.live import ChangeFeed
+from vpn.snapshots import DailySnapshots
+from vpn.sweeper import ExpirySweeper
+from vpn.typeahead import UserTypeahead
+
+
+def get_vpn_db(request: Request) -> VPNDatabase:
+    return request.app.state.vpn_db
+
+
+def get_broadcasts(request: Request) -> BroadcastManager:
+    return request.app.state.broadcasts
+
+
+def get_sweeper(request: Request) -> ExpirySweeper:
+    return request.app.state.sweeper
+
+
+def get_snapshots(request: Request) -> DailySnapshots:
+    return request.app.state.snapshots
+
+
+def get_change_feed(request: Request) -> ChangeFeed:
+    return request.app.state.change_feed
+
+
+def get_typeahead(request: Request) -> UserTypeahead:
+    return request.app.state.typeahead
+
+
+def get_admission(request: Request) -> AdmissionController | None:
+    # None, если ADMISSION_ENABLED выключен
+    return getattr(request.app.state, "admission", None)
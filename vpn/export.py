@@ -0,0 +1,138 @@
+import csv
+import io
+import zlib
+from typing import AsyncIterator, Literal
+
+from sqlalchemy import select
+
+from config import EXPORT_CHUNK_SIZE
+from responses import dumps
+from vpn.db_services import VPNDatabase
+from vpn.models import LinkModel, VPNUser
+
+ExportFormat = Literal["csv", "ndjson"]
+
+FLUSH_BYTES = 64 * 1024
+
+USER_FIELDS = ["user_id", "user_name", "end_date", "end_trial_period", "links"]
+LINK_FIELDS = ["id", "link_address", "user_id"]
+
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+class _Encoder:
+    """Копит строки в буфер и отдаёт его кусками примерно по FLUSH_BYTES."""
+
+    def __init__(self, fmt: ExportFormat, fields: list[str]):
+        self.fmt = fmt
+        self.fields = fields
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer) if fmt == "csv" else None
+
+    def header(self) -> None:
+        if self.writer is not None:
+            self.writer.writerow(self.fields)
+
+    def write(self, record: dict) -> None:
+        if self.writer is not None:
+            self.writer.writerow(
+                [_csv_value(record[name]) for name in self.fields]
+            )
+        else:
+            self.buffer.write(dumps(record).decode())
+            self.buffer.write("\n")
+
+    def ready(self) -> bool:
+        return self.buffer.tell() >= FLUSH_BYTES
+
+    def take(self) -> bytes:
+        data = self.buffer.getvalue().encode()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return data
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return " ".join(value)
+    return value
+
+
+async def export_users(
+    db: VPNDatabase, fmt: ExportFormat
+) -> AsyncIterator[bytes]:
+    """Пользователи вместе со ссылками через серверный курсор.
+
+    Строки join идут по user_id, поэтому пользователь собирается из
+    соседних строк и в памяти не держится больше одного пользователя
+    и одной пачки курсора.
+    """
+    stmt = (
+        select(
+            VPNUser.user_id,
+            VPNUser.user_name,
+            VPNUser.end_date,
+            VPNUser.end_trial_period,
+            LinkModel.link_address,
+        )
+        .outerjoin(LinkModel, LinkModel.user_id == VPNUser.user_id)
+        .order_by(VPNUser.user_id, LinkModel.id)
+        .execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    )
+    encoder = _Encoder(fmt, USER_FIELDS)
+    encoder.header()
+    current = None
+
+    async for session in db.get_read_session():
+        result = await session.stream(stmt)
+        async for row in result:
+            if current is None or current["user_id"] != row.user_id:
+                if current is not None:
+                    encoder.write(current)
+                    if encoder.ready():
+                        yield encoder.take()
+                current = {
+                    "user_id": row.user_id,
+                    "user_name": row.user_name,
+                    "end_date": row.end_date,
+                    "end_trial_period": row.end_trial_period,
+                    "links": [],
+                }
+            if row.link_address is not None:
+                current["links"].append(row.link_address)
+
+    if current is not None:
+        encoder.write(current)
+    yield encoder.take()
+
+
+async def export_links(
+    db: VPNDatabase, fmt: ExportFormat
+) -> AsyncIterator[bytes]:
+    stmt = (
+        select(LinkModel.id, LinkModel.link_address, LinkModel.user_id)
+        .order_by(LinkModel.id)
+        .execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    )
+    encoder = _Encoder(fmt, LINK_FIELDS)
+    encoder.header()
+
+    async for session in db.get_read_session():
+        result = await session.stream(stmt)
+        async for row in result:
+            encoder.write(dict(row._mapping))
+            if encoder.ready():
+                yield encoder.take()
+
+    yield encoder.take()
+
+
+async def gzip_stream(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
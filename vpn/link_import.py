@@ -0,0 +1,165 @@
+import csv
+import json
+from dataclasses import asdict, dataclass, field
+from typing import AsyncIterator, Literal
+
+from sqlalchemy import String, bindparam, func, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from config import LINK_IMPORT_BATCH_SIZE
+from vpn.cache import invalidate_vpn_caches
+from vpn.db_services import VPNDatabase
+from vpn.models import LinkModel
+
+ImportFormat = Literal["csv", "ndjson"]
+
+MAX_LINE_BYTES = 64 * 1024
+MAX_REPORTED_ERRORS = 100
+LINK_ADDRESS_MAX_LEN = LinkModel.__table__.c.link_address.type.length
+
+# Один и тот же текст запроса на любой размер пачки: адреса уходят одним
+# массивом, поэтому prepared statement переиспользуется.
+_insert_links_stmt = (
+    pg_insert(LinkModel.__table__)
+    .from_select(
+        ["link_address"],
+        select(func.unnest(bindparam("addresses", type_=ARRAY(String)))),
+    )
+    .on_conflict_do_nothing(index_elements=[LinkModel.link_address])
+)
+
+
+@dataclass
+class ImportSummary:
+    inserted: int = 0
+    duplicates: int = 0
+    invalid: int = 0
+    errors: list[dict] = field(default_factory=list)
+
+    def add_error(self, line: int, error: str) -> None:
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": error})
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+async def iter_lines(
+    chunks: AsyncIterator[bytes],
+) -> AsyncIterator[tuple[int, bytes | None]]:
+    """Режет поток байт на строки, не держа в памяти больше одной строки.
+
+    Слишком длинная строка отдаётся как None и пропускается до
+    следующего перевода строки.
+    """
+    buffer = b""
+    line_no = 0
+    overflow = False
+
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for raw in lines:
+            line_no += 1
+            if overflow:
+                overflow = False
+                yield line_no, None
+            else:
+                yield line_no, raw
+        if len(buffer) > MAX_LINE_BYTES:
+            overflow = True
+            buffer = b""
+
+    if overflow:
+        yield line_no + 1, None
+    elif buffer.strip():
+        yield line_no + 1, buffer
+
+
+def parse_line(raw: bytes, fmt: ImportFormat) -> str | None:
+    """Достаёт link_address из строки CSV или NDJSON.
+
+    Пустая строка и заголовок CSV дают None; невалидные данные —
+    ValueError.
+    """
+    text = raw.decode("utf-8").strip()
+    if not text:
+        return None
+
+    if fmt == "ndjson":
+        item = json.loads(text)
+        if isinstance(item, dict):
+            item = item.get("link_address")
+        if not isinstance(item, str):
+            raise ValueError("link_address must be a string")
+        address = item.strip()
+    else:
+        row = next(csv.reader([text]))
+        address = row[0].strip() if row else ""
+        if address == "link_address":
+            return None
+
+    if not address:
+        raise ValueError("link_address required")
+    if len(address) > LINK_ADDRESS_MAX_LEN:
+        raise ValueError(
+            f"link_address longer than {LINK_ADDRESS_MAX_LEN} characters"
+        )
+    return address
+
+
+class LinkImporter:
+    """Потоковый импорт ссылок в свободный пул пачками по batch_size.
+
+    Каждая пачка — один INSERT ... SELECT unnest(...) ON CONFLICT
+    (link_address) DO NOTHING в своей короткой транзакции, так что
+    память и время удержания блокировок не зависят от размера файла.
+    """
+
+    def __init__(
+        self, db: VPNDatabase, batch_size: int = LINK_IMPORT_BATCH_SIZE
+    ):
+        self.db = db
+        self.batch_size = batch_size
+
+    async def run(
+        self, chunks: AsyncIterator[bytes], fmt: ImportFormat
+    ) -> ImportSummary:
+        summary = ImportSummary()
+        batch: list[str] = []
+
+        async for line_no, raw in iter_lines(chunks):
+            if raw is None:
+                summary.add_error(line_no, "line too long")
+                continue
+            try:
+                address = parse_line(raw, fmt)
+            except (ValueError, csv.Error) as e:
+                summary.add_error(line_no, str(e))
+                continue
+
+            if address is None:
+                continue
+
+            batch.append(address)
+            if len(batch) >= self.batch_size:
+                await self._flush(batch, summary)
+                batch = []
+
+        if batch:
+            await self._flush(batch, summary)
+
+        return summary
+
+    async def _flush(self, batch: list[str], summary: ImportSummary):
+        async for session in self.db.get_session():
+            result = await session.execute(
+                _insert_links_stmt, {"addresses": batch}
+            )
+            await session.commit()
+
+        invalidate_vpn_caches()
+        summary.inserted += result.rowcount
+        summary.duplicates += len(batch) - result.rowcount
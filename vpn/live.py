@@ -0,0 +1,145 @@
+import asyncio
+import json
+import logging
+
+import asyncpg
+from sqlalchemy.engine import make_url
+
+from config import (
+    DATABASE_URL_VPN,
+    LIVE_QUEUE_SIZE,
+    LIVE_RECONNECT_MAX_DELAY,
+)
+from vpn.cache import invalidate_vpn_caches
+
+logger = logging.getLogger(__name__)
+
+# канал из триггеров миграции 0004_change_notify
+CHANNEL = "vpn_changes"
+# клиент пропустил события и должен перечитать данные целиком
+RESYNC = {"type": "resync"}
+
+
+def asyncpg_dsn(db_url: str) -> str:
+    # postgresql+asyncpg://... -> postgresql://... для asyncpg.connect
+    url = make_url(db_url).set(drivername="postgresql")
+    return url.render_as_string(hide_password=False)
+
+
+def parse_payload(payload: str) -> list[dict]:
+    data = json.loads(payload)
+    if "events" in data:
+        return data["events"]
+    # пачка больше лимита триггера: {"type": "links_changed", "count": N}
+    return [data]
+
+
+class ChangeFeed:
+    """Раздаёт события из LISTEN vpn_changes подписчикам SSE.
+
+    На процесс одно выделенное соединение вне пула: LISTEN держит его
+    всё время работы. Каждое уведомление сбрасывает кэши процесса, так
+    что записи бота и других воркеров тоже меняют ETag. Подписчик,
+    не успевающий читать, и все подписчики после переподключения
+    получают resync вместо потерянных событий.
+    """
+
+    def __init__(
+        self,
+        db_url: str = DATABASE_URL_VPN,
+        queue_size: int = LIVE_QUEUE_SIZE,
+        max_delay: float = LIVE_RECONNECT_MAX_DELAY,
+    ):
+        self.dsn = asyncpg_dsn(db_url)
+        self.queue_size = queue_size
+        self.max_delay = max_delay
+        self.connected = asyncio.Event()
+        self.notifications = 0
+        self.reconnects = 0
+        self._subscribers: set[asyncio.Queue] = set()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def subscribe(self, maxsize: int | None = None) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=maxsize or self.queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+
+    def publish(self, events: list[dict]) -> None:
+        for queue in self._subscribers:
+            for event in events:
+                try:
+                    queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    # старые события уже не важны: клиент перечитает всё
+                    while not queue.empty():
+                        queue.get_nowait()
+                    queue.put_nowait(RESYNC)
+                    break
+
+    def _on_notify(self, conn, pid, channel, payload) -> None:
+        self.notifications += 1
+        invalidate_vpn_caches()
+        try:
+            events = parse_payload(payload)
+        except (ValueError, TypeError):
+            logger.warning("bad %s payload: %r", CHANNEL, payload)
+            events = [RESYNC]
+        self.publish(events)
+
+    async def _listen_once(self) -> None:
+        conn = await asyncpg.connect(self.dsn)
+        lost = asyncio.Event()
+        conn.add_termination_listener(lambda c: lost.set())
+        try:
+            await conn.add_listener(CHANNEL, self._on_notify)
+            self.connected.set()
+            await lost.wait()
+        finally:
+            self.connected.clear()
+            await conn.close(timeout=5)
+
+    async def run_forever(self) -> None:
+        delay = 1.0
+        while True:
+            try:
+                await self._listen_once()
+                delay = 1.0
+            except Exception as e:
+                logger.warning("change feed: %s, reconnect in %.0fs", e, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_delay)
+            # пока слушателя не было, изменения могли пройти мимо
+            self.reconnects += 1
+            invalidate_vpn_caches()
+            self.publish([RESYNC])
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run_forever())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for queue in list(self._subscribers):
+            # None — сигнал потокам SSE завершиться
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "connected": self.connected.is_set(),
+            "subscribers": len(self._subscribers),
+            "notifications": self.notifications,
+            "reconnects": self.reconnects,
+        }
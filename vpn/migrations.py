@@ -0,0 +1,271 @@
+"""Ревизии схемы базы VPN.
+
+Применить: python -m vpn.migrations upgrade
+Проверить: python -m vpn.migrations check
+"""
+
+import argparse
+import asyncio
+import sys
+
+from config import DATABASE_URL_VPN
+from database.db import dispose_engines, get_engine
+from database.migrations import (
+    Migration,
+    MigrationRunner,
+    SchemaMismatchError,
+)
+
+MIGRATIONS = [
+    Migration(
+        revision="0001_initial",
+        description="tables users and links",
+        # IF NOT EXISTS: базы, созданные до миграций, уже содержат таблицы
+        statements=(
+            """
+            CREATE TABLE IF NOT EXISTS users (
+                user_id BIGINT PRIMARY KEY,
+                user_name VARCHAR(64),
+                end_date DATE,
+                end_trial_period DATE
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS links (
+                id SERIAL PRIMARY KEY,
+                link_address VARCHAR(256) NOT NULL UNIQUE,
+                user_id BIGINT
+                    REFERENCES users (user_id) ON DELETE CASCADE
+            )
+            """,
+        ),
+    ),
+    Migration(
+        revision="0002_btree_indexes",
+        description="indexes on links.user_id and user expiry dates",
+        transactional=False,
+        statements=(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_links_user_id "
+            "ON links (user_id)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_links_free "
+            "ON links (id) WHERE user_id IS NULL",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_links_free_first "
+            "ON links ((user_id IS NULL), id)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_end_date "
+            "ON users (end_date)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS "
+            "ix_users_end_trial_period ON users (end_trial_period)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_expires_at "
+            "ON users (GREATEST(end_date, end_trial_period))",
+        ),
+    ),
+    Migration(
+        revision="0003_trgm_indexes",
+        description="trigram indexes for user search",
+        transactional=False,
+        statements=(
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_user_id_trgm "
+            "ON users USING gin ((user_id::text) gin_trgm_ops)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_user_name_trgm "
+            "ON users USING gin (user_name gin_trgm_ops)",
+        ),
+    ),
+    Migration(
+        revision="0004_change_notify",
+        description="NOTIFY vpn_changes on users/links changes",
+        # Statement-level триггеры: одно уведомление на запрос. Больше
+        # 50 строк — одно событие *_changed с числом строк, клиенту
+        # проще перечитать страницу; так же не упираемся в лимит
+        # NOTIFY в 8000 байт.
+        statements=(
+            """
+            CREATE OR REPLACE FUNCTION vpn_publish(
+                events jsonb, total bigint, entity text
+            ) RETURNS void LANGUAGE plpgsql AS $$
+            BEGIN
+                IF total = 0 THEN
+                    RETURN;
+                ELSIF total > 50 THEN
+                    PERFORM pg_notify('vpn_changes', jsonb_build_object(
+                        'type', entity || '_changed', 'count', total
+                    )::text);
+                ELSE
+                    PERFORM pg_notify('vpn_changes', jsonb_build_object(
+                        'events', events
+                    )::text);
+                END IF;
+            END $$
+            """,
+            """
+            CREATE OR REPLACE FUNCTION vpn_notify_links()
+            RETURNS trigger LANGUAGE plpgsql AS $$
+            DECLARE
+                events jsonb;
+                total bigint;
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    SELECT count(*) INTO total FROM new_rows;
+                    IF total <= 50 THEN
+                        SELECT jsonb_agg(jsonb_build_object(
+                            'type', 'link_created',
+                            'id', id, 'user_id', user_id
+                        )) INTO events FROM new_rows;
+                    END IF;
+                ELSIF TG_OP = 'DELETE' THEN
+                    SELECT count(*) INTO total FROM old_rows;
+                    IF total <= 50 THEN
+                        SELECT jsonb_agg(jsonb_build_object(
+                            'type', 'link_deleted',
+                            'id', id, 'user_id', user_id
+                        )) INTO events FROM old_rows;
+                    END IF;
+                ELSE
+                    SELECT count(*) INTO total
+                    FROM old_rows o JOIN new_rows n USING (id)
+                    WHERE (o.link_address, o.user_id)
+                        IS DISTINCT FROM (n.link_address, n.user_id);
+                    IF total <= 50 THEN
+                        SELECT jsonb_agg(jsonb_build_object(
+                            'type', CASE
+                                WHEN n.user_id IS NULL
+                                    AND o.user_id IS NOT NULL
+                                    THEN 'link_freed'
+                                WHEN n.user_id IS DISTINCT FROM o.user_id
+                                    THEN 'link_assigned'
+                                ELSE 'link_updated'
+                            END,
+                            'id', n.id, 'user_id', n.user_id
+                        )) INTO events
+                        FROM old_rows o JOIN new_rows n USING (id)
+                        WHERE (o.link_address, o.user_id)
+                            IS DISTINCT FROM (n.link_address, n.user_id);
+                    END IF;
+                END IF;
+                PERFORM vpn_publish(events, total, 'links');
+                RETURN NULL;
+            END $$
+            """,
+            """
+            CREATE OR REPLACE FUNCTION vpn_notify_users()
+            RETURNS trigger LANGUAGE plpgsql AS $$
+            DECLARE
+                events jsonb;
+                total bigint;
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    SELECT count(*) INTO total FROM new_rows;
+                    IF total <= 50 THEN
+                        SELECT jsonb_agg(jsonb_build_object(
+                            'type', 'user_created', 'user_id', user_id
+                        )) INTO events FROM new_rows;
+                    END IF;
+                ELSIF TG_OP = 'DELETE' THEN
+                    SELECT count(*) INTO total FROM old_rows;
+                    IF total <= 50 THEN
+                        SELECT jsonb_agg(jsonb_build_object(
+                            'type', 'user_deleted', 'user_id', user_id
+                        )) INTO events FROM old_rows;
+                    END IF;
+                ELSE
+                    SELECT count(*) INTO total
+                    FROM old_rows o JOIN new_rows n USING (user_id)
+                    WHERE ROW(o.*) IS DISTINCT FROM ROW(n.*);
+                    IF total <= 50 THEN
+                        SELECT jsonb_agg(jsonb_build_object(
+                            'type', 'user_updated', 'user_id', n.user_id
+                        )) INTO events
+                        FROM old_rows o JOIN new_rows n USING (user_id)
+                        WHERE ROW(o.*) IS DISTINCT FROM ROW(n.*);
+                    END IF;
+                END IF;
+                PERFORM vpn_publish(events, total, 'users');
+                RETURN NULL;
+            END $$
+            """,
+            *(
+                statement
+                for table in ("links", "users")
+                for statement in (
+                    f"DROP TRIGGER IF EXISTS {table}_notify_insert "
+                    f"ON {table}",
+                    f"CREATE TRIGGER {table}_notify_insert "
+                    f"AFTER INSERT ON {table} "
+                    "REFERENCING NEW TABLE AS new_rows "
+                    "FOR EACH STATEMENT "
+                    f"EXECUTE FUNCTION vpn_notify_{table}()",
+                    f"DROP TRIGGER IF EXISTS {table}_notify_update "
+                    f"ON {table}",
+                    f"CREATE TRIGGER {table}_notify_update "
+                    f"AFTER UPDATE ON {table} "
+                    "REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows "
+                    "FOR EACH STATEMENT "
+                    f"EXECUTE FUNCTION vpn_notify_{table}()",
+                    f"DROP TRIGGER IF EXISTS {table}_notify_delete "
+                    f"ON {table}",
+                    f"CREATE TRIGGER {table}_notify_delete "
+                    f"AFTER DELETE ON {table} "
+                    "REFERENCING OLD TABLE AS old_rows "
+                    "FOR EACH STATEMENT "
+                    f"EXECUTE FUNCTION vpn_notify_{table}()",
+                )
+            ),
+        ),
+    ),
+    Migration(
+        revision="0005_daily_stats",
+        description="daily_stats snapshot table",
+        # одна строка агрегатов на день, пишет vpn/snapshots.py;
+        # первичный ключ по day и есть индекс для чтения диапазона
+        statements=(
+            """
+            CREATE TABLE IF NOT EXISTS daily_stats (
+                day DATE PRIMARY KEY,
+                total_users BIGINT NOT NULL,
+                active_subscriptions BIGINT NOT NULL,
+                trial_users BIGINT NOT NULL,
+                expired_users BIGINT NOT NULL,
+                total_links BIGINT NOT NULL,
+                free_links BIGINT NOT NULL,
+                computed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+            """,
+        ),
+    ),
+]
+
+
+def get_runner() -> MigrationRunner:
+    return MigrationRunner(get_engine(DATABASE_URL_VPN), MIGRATIONS)
+
+
+async def _main(command: str) -> int:
+    runner = get_runner()
+    try:
+        if command == "upgrade":
+            applied = await runner.upgrade()
+            print("applied: " + (", ".join(applied) or "nothing"))
+        elif command == "check":
+            try:
+                await runner.check()
+            except SchemaMismatchError as e:
+                print(e, file=sys.stderr)
+                return 1
+            print(f"up to date: {runner.head}")
+        else:
+            for migration in await runner.pending():
+                print(migration.revision)
+    finally:
+        await dispose_engines()
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "command",
+        choices=["upgrade", "check", "pending"],
+        nargs="?",
+        default="upgrade",
+    )
+    sys.exit(asyncio.run(_main(parser.parse_args().command)))
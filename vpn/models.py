@@ -1,9 +1,18 @@
 from __future__ import annotations
 
-from datetime import date
+from datetime import date, datetime
 from typing import Optional
 
-from sqlalchemy import BigInteger, Date, ForeignKey, String
+from sqlalchemy import (
+    BigInteger,
+    Date,
+    DateTime,
+    ForeignKey,
+    Index,
+    String,
+    func,
+    text,
+)
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -13,6 +22,31 @@ class Base(DeclarativeBase):
 
 class VPNUser(Base):
     __tablename__ = "users"
+    # Индексы создаются миграциями vpn/migrations.py: trigram —
+    # 0003_trgm_indexes, по датам — 0002_btree_indexes. Здесь они
+    # объявлены для справки; без миграций запросы работают, но
+    # сканируют таблицу.
+    __table_args__ = (
+        # поиск по подстроке в /vpn/ (нужно расширение pg_trgm)
+        Index(
+            "ix_users_user_id_trgm",
+            text("(user_id::text) gin_trgm_ops"),
+            postgresql_using="gin",
+        ),
+        Index(
+            "ix_users_user_name_trgm",
+            "user_name",
+            postgresql_using="gin",
+            postgresql_ops={"user_name": "gin_trgm_ops"},
+        ),
+        Index("ix_users_end_date", "end_date"),
+        Index("ix_users_end_trial_period", "end_trial_period"),
+        # поиск истёкших пользователей в vpn/sweeper.py
+        Index(
+            "ix_users_expires_at",
+            text("GREATEST(end_date, end_trial_period)"),
+        ),
+    )
 
     user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
     user_name: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
@@ -28,6 +62,15 @@ class VPNUser(Base):
 
 class LinkModel(Base):
     __tablename__ = "links"
+    # Индексы создаются миграцией 0002_btree_indexes в vpn/migrations.py
+    __table_args__ = (
+        # ссылки пользователя и каскадное удаление по внешнему ключу
+        Index("ix_links_user_id", "user_id"),
+        # пул свободных ссылок для LinkService
+        Index("ix_links_free", "id", postgresql_where=text("user_id IS NULL")),
+        # порядок GET /vpn/links: сначала свободные, затем по id убыв.
+        Index("ix_links_free_first", text("(user_id IS NULL)"), "id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
 
@@ -40,3 +83,20 @@ class LinkModel(Base):
     )
 
     user = relationship("VPNUser", back_populates="links")
+
+
+class DailyStat(Base):
+    """Агрегаты на конец дня, см. vpn/snapshots.py."""
+
+    __tablename__ = "daily_stats"
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    total_users: Mapped[int] = mapped_column(BigInteger)
+    active_subscriptions: Mapped[int] = mapped_column(BigInteger)
+    trial_users: Mapped[int] = mapped_column(BigInteger)
+    expired_users: Mapped[int] = mapped_column(BigInteger)
+    total_links: Mapped[int] = mapped_column(BigInteger)
+    free_links: Mapped[int] = mapped_column(BigInteger)
+    computed_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now()
+    )
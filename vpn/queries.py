@@ -0,0 +1,139 @@
+"""Горячие запросы VPN, собранные один раз на процесс.
+
+select() на каждый запрос — это построение дерева выражения и расчёт
+ключа кэша компиляции. Готовый объект запоминает свой ключ, поэтому
+повторное выполнение сразу находит скомпилированный SQL в кэше
+движка, а одинаковый текст SQL — подготовленный запрос в кэше asyncpg
+на соединении. Значения передаются только через bindparam; запросы
+разной формы (с фильтром и без) — отдельные объекты из lru_cache.
+"""
+
+from functools import lru_cache
+
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Integer,
+    Text,
+    bindparam,
+    cast,
+    func,
+    or_,
+    select,
+    text,
+    tuple_,
+    update,
+)
+
+from vpn.models import LinkModel, VPNUser
+
+USER_COLUMNS = (
+    VPNUser.user_id,
+    VPNUser.user_name,
+    VPNUser.end_date,
+    VPNUser.end_trial_period,
+)
+
+USERS_LIST = select(*USER_COLUMNS)
+
+# оценка числа строк из статистики; -1, если ANALYZE ещё не было
+USERS_ESTIMATE = text(
+    "SELECT reltuples::bigint FROM pg_class WHERE oid = 'users'::regclass"
+)
+
+USER_EXISTS = select(VPNUser.user_id).where(
+    VPNUser.user_id == bindparam("user_id", type_=BigInteger)
+)
+
+
+def _user_search(by_id: bool):
+    pattern = bindparam("pattern", type_=Text)
+    condition = VPNUser.user_name.ilike(pattern, escape="\\")
+    if by_id:
+        condition = or_(
+            cast(VPNUser.user_id, Text).like(pattern, escape="\\"),
+            condition,
+        )
+    return condition
+
+
+@lru_cache
+def users_count(search: bool, by_id: bool):
+    stmt = select(func.count()).select_from(VPNUser)
+    if search:
+        stmt = stmt.where(_user_search(by_id))
+    return stmt
+
+
+@lru_cache
+def users_page(search: bool, by_id: bool):
+    """Параметры: pattern (при search), offset, limit."""
+    stmt = select(*USER_COLUMNS)
+    if search:
+        stmt = stmt.where(_user_search(by_id))
+    return (
+        stmt.order_by(VPNUser.user_id)
+        .offset(bindparam("offset", type_=Integer))
+        .limit(bindparam("limit", type_=Integer))
+    )
+
+
+@lru_cache
+def links_count(by_user: bool):
+    stmt = select(func.count(LinkModel.id))
+    if by_user:
+        stmt = stmt.where(
+            LinkModel.user_id == bindparam("user_id", type_=BigInteger)
+        )
+    return stmt
+
+
+@lru_cache
+def links_page(by_user: bool, direction: str | None):
+    """Страница ссылок, сначала свободные.
+
+    direction None — по номеру страницы (offset), next/prev — keyset
+    от курсора (cursor_free, cursor_id). Всегда нужен limit.
+    """
+    is_free = LinkModel.user_id.is_(None)
+    stmt = select(LinkModel.id, LinkModel.link_address, LinkModel.user_id)
+    if by_user:
+        stmt = stmt.where(
+            LinkModel.user_id == bindparam("user_id", type_=BigInteger)
+        )
+
+    if direction is None:
+        stmt = stmt.offset(bindparam("offset", type_=Integer))
+    else:
+        sort_key = tuple_(is_free, LinkModel.id)
+        bound = tuple_(
+            bindparam("cursor_free", type_=Boolean),
+            bindparam("cursor_id", type_=Integer),
+        )
+        stmt = stmt.where(
+            sort_key < bound if direction == "next" else sort_key > bound
+        )
+
+    if direction == "prev":
+        stmt = stmt.order_by(is_free.asc(), LinkModel.id.asc())
+    else:
+        stmt = stmt.order_by(is_free.desc(), LinkModel.id.desc())
+    return stmt.limit(bindparam("limit", type_=Integer))
+
+
+# owner_id, а не user_id: имя колонки в SET занято самим UPDATE
+CLAIM_FREE_LINKS = (
+    update(LinkModel)
+    .where(
+        LinkModel.id.in_(
+            select(LinkModel.id)
+            .where(LinkModel.user_id.is_(None))
+            .order_by(LinkModel.id)
+            .limit(bindparam("count", type_=Integer))
+            .with_for_update(skip_locked=True)
+        )
+    )
+    .values(user_id=bindparam("owner_id", type_=BigInteger))
+    .returning(LinkModel)
+    .execution_options(synchronize_session=False)
+)
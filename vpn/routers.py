@@ -1,63 +1,141 @@
 # vpn/router.py
-from fastapi import APIRouter, HTTPException, Query, Request
-from fastapi.responses import RedirectResponse
+import asyncio
+import json
+import time
+from dataclasses import asdict
+from datetime import date, timedelta
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+)
+from fastapi.responses import (
+    JSONResponse,
+    RedirectResponse,
+    StreamingResponse,
+)
 from fastapi.templating import Jinja2Templates
-from sqlalchemy import case, delete, func, select, update
+from sqlalchemy import delete, update
 from sqlalchemy.exc import IntegrityError
 from starlette.status import HTTP_303_SEE_OTHER
 
-from vpn.db_services import VPNDatabase, VPNUtils
-from vpn.models import LinkModel, VPNUser
-from vpn.send_message import SendMessageIn, tg_send_message
-
-router = APIRouter(prefix="/vpn", tags=["VPN"])
+from config import (
+    LIVE_HEARTBEAT,
+    SLOW_QUERY_ENABLED,
+    SNAPSHOT_MAX_RANGE_DAYS,
+    TYPEAHEAD_MAX_LIMIT,
+)
+from database.slow_queries import slow_query_log
+from middleware import AdmissionController
+from responses import FastJSONResponse
+from static_assets import static_url
+from vpn import queries
+from vpn.broadcast import BroadcastManager
+from vpn.cache import data_version, etag_matches, invalidate_vpn_caches
+from vpn.db_services import InvalidCursor, VPNDatabase, VPNUtils
+from vpn.dependencies import (
+    get_admission,
+    get_broadcasts,
+    get_change_feed,
+    get_snapshots,
+    get_sweeper,
+    get_typeahead,
+    get_vpn_db,
+)
+from vpn.export import (
+    MEDIA_TYPES,
+    ExportFormat,
+    export_links,
+    export_users,
+    gzip_stream,
+)
+from vpn.link_import import ImportFormat, LinkImporter
+from vpn.live import ChangeFeed
+from vpn.models import LinkModel
+from vpn.schemas import BulkDeleteUsersIn, BulkReassignLinksIn
+from vpn.send_message import SendMessageIn
+from vpn.snapshots import DailySnapshots
+from vpn.sweeper import ExpirySweeper
+from vpn.typeahead import UserTypeahead
+
+router = APIRouter(
+    prefix="/vpn", tags=["VPN"], default_response_class=FastJSONResponse
+)
 templates = Jinja2Templates(directory="frontend/templates")
+templates.env.globals["static_url"] = static_url
+
+# браузер хранит ответ, но перед использованием сверяет ETag
+REVALIDATE = "private, no-cache"
+
+
+def _conditional(request: Request, *parts) -> tuple[str, Response | None]:
+    """ETag по версии данных и готовый 304, если он совпал у клиента.
+
+    Проверяется до запросов в БД и рендеринга шаблона.
+    """
+    etag = data_version.etag(*parts)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return etag, Response(
+            status_code=304,
+            headers={"ETag": etag, "Cache-Control": REVALIDATE},
+        )
+    return etag, None
+
+
+def _set_etag(response: Response, etag: str) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = REVALIDATE
 
 
 @router.get("/")
-async def vpn_page(request: Request, page: int = 1, search: str = ""):
+async def vpn_page(
+    request: Request,
+    page: int = 1,
+    search: str = "",
+    db: VPNDatabase = Depends(get_vpn_db),
+):
     if not request.session.get("auth"):
         return RedirectResponse("/auth/login", status_code=HTTP_303_SEE_OTHER)
 
     if request.session.get("role") != "vpn":
         return RedirectResponse("/auth/login", status_code=HTTP_303_SEE_OTHER)
 
-    utils = VPNUtils()
-    users = await utils.get_users_list()
-
-    if search:
-        users = [u for u in users if search in str(u["user_id"])]
-
-    page_size = 10
-    total_pages = max(1, -(-len(users) // page_size))
-
-    page = max(1, min(page, total_pages))
+    etag, not_modified = _conditional(request)
+    if not_modified:
+        return not_modified
 
-    start = (page - 1) * page_size
-    end = start + page_size
-    page_users = users[start:end]
+    utils = VPNUtils(db)
+    result = await utils.get_users_page(page=page, page_size=10, search=search)
 
-    return templates.TemplateResponse(
+    response = templates.TemplateResponse(
         "vpn.html",
         {
             "request": request,
-            "users": page_users,
-            "page": page,
-            "total_pages": total_pages,
+            "users": result["users"],
+            "page": result["page"],
+            "total_pages": result["total_pages"],
             "search": search,
         },
     )
+    _set_etag(response, etag)
+    return response
 
 
 @router.post("/delete/{user_id}")
-async def delete_user(request: Request, user_id: int):
+async def delete_user(
+    request: Request, user_id: int, db: VPNDatabase = Depends(get_vpn_db)
+):
     if not request.session.get("auth"):
         return RedirectResponse("/auth/login", status_code=HTTP_303_SEE_OTHER)
 
     if request.session.get("role") != "vpn":
         return RedirectResponse("/auth/login", status_code=HTTP_303_SEE_OTHER)
 
-    utils = VPNUtils()
+    utils = VPNUtils(db)
     await utils.delete_user(user_id)
 
     return RedirectResponse("/vpn", status_code=HTTP_303_SEE_OTHER)
@@ -70,60 +148,141 @@ def _check_vpn_auth(request: Request):
         raise HTTPException(status_code=403, detail="Forbidden")
 
 
+@router.post("/users/bulk_delete")
+async def bulk_delete_users(
+    request: Request,
+    payload: BulkDeleteUsersIn,
+    db: VPNDatabase = Depends(get_vpn_db),
+):
+    _check_vpn_auth(request)
+
+    utils = VPNUtils(db)
+    return await utils.delete_users(payload.user_ids)
+
+
+@router.get("/users/typeahead")
+async def users_typeahead(
+    request: Request,
+    q: str = "",
+    limit: int = Query(10, ge=1, le=TYPEAHEAD_MAX_LIMIT),
+    index: UserTypeahead = Depends(get_typeahead),
+):
+    """Подсказки по user_id (префикс) и имени (префикс, подстрока)."""
+    _check_vpn_auth(request)
+    if not index.stats()["running"]:
+        raise HTTPException(status_code=503, detail="Typeahead disabled")
+    if not index.ready.is_set():
+        raise HTTPException(
+            status_code=503,
+            detail="Index is loading",
+            headers={"Retry-After": "5"},
+        )
+
+    started = time.perf_counter()
+    items = index.search(q, limit)
+    return FastJSONResponse(
+        {
+            "items": items,
+            "took_ms": round((time.perf_counter() - started) * 1000, 3),
+        }
+    )
+
+
+@router.get("/users/typeahead/stats")
+async def users_typeahead_stats(
+    request: Request, index: UserTypeahead = Depends(get_typeahead)
+):
+    _check_vpn_auth(request)
+    return index.stats()
+
+
 @router.get("/links")
 async def get_links(
     request: Request,
     page: int = Query(1, ge=1),
     user_id: int | None = Query(None),
     per_page: int = Query(10, ge=1, le=100),
+    cursor: str | None = Query(None),
+    db: VPNDatabase = Depends(get_vpn_db),
 ):
     _check_vpn_auth(request)
 
-    db = VPNDatabase()
-    async for session in db.get_session():
+    etag, not_modified = _conditional(request)
+    if not_modified:
+        return not_modified
 
-        base_stmt = select(LinkModel)
-        count_stmt = select(func.count(LinkModel.id))
+    utils = VPNUtils(db)
+    try:
+        result = await utils.get_links_page(
+            page=page, per_page=per_page, user_id=user_id, cursor=cursor
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        if user_id is not None:
-            base_stmt = base_stmt.where(LinkModel.user_id == user_id)
-            count_stmt = count_stmt.where(LinkModel.user_id == user_id)
+    # готовый ответ: FastAPI не гоняет страницу через jsonable_encoder
+    response = FastJSONResponse(result)
+    _set_etag(response, etag)
+    return response
 
-        # total count
-        total = (await session.execute(count_stmt)).scalar_one()
-        total_pages = max(1, (total + per_page - 1) // per_page)
 
-        # offset/limit
-        offset = (page - 1) * per_page
+@router.get("/summary")
+async def get_summary(
+    request: Request,
+    response: Response,
+    expiring_days: int = Query(7, ge=0, le=365),
+    db: VPNDatabase = Depends(get_vpn_db),
+):
+    _check_vpn_auth(request)
 
-        stmt = (
-            base_stmt.order_by(
-                case((LinkModel.user_id == None, 0), else_=1),
-                LinkModel.id.desc(),
-            )
-            .offset(offset)
-            .limit(per_page)
-        )
-        res = await session.execute(stmt)
-        links = res.scalars().all()
+    # сводка зависит от текущей даты, а не только от данных
+    etag, not_modified = _conditional(request, date.today().isoformat())
+    if not_modified:
+        return not_modified
+    _set_etag(response, etag)
 
-        return {
-            "items": [
-                {
-                    "id": l.id,
-                    "link_address": l.link_address,
-                    "user_id": l.user_id,
-                }
-                for l in links
-            ],
-            "page": page,
-            "total_pages": total_pages,
-            "total": total,
-        }
+    utils = VPNUtils(db)
+    return await utils.get_summary(expiring_days)
+
+
+def _export_response(chunks, name: str, fmt: ExportFormat, gzip: bool):
+    filename = f"{name}.{fmt}"
+    media_type = MEDIA_TYPES[fmt]
+    if gzip:
+        chunks = gzip_stream(chunks)
+        filename += ".gz"
+        media_type = "application/gzip"
+
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/export/users")
+async def export_users_file(
+    request: Request,
+    format: ExportFormat = Query("csv"),
+    gzip: bool = Query(False),
+    db: VPNDatabase = Depends(get_vpn_db),
+):
+    _check_vpn_auth(request)
+    return _export_response(export_users(db, format), "users", format, gzip)
+
+
+@router.get("/export/links")
+async def export_links_file(
+    request: Request,
+    format: ExportFormat = Query("csv"),
+    gzip: bool = Query(False),
+    db: VPNDatabase = Depends(get_vpn_db),
+):
+    _check_vpn_auth(request)
+    return _export_response(export_links(db, format), "links", format, gzip)
 
 
 @router.post("/links")
-async def create_link(request: Request):
+async def create_link(request: Request, db: VPNDatabase = Depends(get_vpn_db)):
     _check_vpn_auth(request)
 
     data = await request.json()
@@ -133,7 +292,6 @@ async def create_link(request: Request):
     if not link_address:
         raise HTTPException(status_code=400, detail="link_address required")
 
-    db = VPNDatabase()
     async for session in db.get_session():
         new_link = LinkModel(link_address=link_address, user_id=user_id)
         session.add(new_link)
@@ -144,6 +302,7 @@ async def create_link(request: Request):
             await session.rollback()
             raise HTTPException(status_code=400, detail=f"DB error: {e}")
 
+        invalidate_vpn_caches()
         await session.refresh(new_link)
         return {
             "success": True,
@@ -155,8 +314,43 @@ async def create_link(request: Request):
         }
 
 
+@router.post("/links/import")
+async def import_links(
+    request: Request,
+    format: ImportFormat = Query("csv"),
+    db: VPNDatabase = Depends(get_vpn_db),
+):
+    _check_vpn_auth(request)
+
+    importer = LinkImporter(db)
+    summary = await importer.run(request.stream(), format)
+    return {"success": True, **summary.as_dict()}
+
+
+@router.put("/links/bulk")
+async def bulk_reassign_links(
+    request: Request,
+    payload: BulkReassignLinksIn,
+    db: VPNDatabase = Depends(get_vpn_db),
+):
+    _check_vpn_auth(request)
+
+    utils = VPNUtils(db)
+    try:
+        return await utils.reassign_links(
+            [(item.link_id, item.user_id) for item in payload.items]
+        )
+    except IntegrityError:
+        # пользователь удалён между проверкой и UPDATE
+        raise HTTPException(
+            status_code=409, detail="Users changed concurrently, retry"
+        )
+
+
 @router.put("/links/{link_id}")
-async def update_link(request: Request, link_id: int):
+async def update_link(
+    request: Request, link_id: int, db: VPNDatabase = Depends(get_vpn_db)
+):
     _check_vpn_auth(request)
 
     data = await request.json()
@@ -166,13 +360,12 @@ async def update_link(request: Request, link_id: int):
     if not link_address:
         raise HTTPException(status_code=400, detail="link_address required")
 
-    db = VPNDatabase()
     async for session in db.get_session():
 
         # ✅ если user_id не null — проверяем что пользователь существует
         if user_id is not None:
             user_exists = await session.execute(
-                select(VPNUser.user_id).where(VPNUser.user_id == user_id)
+                queries.USER_EXISTS, {"user_id": user_id}
             )
             if user_exists.scalar_one_or_none() is None:
                 raise HTTPException(
@@ -197,14 +390,16 @@ async def update_link(request: Request, link_id: int):
                 status_code=400, detail="Invalid user_id (FK constraint)"
             )
 
+        invalidate_vpn_caches()
         return {"success": True}
 
 
 @router.delete("/links/{link_id}")
-async def delete_link(request: Request, link_id: int):
+async def delete_link(
+    request: Request, link_id: int, db: VPNDatabase = Depends(get_vpn_db)
+):
     _check_vpn_auth(request)
 
-    db = VPNDatabase()
     async for session in db.get_session():
         stmt = delete(LinkModel).where(LinkModel.id == link_id)
         result = await session.execute(stmt)
@@ -212,22 +407,174 @@ async def delete_link(request: Request, link_id: int):
             raise HTTPException(status_code=404, detail="Link not found")
 
         await session.commit()
+        invalidate_vpn_caches()
         return {"success": True}
 
+
 @router.post("/send_message")
-async def send_message(request: Request, payload: SendMessageIn):
+async def send_message(
+    request: Request,
+    payload: SendMessageIn,
+    db: VPNDatabase = Depends(get_vpn_db),
+    broadcasts: BroadcastManager = Depends(get_broadcasts),
+):
     _check_vpn_auth(request)
 
-    sent = 0
-    failed = 0
-    errors = []
+    if payload.segment is not None:
+        recipients = VPNUtils(db).iter_segment_user_ids(payload.segment)
+    else:
+        recipients = broadcasts.iter_chunks(payload.user_ids)
+
+    job = broadcasts.start(recipients, payload.text)
+    return job.as_dict()
+
+
+@router.get("/send_message/{job_id}")
+async def send_message_status(
+    request: Request,
+    job_id: str,
+    broadcasts: BroadcastManager = Depends(get_broadcasts),
+):
+    _check_vpn_auth(request)
+
+    job = broadcasts.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.as_dict()
+
+
+@router.get("/sweeper")
+async def sweeper_stats(
+    request: Request, sweeper: ExpirySweeper = Depends(get_sweeper)
+):
+    _check_vpn_auth(request)
+    return sweeper.stats()
+
+
+@router.post("/sweeper/run")
+async def sweeper_run(
+    request: Request,
+    dry_run: bool = Query(True),
+    sweeper: ExpirySweeper = Depends(get_sweeper),
+):
+    _check_vpn_auth(request)
+
+    run = await sweeper.run_once(dry_run=dry_run)
+    return asdict(run)
+
+
+@router.get("/stats/daily")
+async def daily_stats(
+    request: Request,
+    start: date | None = Query(None),
+    end: date | None = Query(None),
+    snapshots: DailySnapshots = Depends(get_snapshots),
+):
+    """Дневные агрегаты из daily_stats, по умолчанию за последний год."""
+    _check_vpn_auth(request)
+
+    end = end or date.today()
+    start = start or end - timedelta(days=364)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start is after end")
+    if (end - start).days >= SNAPSHOT_MAX_RANGE_DAYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Range is limited to {SNAPSHOT_MAX_RANGE_DAYS} days",
+        )
+
+    items = await snapshots.get_range(start, end)
+    return FastJSONResponse({"start": start, "end": end, "items": items})
+
+
+@router.get("/stats/daily/job")
+async def daily_stats_job(
+    request: Request, snapshots: DailySnapshots = Depends(get_snapshots)
+):
+    _check_vpn_auth(request)
+    return snapshots.stats()
+
+
+@router.post("/stats/daily/run")
+async def daily_stats_run(
+    request: Request,
+    force: bool = Query(True),
+    snapshots: DailySnapshots = Depends(get_snapshots),
+):
+    _check_vpn_auth(request)
+    return await snapshots.run_once(force=force)
+
+
+@router.get("/admission")
+async def admission_stats(
+    request: Request,
+    admission: AdmissionController | None = Depends(get_admission),
+):
+    _check_vpn_auth(request)
+    if admission is None:
+        return {"enabled": False}
+    return {"enabled": True, **admission.stats()}
 
-    for chat_id in payload.user_ids:
-        try:
-            await tg_send_message(chat_id, payload.text)
-            sent += 1
-        except Exception as e:
-            failed += 1
-            errors.append({"chat_id": chat_id, "error": str(e)})
 
-    return {"sent": sent, "failed": failed, "errors": errors}
\ No newline at end of file
+@router.get("/slow_queries")
+async def slow_queries(request: Request, download: bool = False):
+    _check_vpn_auth(request)
+
+    headers = {}
+    if download:
+        headers["Content-Disposition"] = (
+            'attachment; filename="slow_queries.json"'
+        )
+    return JSONResponse(
+        {
+            "enabled": SLOW_QUERY_ENABLED,
+            "threshold_ms": slow_query_log.threshold * 1000,
+            "explain": slow_query_log.explain,
+            "items": slow_query_log.snapshot(),
+        },
+        headers=headers,
+    )
+
+
+@router.delete("/slow_queries")
+async def clear_slow_queries(request: Request):
+    _check_vpn_auth(request)
+
+    slow_query_log.clear()
+    return {"success": True}
+
+
+@router.get("/events")
+async def change_events(
+    request: Request, feed: ChangeFeed = Depends(get_change_feed)
+):
+    """Server-Sent Events: изменения users/links из LISTEN vpn_changes."""
+    _check_vpn_auth(request)
+    if not feed.running:
+        # на не-200 EventSource не переподключается
+        raise HTTPException(status_code=503, detail="Live updates disabled")
+
+    async def stream():
+        queue = feed.subscribe()
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), LIVE_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    # держим соединение живым через прокси
+                    yield ": ping\n\n"
+                    continue
+                if event is None:
+                    return
+                yield f"event: change\ndata: {json.dumps(event)}\n\n"
+        finally:
+            feed.unsubscribe(queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
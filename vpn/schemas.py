@@ -0,0 +1,18 @@
+from pydantic import BaseModel, Field
+
+MAX_BULK_ITEMS = 10_000
+
+
+class BulkDeleteUsersIn(BaseModel):
+    user_ids: list[int] = Field(min_length=1, max_length=MAX_BULK_ITEMS)
+
+
+class LinkAssignmentIn(BaseModel):
+    link_id: int
+    user_id: int | None = None
+
+
+class BulkReassignLinksIn(BaseModel):
+    items: list[LinkAssignmentIn] = Field(
+        min_length=1, max_length=MAX_BULK_ITEMS
+    )
@@ -1,16 +1,60 @@
 import os
+import time
+from typing import Literal
+
 import httpx
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
+
+from config import TELEGRAM_API_URL, TELEGRAM_TIMEOUT
+from metrics import TELEGRAM_LATENCY, TELEGRAM_REQUESTS
 
 BOT_TOKEN = os.getenv("TOKEN_BOT", "")
-TELEGRAM_API = "https://api.telegram.org/bot{token}/{method}"
+TELEGRAM_API = TELEGRAM_API_URL.rstrip("/") + "/bot{token}/{method}"
+
+SegmentKind = Literal["all", "active", "trial", "trial_ending", "expired"]
+
+
+class BroadcastSegment(BaseModel):
+    """Получатели, которых сервер выбирает сам по полям VPNUser.
+
+    all — все; active — подписка не истекла; trial — идёт пробный
+    период; trial_ending — пробный период кончается в ближайшие days
+    дней; expired — подписка истекла за последние days дней.
+    has_links дополнительно фильтрует по наличию ссылок.
+    """
+
+    kind: SegmentKind = "all"
+    days: int = Field(3, ge=0, le=3650)
+    has_links: bool | None = None
+
 
 class SendMessageIn(BaseModel):
-    user_ids: list[int]
+    user_ids: list[int] = []
+    segment: BroadcastSegment | None = None
     text: str
 
+    @model_validator(mode="after")
+    def check_recipients(self):
+        if not self.user_ids and self.segment is None:
+            raise ValueError("user_ids or segment required")
+        return self
+
+
+class TelegramError(RuntimeError):
+    def __init__(
+        self,
+        message: str,
+        status_code: int | None = None,
+        retry_after: float | None = None,
+    ):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
 
-async def tg_send_message(chat_id: int, text: str) -> None:
+
+async def tg_send_message(
+    chat_id: int, text: str, client: httpx.AsyncClient | None = None
+) -> None:
 
     if not BOT_TOKEN:
         raise RuntimeError("BOT_TOKEN не задан")
@@ -23,13 +67,39 @@ async def tg_send_message(chat_id: int, text: str) -> None:
         "disable_web_page_preview": True,
     }
 
-    async with httpx.AsyncClient(timeout=15) as client:
-        r = await client.post(url, json=payload)
+    start = time.perf_counter()
+    try:
+        if client is None:
+            async with httpx.AsyncClient(timeout=TELEGRAM_TIMEOUT) as client:
+                r = await client.post(url, json=payload)
+        else:
+            r = await client.post(url, json=payload)
+    except httpx.HTTPError:
+        TELEGRAM_REQUESTS.inc("sendMessage", "error")
+        raise
+    finally:
+        TELEGRAM_LATENCY.observe(
+            "sendMessage", value=time.perf_counter() - start
+        )
+    TELEGRAM_REQUESTS.inc("sendMessage", str(r.status_code))
+
+    if r.status_code == 429:
+        try:
+            retry_after = r.json().get("parameters", {}).get("retry_after")
+        except ValueError:
+            retry_after = None
+        raise TelegramError(
+            f"Telegram HTTP error 429: {r.text}",
+            status_code=429,
+            retry_after=retry_after,
+        )
 
     if r.status_code != 200:
-        raise RuntimeError(f"Telegram HTTP error {r.status_code}: {r.text}")
+        raise TelegramError(
+            f"Telegram HTTP error {r.status_code}: {r.text}",
+            status_code=r.status_code,
+        )
 
     data = r.json()
     if not data.get("ok"):
-        raise RuntimeError(f"Telegram API error: {data}")
-
+        raise TelegramError(f"Telegram API error: {data}", status_code=200)
@@ -0,0 +1,183 @@
+"""Ежедневные снимки агрегатов пользователей и ссылок в daily_stats.
+
+Снять снимок за сегодня: python -m vpn.snapshots [--force]
+
+Историю нельзя пересчитать из users и links задним числом (свободные
+ссылки и удалённые пользователи известны только на момент запроса),
+поэтому строка пишется за текущий день: пересчитывается, пока день не
+кончился, а затем остаётся как есть. Пропущенный день так и остаётся
+пропуском в графике.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import exists, func, select, true
+from sqlalchemy.dialects.postgresql import insert
+
+from config import SNAPSHOT_INTERVAL
+from database.db import dispose_engines
+from vpn.db_services import VPNDatabase
+from vpn.models import DailyStat, LinkModel, VPNUser
+from vpn.sweeper import expired_condition
+
+logger = logging.getLogger(__name__)
+
+STAT_COLUMNS = (
+    "total_users",
+    "active_subscriptions",
+    "trial_users",
+    "expired_users",
+    "total_links",
+    "free_links",
+)
+# снимок моложе этой доли интервала не пересчитывается: несколько
+# воркеров не сканируют таблицы каждый сам по себе
+FRESH_RATIO = 0.9
+
+
+def aggregates(today: date):
+    """Все агрегаты дня одним запросом: по проходу по users и links.
+
+    Условия те же, что в сводке /vpn/summary и в ExpirySweeper.
+    """
+    users = select(
+        func.count().label("total_users"),
+        func.count()
+        .filter(VPNUser.end_date >= today)
+        .label("active_subscriptions"),
+        func.count()
+        .filter(VPNUser.end_trial_period >= today)
+        .label("trial_users"),
+        func.count()
+        .filter(expired_condition(today, grace_days=0))
+        .label("expired_users"),
+    ).subquery("users_stats")
+    links = select(
+        func.count().label("total_links"),
+        func.count().filter(LinkModel.user_id.is_(None)).label("free_links"),
+    ).subquery("links_stats")
+    # оба подзапроса возвращают по одной строке
+    return select(users, links).select_from(users.join(links, true()))
+
+
+class DailySnapshots:
+    """Пишет строку daily_stats за сегодня раз в interval секунд.
+
+    Запись — upsert по дню, так что повторный запуск из фона, CLI или
+    другого воркера безопасен: он лишь обновляет сегодняшние цифры.
+    """
+
+    def __init__(self, db: VPNDatabase, interval: float = SNAPSHOT_INTERVAL):
+        self.db = db
+        self.interval = interval
+        self.snapshots = 0
+        self.last_run: dict = {}
+        self._task: asyncio.Task | None = None
+
+    async def _is_fresh(self, today: date) -> bool:
+        max_age = timedelta(seconds=self.interval * FRESH_RATIO)
+        stmt = select(
+            exists().where(
+                DailyStat.day == today,
+                DailyStat.computed_at > func.now() - max_age,
+            )
+        )
+        async for session in self.db.get_session():
+            return (await session.execute(stmt)).scalar_one()
+
+    async def run_once(self, force: bool = False) -> dict:
+        started = time.perf_counter()
+        today = date.today()
+        if not force and await self._is_fresh(today):
+            self.last_run = {"day": today, "skipped": True}
+            return self.last_run
+
+        # агрегаты читают обе таблицы целиком — с реплики, если она есть
+        async for session in self.db.get_read_session():
+            row = (await session.execute(aggregates(today))).one()
+        values = dict(row._mapping)
+
+        stmt = insert(DailyStat).values(day=today, **values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[DailyStat.day],
+            set_={
+                **{name: stmt.excluded[name] for name in STAT_COLUMNS},
+                "computed_at": func.now(),
+            },
+        )
+        async for session in self.db.get_session():
+            await session.execute(stmt)
+            await session.commit()
+
+        self.snapshots += 1
+        self.last_run = {
+            "day": today,
+            "skipped": False,
+            "seconds": round(time.perf_counter() - started, 3),
+            **values,
+        }
+        logger.info("daily snapshot %s: %s", today, values)
+        return self.last_run
+
+    async def get_range(self, start: date, end: date) -> list[dict]:
+        columns = [getattr(DailyStat, name) for name in STAT_COLUMNS]
+        stmt = (
+            select(DailyStat.day, *columns)
+            .where(DailyStat.day.between(start, end))
+            .order_by(DailyStat.day)
+        )
+        async for session in self.db.get_read_session():
+            rows = (await session.execute(stmt)).all()
+        names = ("day", *STAT_COLUMNS)
+        return [dict(zip(names, row)) for row in rows]
+
+    async def run_forever(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("daily snapshot failed")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run_forever())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "interval": self.interval,
+            "snapshots": self.snapshots,
+            "last_run": self.last_run,
+        }
+
+
+async def _main(force: bool) -> int:
+    try:
+        run = await DailySnapshots(VPNDatabase()).run_once(force=force)
+    finally:
+        await dispose_engines()
+    print(json.dumps(run, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="пересчитать, даже если сегодняшний снимок свежий",
+    )
+    sys.exit(asyncio.run(_main(parser.parse_args().force)))
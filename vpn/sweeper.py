@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from datetime import date, timedelta
+
+from sqlalchemy import exists, func, select, update
+
+from config import (
+    SWEEPER_BATCH_SIZE,
+    SWEEPER_DRY_RUN,
+    SWEEPER_GRACE_DAYS,
+    SWEEPER_INTERVAL,
+)
+from vpn.cache import invalidate_vpn_caches
+from vpn.db_services import VPNDatabase
+from vpn.models import LinkModel, VPNUser
+
+logger = logging.getLogger(__name__)
+
+MAX_RUNS_KEPT = 20
+
+
+@dataclass
+class SweepRun:
+    started_at: float
+    dry_run: bool
+    reclaimed: int = 0
+    batches: int = 0
+    finished_at: float | None = None
+    error: str | None = None
+
+
+def expired_condition(today: date, grace_days: int = SWEEPER_GRACE_DAYS):
+    # GREATEST пропускает NULL; пользователь без обеих дат не истёк.
+    # Выражение совпадает с индексом ix_users_expires_at.
+    expires_at = func.greatest(VPNUser.end_date, VPNUser.end_trial_period)
+    return expires_at < today - timedelta(days=grace_days)
+
+
+class ExpirySweeper:
+    """Возвращает в свободный пул ссылки пользователей с истёкшим сроком.
+
+    Ссылки освобождаются пачками по batch_size, каждая пачка — отдельная
+    короткая транзакция с SKIP LOCKED, чтобы не мешать раздаче ссылок.
+    Обход идёт от занятых ссылок по user_id (ix_links_user_id), и каждая
+    пачка продолжает с места предыдущей: цена прогона зависит от числа
+    занятых ссылок, а не от всех когда-либо истёкших пользователей.
+    В режиме dry_run только считает, сколько ссылок было бы освобождено.
+    """
+
+    def __init__(
+        self,
+        db: VPNDatabase,
+        interval: float = SWEEPER_INTERVAL,
+        batch_size: int = SWEEPER_BATCH_SIZE,
+        dry_run: bool = SWEEPER_DRY_RUN,
+    ):
+        self.db = db
+        self.interval = interval
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.runs: deque[SweepRun] = deque(maxlen=MAX_RUNS_KEPT)
+        self.total_reclaimed = 0
+        self._task: asyncio.Task | None = None
+
+    async def run_once(self, dry_run: bool | None = None) -> SweepRun:
+        dry_run = self.dry_run if dry_run is None else dry_run
+        run = SweepRun(started_at=time.time(), dry_run=dry_run)
+        self.runs.append(run)
+        condition = expired_condition(date.today())
+
+        try:
+            if dry_run:
+                run.reclaimed = await self._count_expired_links(condition)
+            else:
+                await self._reclaim(run, condition)
+        except Exception as e:
+            run.error = str(e)
+            raise
+        finally:
+            run.finished_at = time.time()
+            logger.info(
+                "expiry sweep: reclaimed=%s batches=%s dry_run=%s",
+                run.reclaimed,
+                run.batches,
+                dry_run,
+            )
+
+        return run
+
+    @staticmethod
+    def _owner_expired(condition, *bounds):
+        return exists().where(
+            VPNUser.user_id == LinkModel.user_id, condition, *bounds
+        )
+
+    async def _count_expired_links(self, condition) -> int:
+        stmt = select(func.count(LinkModel.id)).where(
+            LinkModel.user_id.is_not(None), self._owner_expired(condition)
+        )
+        async for session in self.db.get_session():
+            return (await session.execute(stmt)).scalar_one()
+
+    async def _reclaim(self, run: SweepRun, condition) -> None:
+        last_user_id = None
+        while True:
+            links_after = [LinkModel.user_id.is_not(None)]
+            users_after = []
+            if last_user_id is not None:
+                # >=: пачка могла оборваться посреди ссылок одного
+                # пользователя; освобождённые уже не попадут в выборку.
+                # Граница и для users, иначе merge join читает их с начала
+                links_after.append(LinkModel.user_id >= last_user_id)
+                users_after.append(VPNUser.user_id >= last_user_id)
+            expired_links = (
+                select(LinkModel.id, LinkModel.user_id)
+                .where(
+                    *links_after,
+                    self._owner_expired(condition, *users_after),
+                )
+                .order_by(LinkModel.user_id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+                .cte("expired_links")
+            )
+            stmt = (
+                update(LinkModel)
+                .where(LinkModel.id == expired_links.c.id)
+                .values(user_id=None)
+                .returning(expired_links.c.user_id)
+                .execution_options(synchronize_session=False)
+            )
+            async for session in self.db.get_session():
+                owners = (await session.execute(stmt)).scalars().all()
+                await session.commit()
+
+            reclaimed = len(owners)
+            if reclaimed:
+                run.reclaimed += reclaimed
+                run.batches += 1
+                self.total_reclaimed += reclaimed
+                invalidate_vpn_caches()
+
+            if reclaimed < self.batch_size:
+                return
+            last_user_id = max(owners)
+            # даём отработать запросам, ждущим соединение
+            await asyncio.sleep(0)
+
+    async def run_forever(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("expiry sweep failed")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run_forever())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "interval": self.interval,
+            "batch_size": self.batch_size,
+            "dry_run": self.dry_run,
+            "total_reclaimed": self.total_reclaimed,
+            "runs": [asdict(run) for run in reversed(self.runs)],
+        }
@@ -0,0 +1,361 @@
+import asyncio
+import logging
+import sys
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Iterable
+
+from sqlalchemy import BigInteger, any_, bindparam, select
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from config import (
+    TYPEAHEAD_QUEUE_SIZE,
+    TYPEAHEAD_REFRESH_INTERVAL,
+    TYPEAHEAD_SCAN_LIMIT,
+)
+from vpn.db_services import VPNDatabase
+from vpn.live import RESYNC, ChangeFeed
+from vpn.models import VPNUser
+
+logger = logging.getLogger(__name__)
+
+GRAM = 3
+LOAD_CHUNK = 10_000
+MAX_ID_DIGITS = 19
+# доля удалённых слотов, после которой индекс собирается заново
+DEAD_RATIO = 0.2
+
+
+def trigrams(key: str) -> set[str]:
+    return {key[i : i + GRAM] for i in range(len(key) - GRAM + 1)}
+
+
+class _IndexData:
+    """Структуры индекса пользователей.
+
+    Слот — номер строки в порядке добавления; по слоту лежат user_id и
+    имя. Имя хранится один раз, нижний регистр считается на лету.
+    Поверх слотов:
+    - ids/id_slots — отсортированные user_id для поиска по префиксу;
+    - name_slots — слоты, отсортированные по имени, для префикса имени;
+    - grams — триграмма -> слоты, для поиска подстроки в имени.
+    Удалённый слот остаётся в grams с именем None: поиск его
+    пропускает, а пересборка выбрасывает.
+    """
+
+    def __init__(self):
+        self.slot_ids = array("q")
+        self.slot_names: list[str | None] = []
+        self.ids = array("q")
+        self.id_slots = array("i")
+        self.name_slots = array("i")
+        self.grams: dict[str, array] = {}
+        self.dead = 0
+
+    @classmethod
+    def build(cls, rows: Iterable[tuple[int, str | None]]) -> "_IndexData":
+        # rows отсортированы по user_id, поэтому ids строятся без сортировки
+        data = cls()
+        named = []
+        for user_id, name in rows:
+            slot = data._new_slot(user_id, name)
+            data.ids.append(user_id)
+            data.id_slots.append(slot)
+            if name:
+                key = name.lower()
+                named.append((key, slot))
+                data._add_grams(key, slot)
+        named.sort()
+        data.name_slots = array("i", (slot for _, slot in named))
+        return data
+
+    def _new_slot(self, user_id: int, name: str | None) -> int:
+        self.slot_ids.append(user_id)
+        self.slot_names.append(name or None)
+        return len(self.slot_ids) - 1
+
+    def _name_key(self, slot: int) -> str:
+        return self.slot_names[slot].lower()
+
+    def _add_grams(self, key: str, slot: int) -> None:
+        for gram in trigrams(key):
+            postings = self.grams.get(gram)
+            if postings is None:
+                postings = self.grams[gram] = array("i")
+            postings.append(slot)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, user_id: int, name: str | None) -> None:
+        self.remove(user_id)
+        slot = self._new_slot(user_id, name)
+        pos = bisect_left(self.ids, user_id)
+        self.ids.insert(pos, user_id)
+        self.id_slots.insert(pos, slot)
+        if name:
+            key = name.lower()
+            pos = bisect_right(self.name_slots, key, key=self._name_key)
+            self.name_slots.insert(pos, slot)
+            self._add_grams(key, slot)
+
+    def remove(self, user_id: int) -> None:
+        pos = bisect_left(self.ids, user_id)
+        if pos == len(self.ids) or self.ids[pos] != user_id:
+            return
+        slot = self.id_slots[pos]
+        del self.ids[pos]
+        del self.id_slots[pos]
+
+        if self.slot_names[slot] is not None:
+            key = self._name_key(slot)
+            lo = bisect_left(self.name_slots, key, key=self._name_key)
+            hi = bisect_right(self.name_slots, key, lo, key=self._name_key)
+            for i in range(lo, hi):
+                if self.name_slots[i] == slot:
+                    del self.name_slots[i]
+                    break
+            self.slot_names[slot] = None
+        self.dead += 1
+
+    def _id_prefix(self, digits: str, limit: int) -> Iterable[int]:
+        # префикс "12" — это диапазоны [12, 13), [120, 130), [1200, 1300)…
+        if digits.startswith("0") or not self.ids:
+            return
+        prefix = int(digits)
+        for scale in range(MAX_ID_DIGITS - len(digits) + 1):
+            lo = prefix * 10**scale
+            if lo > self.ids[-1]:
+                return
+            hi = (prefix + 1) * 10**scale
+            start = bisect_left(self.ids, lo)
+            end = bisect_left(self.ids, hi, start)
+            for i in range(start, min(end, start + limit)):
+                yield self.id_slots[i]
+
+    def _name_prefix(self, key: str) -> Iterable[int]:
+        i = bisect_left(self.name_slots, key, key=self._name_key)
+        while i < len(self.name_slots):
+            slot = self.name_slots[i]
+            if not self._name_key(slot).startswith(key):
+                return
+            yield slot
+            i += 1
+
+    def _name_substring(self, key: str, scan_limit: int) -> Iterable[int]:
+        if len(key) < GRAM:
+            return
+        postings = []
+        for gram in trigrams(key):
+            slots = self.grams.get(gram)
+            if slots is None:
+                return
+            postings.append(slots)
+        # проверяем кандидатов из самого короткого списка
+        for slot in min(postings, key=len)[:scan_limit]:
+            name = self.slot_names[slot]
+            if name is not None and key in name.lower():
+                yield slot
+
+    def search(self, query: str, limit: int, scan_limit: int) -> list[dict]:
+        """Точное и префиксное совпадение user_id, затем префикс имени,
+        затем подстрока в имени."""
+        key = query.strip().lower()
+        if not key:
+            return []
+        sources = [
+            self._name_prefix(key),
+            self._name_substring(key, scan_limit),
+        ]
+        if key.isdigit():
+            sources.insert(0, self._id_prefix(key, limit))
+
+        found: dict[int, None] = {}
+        for source in sources:
+            for slot in source:
+                found[slot] = None
+                if len(found) >= limit:
+                    break
+            if len(found) >= limit:
+                break
+        return [
+            {"user_id": self.slot_ids[slot], "username": self.slot_names[slot]}
+            for slot in found
+        ]
+
+    def memory(self) -> dict:
+        arrays = (self.slot_ids, self.ids, self.id_slots, self.name_slots)
+        return {
+            "arrays": sum(sys.getsizeof(a) for a in arrays),
+            "names": sys.getsizeof(self.slot_names)
+            + sum(sys.getsizeof(s) for s in self.slot_names if s),
+            "grams": sys.getsizeof(self.grams)
+            + sum(sys.getsizeof(g) for g in self.grams)
+            + sum(sys.getsizeof(p) for p in self.grams.values()),
+        }
+
+
+class UserTypeahead:
+    """Индекс (user_id, user_name) в памяти процесса для подсказок.
+
+    Собирается в фоне после старта; пока первая сборка не закончилась,
+    ready не выставлен. Изменения приходят из ChangeFeed: имена
+    созданных и изменённых пользователей дочитываются из основной базы
+    пачкой, удалённые убираются сразу. Массовое изменение или resync
+    пересобирают индекс целиком. Без LISTEN индекс пересобирается раз в
+    refresh_interval секунд.
+    """
+
+    def __init__(
+        self,
+        db: VPNDatabase,
+        feed: ChangeFeed,
+        refresh_interval: float = TYPEAHEAD_REFRESH_INTERVAL,
+        scan_limit: int = TYPEAHEAD_SCAN_LIMIT,
+    ):
+        self.db = db
+        self.feed = feed
+        self.refresh_interval = refresh_interval
+        self.scan_limit = scan_limit
+        self.ready = asyncio.Event()
+        self.rebuilds = 0
+        self.updates = 0
+        self.last_rebuild: dict = {}
+        self._data = _IndexData()
+        self._task: asyncio.Task | None = None
+
+    def search(self, query: str, limit: int) -> list[dict]:
+        return self._data.search(query, limit, self.scan_limit)
+
+    async def _load_rows(self) -> list[tuple[int, str | None]]:
+        stmt = (
+            select(VPNUser.user_id, VPNUser.user_name)
+            .order_by(VPNUser.user_id)
+            .execution_options(yield_per=LOAD_CHUNK)
+        )
+        rows = []
+        # из основной базы, как и обновления: снимок с отстающей реплики
+        # мог бы потерять уже применённые события
+        async for session in self.db.get_session():
+            result = await session.stream(stmt)
+            async for chunk in result.partitions():
+                rows.extend(tuple(r) for r in chunk)
+        return rows
+
+    async def rebuild(self) -> None:
+        started = time.perf_counter()
+        rows = await self._load_rows()
+        loaded = time.perf_counter()
+
+        def build():
+            data = _IndexData.build(rows)
+            return data, data.memory()
+
+        # сборка занимает CPU на секунды: в потоке цикл событий не встаёт
+        data, memory = await asyncio.to_thread(build)
+        self._data = data
+        self.rebuilds += 1
+        self.last_rebuild = {
+            "finished_at": time.time(),
+            "users": len(data),
+            "load_seconds": round(loaded - started, 3),
+            "build_seconds": round(time.perf_counter() - loaded, 3),
+            "memory_bytes": memory,
+            "memory_total_bytes": sum(memory.values()),
+        }
+        self.ready.set()
+        logger.info(
+            "typeahead index rebuilt: users=%s in %.2fs",
+            len(data),
+            time.perf_counter() - started,
+        )
+
+    async def _apply(self, events: list[dict]) -> None:
+        changed: set[int] = set()
+        for event in events:
+            kind = event.get("type", "")
+            if kind in ("users_changed", RESYNC["type"]):
+                await self.rebuild()
+                return
+            if kind == "user_deleted":
+                changed.discard(event["user_id"])
+                self._data.remove(event["user_id"])
+            elif kind in ("user_created", "user_updated"):
+                changed.add(event["user_id"])
+        if not changed:
+            return
+
+        # реплика может ещё не видеть изменение
+        stmt = select(VPNUser.user_id, VPNUser.user_name).where(
+            VPNUser.user_id
+            == any_(bindparam("ids", list(changed), type_=ARRAY(BigInteger)))
+        )
+        async for session in self.db.get_session():
+            rows = (await session.execute(stmt)).all()
+        names = {user_id: name for user_id, name in rows}
+        for user_id in changed:
+            if user_id in names:
+                self._data.add(user_id, names[user_id])
+            else:
+                self._data.remove(user_id)
+        self.updates += len(changed)
+
+    async def run_forever(self) -> None:
+        queue = self.feed.subscribe(TYPEAHEAD_QUEUE_SIZE)
+        try:
+            await self._rebuild_safely()
+            while True:
+                try:
+                    event = await asyncio.wait_for(
+                        queue.get(), self.refresh_interval
+                    )
+                except asyncio.TimeoutError:
+                    if not self.feed.running or not self.ready.is_set():
+                        await self._rebuild_safely()
+                    continue
+                if event is None:
+                    return
+                events = [event]
+                while not queue.empty():
+                    events.append(queue.get_nowait())
+                try:
+                    await self._apply([e for e in events if e is not None])
+                    data = self._data
+                    if data.dead > DEAD_RATIO * max(len(data), 1):
+                        await self.rebuild()
+                except Exception:
+                    logger.exception("typeahead update failed")
+                    await self._rebuild_safely()
+        finally:
+            self.feed.unsubscribe(queue)
+
+    async def _rebuild_safely(self) -> None:
+        try:
+            await self.rebuild()
+        except Exception:
+            logger.exception("typeahead rebuild failed")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run_forever())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        data = self._data
+        return {
+            "running": self._task is not None,
+            "ready": self.ready.is_set(),
+            "users": len(data),
+            "named_users": len(data.name_slots),
+            "dead_slots": data.dead,
+            "trigrams": len(data.grams),
+            "rebuilds": self.rebuilds,
+            "updates": self.updates,
+            "last_rebuild": self.last_rebuild,
+        }